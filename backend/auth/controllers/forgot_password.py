@@ -6,7 +6,8 @@ from fastapi import APIRouter, Cookie, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 
 from database.db_connection import db_conn
-from backend.services.mailer import send_recovery_email
+from backend.auth.utils.entity_cache import ENTITY_CACHE
+from backend.services.mail_outbox import enqueue_email
 from backend.auth.utils.auth_validators import AuthValidator
 
 # Конфигурация
@@ -53,9 +54,9 @@ def create_forgot_password_router(auth_router: APIRouter, templates):
         
         # Выбираем из нужной таблицы поле email и имя колонки
         if role == "business":
-            table, phone_col, email_col = "role.businesses", "business_phone", "business_email"
+            table, phone_col, email_col, id_col = "role.businesses", "business_phone", "business_email", "business_id"
         else:
-            table, phone_col, email_col = "role.users", "user_phone", "user_email"
+            table, phone_col, email_col, id_col = "role.users", "user_phone", "user_email", "user_id"
 
         # Проверяем таблицу
         row = await db_conn.execute_query(f"""
@@ -69,9 +70,13 @@ def create_forgot_password_router(auth_router: APIRouter, templates):
 
         # Если email в БД отсутствует - сохраняем новый, если есть, но не совпадает - ошибка
         if db_email is None:
-            await db_conn.execute_query(f"""
-                UPDATE {table} SET {email_col} = $1 WHERE {phone_col} = $2;
+            updated = await db_conn.execute_query(f"""
+                UPDATE {table} SET {email_col} = $1 WHERE {phone_col} = $2
+                RETURNING {id_col} AS account_id;
             """, params=(email, phone))
+            ENTITY_CACHE.invalidate_phone(phone)
+            for account in updated or []:
+                ENTITY_CACHE.invalidate_account(account["account_id"])
         elif db_email.lower() != email.lower():
             request.session["error"] = "Email не совпадает с данными в системе"
             return RedirectResponse(url="/forgot-password", status_code=303)
@@ -94,7 +99,7 @@ def create_forgot_password_router(auth_router: APIRouter, templates):
             VALUES ($1, $2, $3);
         """, params=(phone, token_hash, expires))
 
-        # Формируем ссылку и отправляем письмо
+        # Формируем ссылку и ставим письмо в очередь (отправка — фоновым MailOutboxSender)
         reset_link = f"https://mxr.kz/new-password?token={token}"
         subject = "Восстановление пароля"
         text = (
@@ -112,7 +117,7 @@ def create_forgot_password_router(auth_router: APIRouter, templates):
                 </body>
             </html>
         """
-        send_recovery_email(email, reset_link, subject, text, html)
+        await enqueue_email(email, subject, text, html, kind="recovery")
 
         # Маскируем email и показываем успех
         at = email.find("@")
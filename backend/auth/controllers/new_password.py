@@ -7,6 +7,7 @@ from fastapi.responses import HTMLResponse
 from fastapi import APIRouter, Cookie, Request, Form
 
 from database.db_connection import db_conn
+from backend.auth.utils.entity_cache import ENTITY_CACHE
 
 # Инициализируем контекст для хэширования паролей с использованием bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -55,9 +56,9 @@ def new_password(auth_router: APIRouter, templates):
         
         # Выбираем из нужной таблицы поле email и имя колонки
         if role == "business":
-            table, phone_col, password_col = "role.businesses", "business_phone", "business_password"
+            table, phone_col, password_col, id_col = "role.businesses", "business_phone", "business_password", "business_id"
         else:
-            table, phone_col, password_col = "role.users", "user_phone", "user_password"
+            table, phone_col, password_col, id_col = "role.users", "user_phone", "user_password", "user_id"
 
         # Повторная валидация токена
         token_hash = hashlib.sha256(token.encode()).hexdigest()
@@ -72,9 +73,14 @@ def new_password(auth_router: APIRouter, templates):
 
         # Обновляем пароль
         hashed = pwd_context.hash(password)
-        await db_conn.execute_query(f"""
-            UPDATE {table} SET {password_col} = $1 WHERE {phone_col} = $2;
+        updated = await db_conn.execute_query(f"""
+            UPDATE {table} SET {password_col} = $1 WHERE {phone_col} = $2
+            RETURNING {id_col} AS account_id;
         """, params=(hashed, phone))
+        # Сессии этих аккаунтов не должны отдавать из кэша entity со старым хешем
+        ENTITY_CACHE.invalidate_phone(phone)
+        for account in updated or []:
+            ENTITY_CACHE.invalidate_account(account["account_id"])
 
         # Удаляем все токены для этого телефона
         await db_conn.execute_query("""
@@ -0,0 +1,140 @@
+# entity_cache.py
+
+import os
+import copy
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_TTL = float(os.getenv("AUTH_ENTITY_CACHE_TTL", "30"))
+ENTITY_CACHE_SIZE = int(os.getenv("AUTH_ENTITY_CACHE_SIZE", "10000"))
+
+Key = Tuple[str, str, str]
+Tag = Tuple[str, str]
+
+
+class EntityCache:
+    """TTL + LRU кэш результата get_current_entity по ключу (jti, role, user_id).
+
+    Каждая запись помечена тегами ("jti", ...), ("account", ...), ("phone", ...);
+    invalidate_* удаляет все записи с тегом. Кэш живёт в процессе: между
+    воркерами изменения расходятся не позже чем через TTL.
+
+    Работает в одном event loop без блокировок. Загрузка, начатая до
+    инвалидации, свой результат не сохраняет (см. begin/put).
+    """
+
+    def __init__(self, ttl: float = ENTITY_CACHE_TTL, maxsize: int = ENTITY_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Key, tuple]" = OrderedDict()
+        self._by_tag: Dict[Tag, Set[Key]] = {}
+        self._epoch = 0
+        self.hits = self.misses = self.invalidations = self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key: Key) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, entity, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        # Обработчики могут менять entity — отдаём копию
+        return copy.deepcopy(entity)
+
+    def begin(self) -> int:
+        """Метка перед загрузкой из БД; put с устаревшей меткой ничего не сохранит"""
+        return self._epoch
+
+    def put(self, key: Key, entity: dict, tags: Iterable[Tag], epoch: int):
+        if not self.enabled or epoch != self._epoch:
+            return
+        if key in self._entries:
+            self._drop(key)
+        tags = frozenset(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(entity), tags)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: Key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, tag: Tag) -> int:
+        self._epoch += 1
+        keys = self._by_tag.pop(tag, ())
+        for key in list(keys):
+            self._drop(key)
+        if keys:
+            self.invalidations += len(keys)
+            logger.debug("entity cache: %s=%s invalidated %d entries", tag[0], tag[1], len(keys))
+        return len(keys)
+
+    def invalidate_jti(self, jti) -> int:
+        """Сессия: отзыв/ротация refresh-токена"""
+        return self.invalidate(("jti", str(jti)))
+
+    def invalidate_account(self, account_id) -> int:
+        """Аккаунт user/business: правка профиля, привязка/отвязка аккаунтов"""
+        return self.invalidate(("account", str(account_id)))
+
+    def invalidate_phone(self, phone) -> int:
+        """Правки строки role.users / role.businesses по телефону (пароль, email)"""
+        return self.invalidate(("phone", str(phone)))
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+        self._by_tag.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+def entity_tags(jti, entity: dict, phone=None) -> Set[Tag]:
+    """Теги записи: сессия, все аккаунты из entity и телефон"""
+    tags = {("jti", str(jti))}
+    for name in ("user_id", "business_id"):
+        if entity.get(name) is not None:
+            tags.add(("account", str(entity[name])))
+    for account in entity.get("personal_accounts", []):
+        tags.add(("account", str(account["user_id"])))
+    for account in entity.get("business_accounts", []):
+        tags.add(("account", str(account["business_id"])))
+    for name in ("user_phone", "business_phone"):
+        if entity.get(name):
+            tags.add(("phone", str(entity[name])))
+    if phone:
+        tags.add(("phone", str(phone)))
+    return tags
+
+
+ENTITY_CACHE = EntityCache()
@@ -0,0 +1,98 @@
+# revocation_filter.py
+
+import os
+import math
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+REVOKED_JTI_TTL = float(os.getenv("AUTH_REVOKED_JTI_TTL", "3600"))
+REVOKED_JTI_CAPACITY = int(os.getenv("AUTH_REVOKED_JTI_CAPACITY", "100000"))
+BLOOM_ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    """Битовый Bloom-фильтр: k позиций из одного blake2b-дайджеста (двойное хеширование)"""
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        self.capacity = max(1, capacity)
+        self.m = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / self.capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevokedJtiFilter:
+    """Отозванные в этом процессе refresh-jti: отсекает повторы без похода в БД.
+
+    Bloom-фильтр — быстрый отрицательный ответ для обычного (неотозванного)
+    токена; точное подтверждение — по множеству с TTL. Отказ без БД только
+    при точном совпадении; всё остальное проверяет БД, она остаётся источником
+    истины (в том числе для отзывов из других воркеров).
+    Два поколения Bloom-фильтра: при заполнении текущее становится предыдущим.
+    """
+
+    def __init__(self, ttl: float = REVOKED_JTI_TTL, capacity: int = REVOKED_JTI_CAPACITY):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._bloom = BloomFilter(capacity)
+        self._previous: Optional[BloomFilter] = None
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+        self.rejected = 0
+
+    def add(self, jti, expires_at: Optional[float] = None):
+        """expires_at — unix-время истечения самого токена: дольше помнить незачем"""
+        jti = str(jti)
+        now = time.time()
+        deadline = now + self.ttl if expires_at is None else min(float(expires_at), now + self.ttl)
+        if deadline <= now:
+            return
+        if self._bloom.count >= self.capacity:
+            self._previous, self._bloom = self._bloom, BloomFilter(self.capacity)
+        self._bloom.add(jti)
+        self._expires.pop(jti, None)
+        self._expires[jti] = deadline
+        self._expire(now)
+
+    def _expire(self, now: float):
+        # Записи добавляются почти по порядку сроков — чистим с головы
+        while self._expires:
+            jti, deadline = next(iter(self._expires.items()))
+            if deadline > now and len(self._expires) <= self.capacity:
+                break
+            del self._expires[jti]
+
+    def is_revoked(self, jti) -> bool:
+        jti = str(jti)
+        if jti not in self._bloom and (self._previous is None or jti not in self._previous):
+            return False
+        deadline = self._expires.get(jti)
+        if deadline is None or deadline <= time.time():
+            return False
+        self.rejected += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._expires),
+            "bloom_fill": self._bloom.count,
+            "rejected": self.rejected,
+        }
+
+
+REVOKED_JTIS = RevokedJtiFilter()
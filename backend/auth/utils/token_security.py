@@ -5,6 +5,8 @@ from uuid import UUID
 from datetime import datetime, timedelta, timezone
 
 from database.db_connection import db_conn
+from backend.auth.utils.entity_cache import ENTITY_CACHE
+from backend.auth.utils.revocation_filter import REVOKED_JTIS
 
 # Настройка конфигурации
 ALGORITHM = os.getenv("ALGORITHM")
@@ -93,6 +95,7 @@ async def store_refresh_token(token_data: dict):
 
 async def revoke_refresh_token(jti: str):
     """Отмечаем refresh‑token как отозванный в БД"""
+    REVOKED_JTIS.add(jti)
     try:
         await db_conn.execute_query("""
             UPDATE auth.refresh_tokens SET revoked = TRUE WHERE jti = $1;
@@ -100,43 +103,79 @@ async def revoke_refresh_token(jti: str):
     except Exception as e:
         logging.error(f"Ошибка при отзыве refresh token с jti {jti}: {e}")
         raise
+    finally:
+        ENTITY_CACHE.invalidate_jti(jti)
+
+
+# Живой токен и существующая сущность его роли — одним запросом
+ACTIVE_REFRESH_TOKEN = """
+    t.jti = $1 AND t.revoked = FALSE AND t.expires_at > NOW()
+    AND CASE t.role
+        WHEN 'user' THEN EXISTS (SELECT 1 FROM role.users WHERE user_id = t.user_id)
+        WHEN 'business' THEN EXISTS (SELECT 1 FROM role.businesses WHERE business_id = t.user_id)
+        ELSE FALSE
+    END
+"""
 
 
 # Проверяем, что refresh‑token существует в БД и валиден.
 async def verify_refresh_token_db(jti: str):
+    if REVOKED_JTIS.is_revoked(jti):
+        return None
     try:
-        db_result = await db_conn.execute_query("""
-            SELECT * FROM auth.refresh_tokens 
-            WHERE jti = $1 AND revoked = FALSE AND expires_at > NOW();
+        db_result = await db_conn.execute_query(f"""
+            SELECT t.* FROM auth.refresh_tokens t
+            WHERE {ACTIVE_REFRESH_TOKEN};
         """, params=(jti,))
     except Exception as e:
         logging.error(f"Ошибка при проверке refresh token с jti {jti}: {e}")
         return None
-    
+
     if not db_result:
+        logging.warning(f"Refresh token {jti} не найден, отозван, истёк или ссылается на несуществующую сущность")
         return None
-    
-    token_record = db_result[0]
-    role = token_record.get("role", "").lower()
-    user_id = token_record.get("user_id")
-
-    # Проверка существования сущности по роли
-    exists = None
-    if role == "user":
-        exists = await db_conn.execute_query("""
-            SELECT 1 FROM role.users 
-            WHERE user_id = $1;
-        """, params=(user_id,))
-    elif role == "business":
-        exists = await db_conn.execute_query("""
-            SELECT 1 FROM role.businesses 
-            WHERE business_id = $1;
-        """, params=(user_id,))
-    else:
-        logging.warning(f"Неизвестная роль в refresh token: {role}")
-
-    if not exists:
-        logging.warning(f"Refresh token {jti} с role={role} и user_id={user_id} ссылается на несуществующую сущность")
+    return db_result[0]
+
+
+async def rotate_refresh_token(old_jti: str, new_payload: dict, old_expires_at: float = None):
+    """Проверка и ротация refresh‑token за один запрос (одна неявная транзакция):
+    отзыв старого, вставка нового и копирование связей auth.user_accounts.
+
+    Старый токен гасится условным UPDATE ... WHERE revoked = FALSE, поэтому из
+    двух одновременных рефрешей с одним токеном проходит ровно один.
+    Возвращает запись старого токена или None, если он недействителен.
+    """
+    if REVOKED_JTIS.is_revoked(old_jti):
         return None
 
-    return token_record
\ No newline at end of file
+    role = new_payload["active_role"]
+    user_id = new_payload["accounts"][role]
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    try:
+        rows = await db_conn.execute_query(f"""
+            WITH old AS (
+                UPDATE auth.refresh_tokens t SET revoked = TRUE
+                WHERE {ACTIVE_REFRESH_TOKEN}
+                RETURNING t.jti, t.user_id, t.role
+            ), new_token AS (
+                INSERT INTO auth.refresh_tokens (jti, user_id, role, expires_at)
+                SELECT $2, $3, $4, $5 FROM old
+                RETURNING jti
+            ), links AS (
+                INSERT INTO auth.user_accounts (main_user_id, account_type, account_id, session_jti)
+                SELECT ua.main_user_id, ua.account_type, ua.account_id, n.jti
+                FROM auth.user_accounts ua CROSS JOIN new_token n
+                WHERE ua.session_jti = $1
+                ON CONFLICT (main_user_id, account_type, account_id, session_jti) DO NOTHING
+            )
+            SELECT jti, user_id, role FROM old;
+        """, params=(old_jti, new_payload["jti"], user_id, role, expires_at))
+    except Exception as e:
+        logging.error(f"Ошибка при ротации refresh token с jti {old_jti}: {e}")
+        raise
+
+    if not rows:
+        return None
+    REVOKED_JTIS.add(old_jti, old_expires_at)
+    ENTITY_CACHE.invalidate_jti(old_jti)
+    return rows[0]
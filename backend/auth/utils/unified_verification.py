@@ -10,10 +10,10 @@ from jwt import PyJWTError, ExpiredSignatureError
 from fastapi import Cookie, HTTPException, Response, status
 
 from database.db_connection import db_conn
-from src.modules.auth.auth_mixai.utils.cookie_utils import set_cookies
-from src.modules.auth.auth_mixai.utils.token_security import (
-    verify_refresh_token_db, revoke_refresh_token,
-    create_access_token, create_refresh_token, store_refresh_token,
+from backend.auth.utils.cookie_utils import set_cookies
+from backend.auth.utils.entity_cache import ENTITY_CACHE, entity_tags
+from backend.auth.utils.token_security import (
+    rotate_refresh_token, create_access_token, create_refresh_token,
 )
 
 ALGORITHM = os.getenv("ALGORITHM")
@@ -36,12 +36,7 @@ async def _do_refresh(response: Response, refresh_token: str) -> Dict:
     if None in (old_jti, phone, mxr, role, user_id):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-    # Проверяем, что refresh есть и ещё не отозван
-    token_record = await verify_refresh_token_db(old_jti)
-    if not token_record:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-    
-    # Генерируем новый JTI и payload
+    # Новый JTI и payload
     new_jti = str(uuid4())
     new_payload = {
         "phone": phone,
@@ -51,29 +46,16 @@ async def _do_refresh(response: Response, refresh_token: str) -> Dict:
         "accounts": old["accounts"]
     }
 
-    # Создаём и сохраняем новые токены
+    # Проверка старого refresh, его отзыв, сохранение нового и копирование
+    # связей user_accounts old_jti → new_jti — один запрос к БД
+    if not await rotate_refresh_token(old_jti, new_payload, old.get("exp")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
     new_access = create_access_token(new_payload)
     new_refresh = create_refresh_token(new_payload)
-    await store_refresh_token(new_payload)
-
-    # скопировать все связи user_accounts с old_jti → new_jti
-    await db_conn.execute_query("""
-        INSERT INTO auth.user_accounts (
-            main_user_id, account_type, account_id, session_jti)
-        SELECT main_user_id, account_type, account_id, $1
-        FROM auth.user_accounts
-        WHERE session_jti = $2
-        ON CONFLICT (main_user_id, account_type, account_id, session_jti) DO NOTHING;
-    """, params=(new_jti, old_jti))
 
     # Ставим новые куки в ответ
     await set_cookies(response, {"access_token": new_access, "refresh_token": new_refresh, "role": role})
-    
-    # Отзываем старый токен
-    try:
-        await revoke_refresh_token(old_jti)
-    except Exception as e:
-        logging.warning(f"Не удалось отозвать старый токен {old_jti}: {e}")
 
     return jwt.decode(new_access, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -120,6 +102,21 @@ async def get_current_entity(
     table = config[role]["table"]
     id_col = config[role]["id_col"]
 
+    # main_user_id - тот, кто вошёл в систему
+    main_user_id = accounts.get("main_user")
+    if main_user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+    current_jti = payload["jti"]
+
+    # Entity меняется только при входе, рефреше, смене роли и правке профиля —
+    # тёплые запросы обходятся без БД
+    cache_key = (str(current_jti), role, str(user_id))
+    cached = ENTITY_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    epoch = ENTITY_CACHE.begin()
+
     try:
         rows = await db_conn.execute_query(f"""
             SELECT * FROM {table} WHERE {id_col} = $1;
@@ -132,13 +129,6 @@ async def get_current_entity(
     if not rows or str(rows[0].get(id_col)) != user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-    # main_user_id - тот, кто вошёл в систему
-    main_user_id = accounts.get("main_user")
-    if main_user_id is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-
-    current_jti = payload["jti"]
-
     # Достаём ВСЕ личные аккаунты, привязанные к main_user_id
     rows_user = await db_conn.execute_query("""
         SELECT u.user_id, u.user_name AS username, u.user_profile_avatar_image AS avatar_url, m.mxr
@@ -184,7 +174,8 @@ async def get_current_entity(
     entity["personal_accounts"] = personal_accounts
     entity["business_accounts"] = business_accounts
     # logging.info(f"[ПРОВЕРКА] {role}: {json.dumps(entity, ensure_ascii=False, default=str)}")
-    
+
+    ENTITY_CACHE.put(cache_key, entity, entity_tags(current_jti, entity, phone), epoch)
     return entity
 
 async def get_optional_entity(
@@ -1,17 +1,49 @@
 # backend/main.py
 
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
 from backend.init_router import router
+from backend.routers.niches import NICHES
+from backend.niches.state import DataWatcher
+from backend.services.password_hasher import PASSWORD_HASHER
+from backend.services.mail_outbox import MAIL_OUTBOX
+from backend.services.token_sweeper import TOKEN_SWEEPER
 from fastapi.middleware.cors import CORSMiddleware
 
 SECRET_KEY = os.getenv("SECRET_KEY", "change_me_in_prod")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновая подгрузка изменений backend/data без перезапуска воркеров (NICHES_WATCH=0 — выключить)
+    watcher = None
+    if os.getenv("NICHES_WATCH", "1") != "0":
+        watcher = DataWatcher(NICHES)
+        watcher.start()
+    # Пул процессов для argon2 поднимаем заранее
+    await PASSWORD_HASHER.start()
+    # Отправка писем из auth.mail_outbox (MAIL_OUTBOX_WORKER=0 — выключить, если письма шлёт другой процесс)
+    outbox = os.getenv("MAIL_OUTBOX_WORKER", "1") != "0"
+    if outbox:
+        MAIL_OUTBOX.start()
+    # Чистка истёкших токенов в схеме auth (TOKEN_SWEEPER=1; достаточно одного воркера)
+    sweeper = os.getenv("TOKEN_SWEEPER", "0") == "1"
+    if sweeper:
+        TOKEN_SWEEPER.start()
+    yield
+    if sweeper:
+        await TOKEN_SWEEPER.stop()
+    if outbox:
+        await MAIL_OUTBOX.stop()
+    PASSWORD_HASHER.shutdown()
+    if watcher is not None:
+        watcher.stop()
+
 # ---- App & templates ----
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 
 app.add_middleware(
@@ -0,0 +1,145 @@
+# backend/niches/brands.py
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("mixai.niches.brands")
+
+TOP_PRODUCTS = 10
+SORT_FIELDS = ("total_revenue_amount", "total_sales_qty", "total_products", "categories", "brand_name")
+
+
+class BrandIndex:
+    """Агрегаты по брендам всех загруженных категорий, собранные за один проход group-by по кадру.
+
+    Бренд определяется по brand_name (общий словарь кадра); gen_brand_id —
+    идентификатор бренда из выгрузки, если он указан у его карточек.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        k = frame.n_categories
+        brand = frame["brand_code"].astype(np.int64)
+        branded = brand >= 0
+        rows = np.flatnonzero(branded)
+        b = brand[branded]
+        cat = frame.cat[branded].astype(np.int64)
+        n_brands = len(frame.brands)
+        self.names = frame.brands
+
+        revenue = frame["sale_amount"][branded].astype(np.float64)
+        qty = frame["sale_qty"][branded].astype(np.float64)
+        self.revenue = np.bincount(b, weights=revenue, minlength=n_brands)
+        self.qty = np.bincount(b, weights=qty, minlength=n_brands)
+        self.products = np.bincount(b, minlength=n_brands)
+        self.merchants = np.bincount(b, weights=frame["merchant_count"][branded].astype(np.float64), minlength=n_brands)
+
+        gen_id = frame["gen_brand_id"][branded].astype(np.int64)
+        self.gen_brand_id = np.zeros(n_brands, dtype=np.int64)
+        np.maximum.at(self.gen_brand_id, b, gen_id)
+
+        abc = frame["amount_abc"][branded]
+        abc = np.where((abc >= 1) & (abc <= 3), abc, 0).astype(np.int64)
+        self.abc = np.bincount(b * 4 + abc, minlength=n_brands * 4).reshape(n_brands, 4)
+
+        # Присутствие в категориях: пары (бренд, категория), отсортированные по бренду
+        pair, inverse = np.unique(b * max(k, 1) + cat, return_inverse=True)
+        inverse = inverse.ravel()
+        self.pair_brand = pair // max(k, 1)
+        self.pair_cat = pair % max(k, 1)
+        self.pair_revenue = np.bincount(inverse, weights=revenue, minlength=pair.size)
+        self.pair_qty = np.bincount(inverse, weights=qty, minlength=pair.size)
+        self.pair_products = np.bincount(inverse, minlength=pair.size)
+        self.pair_start = np.searchsorted(self.pair_brand, np.arange(n_brands + 1))
+        self.categories = np.diff(self.pair_start)
+        self.category_revenue = np.bincount(frame.cat, weights=frame["sale_amount"].astype(np.float64), minlength=k)
+
+        # Строки кадра, сгруппированные по бренду и отсортированные по выручке внутри бренда
+        order = np.lexsort((-revenue, b))
+        self.rows = rows[order]
+        self.row_start = np.searchsorted(b[order], np.arange(n_brands + 1))
+
+        self._by_gen_id: Dict[int, int] = {}
+        for code in np.flatnonzero(self.gen_brand_id > 0).tolist():
+            self._by_gen_id.setdefault(int(self.gen_brand_id[code]), code)
+        self._by_name = {name.casefold(): code for code, name in enumerate(self.names)}
+        logger.info("brand index built: %d brands, %d categories", n_brands, k)
+
+    def resolve(self, brand_id: str) -> Optional[int]:
+        """Код бренда по gen_brand_id или по названию (без учёта регистра)"""
+        if brand_id.isdigit() and int(brand_id) in self._by_gen_id:
+            return self._by_gen_id[int(brand_id)]
+        return self._by_name.get(brand_id.strip().casefold())
+
+    def _row(self, code: int) -> dict:
+        abc = self.abc[code]
+        total = max(int(self.products[code]), 1)
+        gen_id = int(self.gen_brand_id[code])
+        return {
+            "brand_id": str(gen_id) if gen_id > 0 else self.names[code],
+            "brand_name": self.names[code],
+            "gen_brand_id": gen_id or None,
+            "total_revenue_amount": int(self.revenue[code]),
+            "total_sales_qty": int(self.qty[code]),
+            "total_products": int(self.products[code]),
+            "total_sellers_est": int(self.merchants[code]),
+            "categories": int(self.categories[code]),
+            "abc_share": {name: round(float(abc[j]) / total, 4) for j, name in ((1, "A"), (2, "B"), (3, "C"))},
+        }
+
+    def list(self, sort: str = "total_revenue_amount", descending: bool = True, q: Optional[str] = None,
+             offset: int = 0, limit: int = 50) -> tuple:
+        codes = np.arange(len(self.names))
+        if q:
+            needle = q.strip().casefold()
+            codes = np.array([c for c in codes.tolist() if needle in self.names[c].casefold()], dtype=np.int64)
+        if sort == "brand_name":
+            keys = sorted(codes.tolist(), key=lambda c: self.names[c].casefold(), reverse=descending)
+            codes = np.array(keys, dtype=np.int64)
+        else:
+            values = {
+                "total_revenue_amount": self.revenue, "total_sales_qty": self.qty,
+                "total_products": self.products, "categories": self.categories,
+            }[sort][codes].astype(np.float64)
+            codes = codes[np.argsort(-values if descending else values, kind="stable")]
+        return int(codes.size), [self._row(int(c)) for c in codes[offset:offset + limit]]
+
+    def detail(self, code: int) -> dict:
+        frame = self.frame
+        lo, hi = self.pair_start[code], self.pair_start[code + 1]
+        categories = []
+        for p in range(lo, hi):
+            k = int(self.pair_cat[p])
+            cat_revenue = self.category_revenue[k]
+            categories.append({
+                "category_id": frame.category_ids[k],
+                "category_name": frame.category_names[k],
+                "total_revenue_amount": int(self.pair_revenue[p]),
+                "total_sales_qty": int(self.pair_qty[p]),
+                "total_products": int(self.pair_products[p]),
+                "revenue_share_in_category": round(float(self.pair_revenue[p] / cat_revenue), 4) if cat_revenue > 0 else 0.0,
+            })
+        categories.sort(key=lambda c: -c["total_revenue_amount"])
+
+        top: List[dict] = []
+        for row in self.rows[self.row_start[code]:self.row_start[code + 1]][:TOP_PRODUCTS].tolist():
+            cols, i = frame.locate(row)
+            top.append({
+                "category_id": cols.category_id,
+                "product_code": cols["product_code"][i],
+                "product_name": cols["product_name"][i],
+                "sale_price": int(cols["sale_price"][i]),
+                "sale_amount": int(cols["sale_amount"][i]),
+                "sale_qty": int(cols["sale_qty"][i]),
+            })
+        return {**self._row(code), "by_category": categories, "top_products": top}
+
+
+def brand_index(frame) -> BrandIndex:
+    """Индекс брендов кадра (кэшируется на кадре, т.е. до смены данных)"""
+    index = frame.cache.get("brand_index")
+    if index is None:
+        index = frame.cache["brand_index"] = BrandIndex(frame)
+    return index
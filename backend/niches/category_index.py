@@ -0,0 +1,137 @@
+# backend/niches/category_index.py
+
+import logging
+from typing import Dict, List, Optional
+
+from backend.niches.rollups import iter_children
+
+logger = logging.getLogger("mixai.niches.category_index")
+
+# Ключи, под которыми id категории может встречаться в разных выгрузках
+ID_KEYS = ("category_id", "category_ext_id", "ext_id", "id", "code")
+NAME_KEYS = ("category_name", "name", "title", "label")
+
+
+def node_name(node: dict) -> Optional[str]:
+    for key in NAME_KEYS:
+        if node.get(key):
+            return node[key]
+    return None
+
+
+class CategoryIndex:
+    """Индекс дерева категорий по всем уровням вложенности.
+
+    id -> узел, id -> родитель, родитель -> дети, id -> путь от корня.
+    Строится один раз при загрузке дерева; поиск имени и хлебные крошки — O(1),
+    поддерево — O(размер поддерева).
+    """
+
+    def __init__(self, categories: list):
+        self.nodes: Dict[str, dict] = {}
+        self.parent: Dict[str, Optional[str]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.path: Dict[str, tuple] = {}
+        self.roots: List[str] = []
+        self._aliases: Dict[str, str] = {}
+
+        stack = [(node, None) for node in reversed(categories)]
+        while stack:
+            node, parent_id = stack.pop()
+            category_id = self._node_id(node)
+            if category_id is None or category_id in self.nodes:
+                continue
+            self.nodes[category_id] = node
+            self.parent[category_id] = parent_id
+            self.children[category_id] = []
+            if parent_id is None:
+                self.roots.append(category_id)
+                self.path[category_id] = (category_id,)
+            else:
+                self.children[parent_id].append(category_id)
+                self.path[category_id] = self.path[parent_id] + (category_id,)
+            for key in ID_KEYS[1:]:
+                if node.get(key) not in (None, ""):
+                    self._aliases.setdefault(str(node[key]), category_id)
+            stack.extend((child, category_id) for child in reversed(iter_children(node)))
+
+        logger.info("category index built: %d nodes, %d roots", len(self.nodes), len(self.roots))
+
+    @staticmethod
+    def _node_id(node: dict) -> Optional[str]:
+        for key in ID_KEYS:
+            if node.get(key) not in (None, ""):
+                return str(node[key])
+        return None
+
+    def key_of(self, node: dict) -> Optional[str]:
+        """Канонический id узла исходного дерева (тот, под которым он лежит в индексе)"""
+        return self._node_id(node)
+
+    def ids(self, category_id) -> List[str]:
+        """Канонический id и все альтернативные id узла (category_ext_id, ext_id, ...)"""
+        key = self.resolve(category_id)
+        if key is None:
+            return []
+        node = self.nodes[key]
+        out = [key]
+        for name in ID_KEYS[1:]:
+            value = node.get(name)
+            if value not in (None, "") and str(value) not in out:
+                out.append(str(value))
+        return out
+
+    def resolve(self, category_id) -> Optional[str]:
+        category_id = str(category_id)
+        if category_id in self.nodes:
+            return category_id
+        return self._aliases.get(category_id)
+
+    def get(self, category_id) -> Optional[dict]:
+        key = self.resolve(category_id)
+        return self.nodes.get(key) if key is not None else None
+
+    def name(self, category_id) -> Optional[str]:
+        node = self.get(category_id)
+        return node_name(node) if node is not None else None
+
+    def breadcrumbs(self, category_id) -> List[dict]:
+        """Путь от корня до категории: [{category_id, category_name}, ...]"""
+        key = self.resolve(category_id)
+        if key is None:
+            return []
+        return [{"category_id": cid, "category_name": node_name(self.nodes[cid])} for cid in self.path[key]]
+
+    def descendants(self, category_id) -> List[str]:
+        """Все id поддерева (включая сам узел) в порядке обхода в глубину"""
+        key = self.resolve(category_id)
+        if key is None:
+            return []
+        out, stack = [], [key]
+        while stack:
+            cid = stack.pop()
+            out.append(cid)
+            stack.extend(reversed(self.children[cid]))
+        return out
+
+    def leaves(self, category_id) -> List[str]:
+        return [cid for cid in self.descendants(category_id) if not self.children[cid]]
+
+    def subtree(self, category_id, depth: Optional[int] = None, rollups: Optional[dict] = None) -> Optional[dict]:
+        """Копия поддерева (items — список детей), опционально до глубины depth и с rollup у каждого узла"""
+        key = self.resolve(category_id)
+        if key is None:
+            return None
+
+        def _copy(cid: str, level: int) -> dict:
+            node = {k: v for k, v in self.nodes[cid].items() if k != "items"}
+            if rollups is not None:
+                node["rollup"] = rollups.get(cid)
+            kids = self.children[cid]
+            if kids and (depth is None or level < depth):
+                node["items"] = [_copy(child, level + 1) for child in kids]
+            else:
+                node["has_children"] = bool(kids)
+            return node
+
+        return _copy(key, 0)
@@ -0,0 +1,241 @@
+# backend/niches/colfile.py
+#
+# Компактный колоночный формат категории (.ncol), который читается через mmap без копирования:
+#
+#   b"NICHCOL1" | uint32 длина заголовка | JSON-заголовок | выравнивание | секции колонок
+#
+# Заголовок описывает секции (dtype, смещение от начала данных, размер в байтах),
+# словари для dict-кодированных строк и версию исходного JSON, из которого файл собран.
+
+import os
+import json
+import logging
+from array import array
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from backend.niches.parsers import safe_parse_preview_list, to_int, to_float, to_days, to_text
+from backend.niches.product_store import (
+    ProductColumns, INT_COLUMNS, FLOAT_COLUMNS, STR_COLUMNS, DATE_COLUMNS,
+)
+
+logger = logging.getLogger("mixai.niches.colfile")
+
+MAGIC = b"NICHCOL1"
+FORMAT_VERSION = 1
+ALIGN = 16
+SUFFIX = ".ncol"
+
+# Узкие типы там, где диапазон значений позволяет
+COLUMN_DTYPES = {
+    "sale_price": "<i8", "sale_amount": "<i8", "sale_qty": "<i4", "merchant_count": "<i4",
+    "review_qty": "<i4", "gen_brand_id": "<i8", "show_order_num": "<i4",
+    "restrict_type": "<i2", "amount_abc": "<i2",
+    "product_rate": "<f8", "amount_prc": "<f8",
+}
+# Строки с небольшим числом различных значений кодируются словарём
+DICT_COLUMNS = ("category_ext_id", "category_name")
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class StringColumn:
+    """Строковая колонка поверх mmap: utf-8 блоб + массив смещений (n + 1)"""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return int(self.offsets.shape[0]) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        blob = bytes(self.data)
+        offsets = self.offsets.tolist()
+        for a, b in zip(offsets, offsets[1:]):
+            yield blob[a:b].decode("utf-8")
+
+
+class DictColumn:
+    """Строковая колонка с dict-кодированием: коды int32 + список значений"""
+
+    def __init__(self, codes: np.ndarray, values: list):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return int(self.codes.shape[0])
+
+    def __getitem__(self, i):
+        code = int(self.codes[i])
+        return self.values[code] if code >= 0 else ""
+
+    def __iter__(self):
+        values = self.values
+        for code in self.codes.tolist():
+            yield values[code] if code >= 0 else ""
+
+
+class ImageColumn:
+    """preview_image_list, нормализованный при сборке в JSON-список; декодируется по требованию"""
+
+    def __init__(self, raw: StringColumn):
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, i):
+        s = self.raw[i]
+        return json.loads(s) if s else []
+
+
+class ColumnarWriter:
+    """Накопитель колонок одной категории; карточки добавляются по одной (потоково)"""
+
+    def __init__(self, category_id: str):
+        self.category_id = category_id
+        self.n = 0
+        self.numbers = {name: array("d" if name in FLOAT_COLUMNS else "q") for name in INT_COLUMNS + FLOAT_COLUMNS}
+        self.strings = {name: (array("q", [0]), bytearray()) for name in STR_COLUMNS if name not in DICT_COLUMNS}
+        self.strings["_images"] = (array("q", [0]), bytearray())
+        self.dicts: Dict[str, dict] = {name: {} for name in DICT_COLUMNS + ("brand",)}
+        self.dict_codes = {name: array("i") for name in self.dicts}
+
+    def _intern(self, column: str, value: str) -> int:
+        if not value:
+            return -1
+        table = self.dicts[column]
+        code = table.get(value)
+        if code is None:
+            code = table[value] = len(table)
+        return code
+
+    def _append_string(self, column: str, value: str):
+        offsets, blob = self.strings[column]
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    def add(self, p: dict):
+        for name in INT_COLUMNS:
+            self.numbers[name].append(to_int(p.get(name)))
+        for name in FLOAT_COLUMNS:
+            self.numbers[name].append(to_float(p.get(name)))
+        for name in STR_COLUMNS:
+            value = to_text(name, p.get(name))
+            if name in DICT_COLUMNS:
+                self.dict_codes[name].append(self._intern(name, value))
+            else:
+                self._append_string(name, value)
+        self.dict_codes["brand"].append(self._intern("brand", (p.get("brand_name") or "").strip()))
+
+        images = [img for img in safe_parse_preview_list(p.get("preview_image_list")) if isinstance(img, dict)]
+        self._append_string("_images", json.dumps(images, ensure_ascii=False, separators=(",", ":")) if images else "")
+        self.n += 1
+
+    def write(self, path: Path, source: Optional[dict] = None):
+        """Пишет файл атомарно (tmp + os.replace), чтобы читатели никогда не видели недописанный файл"""
+        sections = []
+        header = {
+            "format": FORMAT_VERSION, "category_id": self.category_id, "n": self.n,
+            "source": source or {}, "columns": {}, "strings": {}, "dicts": {},
+        }
+        pos = 0
+
+        def _add(arr: np.ndarray) -> dict:
+            nonlocal pos
+            arr = np.ascontiguousarray(arr)
+            spec = {"dtype": arr.dtype.str, "offset": pos, "nbytes": int(arr.nbytes)}
+            sections.append((pos, arr))
+            pos = _align(pos + arr.nbytes)
+            return spec
+
+        for name, values in self.numbers.items():
+            header["columns"][name] = _add(np.frombuffer(values, dtype=np.float64 if values.typecode == "d" else np.int64)
+                                           .astype(COLUMN_DTYPES.get(name, "<i8")))
+        for name, source_column in DATE_COLUMNS.items():
+            offsets, blob = self.strings[source_column]
+            header["columns"][name] = _add(to_days(StringColumn(np.frombuffer(offsets, np.int64),
+                                                                np.frombuffer(blob, np.uint8))))
+        for name, (offsets, blob) in self.strings.items():
+            header["strings"][name] = {
+                "offsets": _add(np.frombuffer(offsets, dtype=np.int64)),
+                "data": _add(np.frombuffer(blob, dtype=np.uint8)),
+            }
+        for name, table in self.dicts.items():
+            header["dicts"][name] = {
+                "codes": _add(np.frombuffer(self.dict_codes[name], dtype=np.int32)),
+                "values": list(table),
+            }
+
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(4, "little"))
+            f.write(header_bytes)
+            for offset, arr in sections:
+                f.seek(data_start + offset)
+                f.write(arr.view(np.uint8).data)
+            f.truncate(data_start + pos)
+        os.replace(tmp, path)
+        return path
+
+
+def read_header(mm: np.ndarray) -> tuple:
+    if bytes(mm[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a .ncol file")
+    hlen = int.from_bytes(bytes(mm[len(MAGIC):len(MAGIC) + 4]), "little")
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(mm[start:start + hlen]).decode("utf-8"))
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"unsupported .ncol format {header.get('format')}")
+    return header, _align(start + hlen)
+
+
+def source_version(path: Path) -> Optional[dict]:
+    """Версия исходного JSON, записанная в заголовке (без отображения колонок)"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(MAGIC) + 4)
+            if head[:len(MAGIC)] != MAGIC:
+                return None
+            hlen = int.from_bytes(head[len(MAGIC):], "little")
+            return json.loads(f.read(hlen).decode("utf-8")).get("source") or {}
+    except (OSError, ValueError):
+        return None
+
+
+def read_columns(path: Path, category_id: str, version: tuple) -> ProductColumns:
+    """Открывает .ncol через np.memmap: числовые колонки — представления над файлом, без копий"""
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+    header, base = read_header(mm)
+
+    def _section(spec):
+        start = base + spec["offset"]
+        return mm[start:start + spec["nbytes"]].view(np.dtype(spec["dtype"]))
+
+    columns = {name: _section(spec) for name, spec in header["columns"].items()}
+    strings = {name: StringColumn(_section(spec["offsets"]), _section(spec["data"]))
+               for name, spec in header["strings"].items()}
+    images = ImageColumn(strings.pop("_images"))
+    columns.update(strings)
+
+    dicts = header["dicts"]
+    for name in DICT_COLUMNS:
+        columns[name] = DictColumn(_section(dicts[name]["codes"]), dicts[name]["values"])
+    columns["brand_code"] = _section(dicts["brand"]["codes"])
+    return ProductColumns(category_id, version, columns, dicts["brand"]["values"], images)
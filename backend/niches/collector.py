@@ -0,0 +1,425 @@
+# backend/niches/collector.py
+#
+# Асинхронный сборщик дерева категорий и выгрузок товаров с внешнего источника.
+#
+# Источник настраивается через окружение:
+#   NICHES_UPSTREAM_URL          базовый URL (обязателен)
+#   NICHES_UPSTREAM_TOKEN        Bearer-токен (необязателен)
+#   NICHES_CATEGORIES_PATH       дерево: GET <path>[?parent_id=<id>] -> {"success", "data": [...]}
+#   NICHES_PRODUCTS_PATH         товары: GET <path>?category_id=<id>&page=<n>&limit=<k> -> {"products": {"lines": [...]}}
+#   NICHES_COLLECT_CONCURRENCY   одновременных запросов (по умолчанию 16)
+#   NICHES_COLLECT_RPS           запросов в секунду на хост (по умолчанию 10)
+#   NICHES_PAGE_SIZE             товаров на страницу (по умолчанию 500)
+#
+# Пишет те же форматы, что читают роутеры: algatop_niche.json (вложенные {"success", "data"}),
+# data/categories.json (вложенные списки items) и data/products/<category_id>.json.
+
+import os
+import copy
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from urllib.parse import urlsplit
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.niches.product_store import CATEGORY_ID_RE
+
+logger = logging.getLogger("mixai.niches.collector")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+CHECKPOINT_EVERY = 20
+
+
+class CollectorError(Exception):
+    pass
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _atomic_write_json(path: Path, payload):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class RateLimiter:
+    """Token bucket на хост: в среднем rate запросов в секунду, всплеск до burst"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def acquire(self, host: str):
+        if self.rate <= 0:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            while True:
+                now = time.monotonic()
+                tokens = self._tokens.get(host, float(self.burst))
+                tokens = min(self.burst, tokens + (now - self._updated.get(host, now)) * self.rate)
+                self._updated[host] = now
+                if tokens >= 1:
+                    self._tokens[host] = tokens - 1
+                    return
+                self._tokens[host] = tokens
+                await asyncio.sleep((1 - tokens) / self.rate)
+
+
+class Checkpoint:
+    """Состояние сборки на диске: валидаторы (ETag/Last-Modified), кэш ответов дерева
+    и список категорий, уже собранных в текущем запуске (для продолжения после сбоя)"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.state = {"validators": {}, "responses": {}, "run": None}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.state.update(json.load(f))
+            except (OSError, ValueError):
+                logger.warning("checkpoint %s повреждён, начинаем заново", self.path)
+        self._dirty = 0
+
+    def start_run(self, resume: bool) -> set:
+        run = self.state.get("run")
+        if resume and run and not run.get("finished_at"):
+            logger.info("resuming run started at %s: %d categories done", run["started_at"], len(run["done"]))
+        else:
+            run = self.state["run"] = {"started_at": datetime.now(timezone.utc).isoformat(), "done": []}
+        return set(run["done"])
+
+    def mark_done(self, category_id: str):
+        self.state["run"]["done"].append(category_id)
+        self._dirty += 1
+        if self._dirty >= CHECKPOINT_EVERY:
+            self.save()
+
+    def finish_run(self):
+        self.state["run"]["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.save()
+
+    def validators(self, url: str) -> dict:
+        return self.state["validators"].get(url) or {}
+
+    def remember(self, url: str, response: httpx.Response, body=None):
+        validators = {k: response.headers[h] for k, h in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+                      if h in response.headers}
+        if validators:
+            self.state["validators"][url] = validators
+        if body is not None:
+            # Копия: дерево собирается из тех же dict, и узлы получают items детей
+            self.state["responses"][hashlib.sha1(url.encode()).hexdigest()] = copy.deepcopy(body)
+
+    def cached_body(self, url: str):
+        body = self.state["responses"].get(hashlib.sha1(url.encode()).hexdigest())
+        return copy.deepcopy(body) if body is not None else None
+
+    def save(self):
+        _atomic_write_json(self.path, self.state)
+        self._dirty = 0
+
+
+class Collector:
+    def __init__(
+        self,
+        base_url: str,
+        categories_path: str = "/categories",
+        products_path: str = "/products",
+        token: Optional[str] = None,
+        concurrency: int = 16,
+        rps: float = 10.0,
+        page_size: int = 500,
+        products_dir: Path = BASE_DIR / "data" / "products",
+        tree_path: Path = BASE_DIR / "algatop_niche.json",
+        categories_path_out: Path = BASE_DIR / "data" / "categories.json",
+        checkpoint: Path = BASE_DIR / "data" / "collector" / "checkpoint.json",
+        timeout: float = 30.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.categories_path = categories_path
+        self.products_path = products_path
+        self.page_size = page_size
+        self.products_dir = Path(products_dir)
+        self.tree_path = Path(tree_path)
+        self.categories_out = Path(categories_path_out)
+        self.checkpoint = Checkpoint(checkpoint)
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rps, burst=max(int(rps), 1))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.stats = {"requests": 0, "retries": 0, "not_modified": 0, "failed": 0, "categories": 0, "products": 0}
+
+    @classmethod
+    def from_env(cls, **overrides) -> "Collector":
+        base_url = os.getenv("NICHES_UPSTREAM_URL")
+        if not base_url:
+            raise CollectorError("NICHES_UPSTREAM_URL не задан")
+        return cls(
+            base_url,
+            categories_path=os.getenv("NICHES_CATEGORIES_PATH", "/categories"),
+            products_path=os.getenv("NICHES_PRODUCTS_PATH", "/products"),
+            token=os.getenv("NICHES_UPSTREAM_TOKEN"),
+            concurrency=_env_int("NICHES_COLLECT_CONCURRENCY", 16),
+            rps=float(os.getenv("NICHES_COLLECT_RPS", "10")),
+            page_size=_env_int("NICHES_PAGE_SIZE", 500),
+            **overrides,
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    # ---- HTTP ----
+    async def fetch(self, path: str, params: dict = None, conditional: bool = False) -> Optional[httpx.Response]:
+        """GET с ограничением скорости, повторами и (опционально) условными заголовками.
+
+        Возвращает ответ 200/304; после MAX_RETRIES неудач — CollectorError.
+        """
+        request = self.client.build_request("GET", path, params=params)
+        url = str(request.url)
+        if conditional:
+            validators = self.checkpoint.validators(url)
+            if "etag" in validators:
+                request.headers["If-None-Match"] = validators["etag"]
+            if "last_modified" in validators:
+                request.headers["If-Modified-Since"] = validators["last_modified"]
+
+        host = urlsplit(url).netloc
+        for attempt in range(MAX_RETRIES + 1):
+            delay = None
+            async with self._semaphore:
+                await self.limiter.acquire(host)
+                self.stats["requests"] += 1
+                try:
+                    response = await self.client.send(request)
+                except httpx.TransportError as e:
+                    logger.warning("GET %s: %s (attempt %d)", url, e, attempt + 1)
+                else:
+                    if response.status_code in (200, 304):
+                        if response.status_code == 304:
+                            self.stats["not_modified"] += 1
+                        return response
+                    if response.status_code not in RETRY_STATUSES:
+                        raise CollectorError(f"GET {url}: HTTP {response.status_code}")
+                    delay = _retry_after(response)
+                    logger.warning("GET %s: HTTP %d (attempt %d)", url, response.status_code, attempt + 1)
+            if attempt == MAX_RETRIES:
+                break
+            self.stats["retries"] += 1
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+            await asyncio.sleep(delay)
+        self.stats["failed"] += 1
+        raise CollectorError(f"GET {url}: retries exhausted")
+
+    # ---- Дерево категорий ----
+    async def _children(self, parent_id: Optional[str]) -> dict:
+        params = {"parent_id": parent_id} if parent_id else None
+        response = await self.fetch(self.categories_path, params=params, conditional=True)
+        url = str(response.request.url)
+        if response.status_code == 304:
+            cached = self.checkpoint.cached_body(url)
+            if cached is not None:
+                return cached
+            response = await self.fetch(self.categories_path, params=params)
+        body = response.json()
+        if not isinstance(body, dict) or not isinstance(body.get("data"), list):
+            raise CollectorError(f"GET {url}: неожиданный формат дерева")
+        self.checkpoint.remember(url, response, body)
+        return body
+
+    async def collect_tree(self) -> dict:
+        """Обход дерева в ширину: дети всех узлов одного уровня запрашиваются параллельно"""
+        root = await self._children(None)
+        level = list(root["data"])
+        while level:
+            parents = [node for node in level if node.get("is_has_subcategory")]
+            results = await asyncio.gather(*(self._children(str(node["category_id"])) for node in parents))
+            level = []
+            for node, body in zip(parents, results):
+                node["items"] = body
+                level.extend(body["data"])
+        return root
+
+    # ---- Товары ----
+    async def collect_products(self, category_id: str) -> bool:
+        """Все страницы товаров категории -> products/<id>.json; False, если источник не изменился"""
+        if not CATEGORY_ID_RE.match(category_id):
+            raise CollectorError(f"недопустимый category_id: {category_id!r}")
+        target = self.products_dir / f"{category_id}.json"
+        lines: List[dict] = []
+        page = 1
+        while True:
+            params = {"category_id": category_id, "page": page, "limit": self.page_size}
+            # Первая страница — условный запрос: 304 значит, что категория не менялась
+            response = await self.fetch(self.products_path, params=params, conditional=(page == 1 and target.exists()))
+            if response.status_code == 304:
+                return False
+            if page == 1:
+                first = response
+            chunk = ((response.json() or {}).get("products") or {}).get("lines") or []
+            lines.extend(chunk)
+            if len(chunk) < self.page_size:
+                break
+            page += 1
+
+        _atomic_write_json(target, {"products": {"lines": lines}})
+        self.checkpoint.remember(str(first.request.url), first)
+        self.stats["products"] += len(lines)
+        return True
+
+    async def collect(self, category_ids: Optional[List[str]] = None, resume: bool = False,
+                      tree: bool = True) -> dict:
+        started = time.perf_counter()
+        done = self.checkpoint.start_run(resume)
+
+        if tree:
+            raw = await self.collect_tree()
+            _atomic_write_json(self.tree_path, raw)
+            _atomic_write_json(self.categories_out, {"data": normalize_tree(raw["data"])})
+            if category_ids is None:
+                category_ids = leaf_ids(raw["data"])
+            self.checkpoint.save()
+        if category_ids is None:
+            raise CollectorError("Не заданы категории и не собрано дерево")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for category_id in category_ids:
+            if not CATEGORY_ID_RE.match(category_id):
+                logger.warning("skipping invalid category_id %r", category_id)
+                continue
+            if category_id not in done:
+                queue.put_nowait(category_id)
+        changed, failed = [], []
+
+        async def _worker():
+            while True:
+                try:
+                    category_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    if await self.collect_products(category_id):
+                        changed.append(category_id)
+                    self.checkpoint.mark_done(category_id)
+                    self.stats["categories"] += 1
+                except (CollectorError, ValueError) as e:
+                    logger.error("category %s: %s", category_id, e)
+                    failed.append(category_id)
+
+        await asyncio.gather(*(_worker() for _ in range(self.concurrency)))
+        if failed:
+            self.checkpoint.save()
+        else:
+            self.checkpoint.finish_run()
+
+        report = {**self.stats, "changed": len(changed), "failed_ids": failed,
+                  "elapsed_sec": round(time.perf_counter() - started, 2)}
+        logger.info("collect finished: %s", report)
+        return report
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return min(float(value), BACKOFF_MAX)
+    except ValueError:
+        pass
+    try:
+        return min(max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0), BACKOFF_MAX)
+    except (TypeError, ValueError):
+        return None
+
+
+def _children_of(node: dict) -> list:
+    items = node.get("items") or []
+    if isinstance(items, dict):
+        items = items.get("data") or []
+    return items
+
+
+def normalize_tree(nodes: list) -> list:
+    """algatop-формат (items = {"success", "data"}) -> вложенные списки items, как в categories.json"""
+    out = []
+    for node in nodes:
+        node = dict(node)
+        children = _children_of(node)
+        if children:
+            node["items"] = normalize_tree(children)
+        else:
+            node.pop("items", None)
+        out.append(node)
+    return out
+
+
+def leaf_ids(nodes: list) -> List[str]:
+    out, stack = [], list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        children = _children_of(node)
+        if children:
+            stack.extend(reversed(children))
+        elif node.get("category_id"):
+            out.append(str(node["category_id"]))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сбор дерева категорий и товаров с внешнего источника")
+    parser.add_argument("categories", nargs="*", help="id категорий (по умолчанию — все листья дерева)")
+    parser.add_argument("--no-tree", action="store_true", help="не обновлять дерево категорий")
+    parser.add_argument("--resume", action="store_true", help="продолжить прерванный запуск с checkpoint")
+    parser.add_argument("--products-dir", default=str(BASE_DIR / "data" / "products"))
+    parser.add_argument("--checkpoint", default=str(BASE_DIR / "data" / "collector" / "checkpoint.json"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def _run():
+        collector = Collector.from_env(products_dir=Path(args.products_dir), checkpoint=Path(args.checkpoint))
+        try:
+            return await collector.collect(args.categories or None, resume=args.resume, tree=not args.no_tree)
+        finally:
+            await collector.aclose()
+
+    report = asyncio.run(_run())
+    print(json.dumps(report, ensure_ascii=False))
+    return 1 if report["failed_ids"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
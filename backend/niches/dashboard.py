@@ -0,0 +1,104 @@
+# backend/niches/dashboard.py
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.niches.scoring import niche_scores
+
+logger = logging.getLogger("mixai.niches.dashboard")
+
+TOP_PRODUCTS = 5
+CACHE_SIZE = 64
+TOTAL_FIELDS = ("total_revenue_amount", "total_sales_qty", "total_products", "total_sellers_est")
+
+_lock = threading.Lock()
+
+
+def _top_products(frame, ks: np.ndarray, n: int) -> dict:
+    """Топ-n товаров по выручке для всех выбранных категорий за один проход по кадру"""
+    rows = np.flatnonzero(np.isin(frame.cat, ks))
+    if not rows.size:
+        return {}
+    cat = frame.cat[rows]
+    order = np.lexsort((-frame["sale_amount"][rows].astype(np.float64), cat))
+    rows, cat = rows[order], cat[order]
+    starts = np.searchsorted(cat, cat, side="left")
+    keep = (np.arange(rows.size) - starts) < n
+
+    out = {}
+    for row in rows[keep].tolist():
+        cols, i = frame.locate(row)
+        images = cols.images[i]
+        out.setdefault(cols.category_id, []).append({
+            "product_code": cols["product_code"][i],
+            "product_name": cols["product_name"][i],
+            "brand_name": cols.brand_name(i),
+            "sale_price": int(cols["sale_price"][i]),
+            "sale_amount": int(cols["sale_amount"][i]),
+            "sale_qty": int(cols["sale_qty"][i]),
+            "image": images[0].get("small") if images and isinstance(images[0], dict) else None,
+        })
+    return out
+
+
+def build_dashboard(frame, index, selected: list) -> dict:
+    """Сводка по выбранным нишам: метрики и скор из общего расчёта по кадру и топ товаров.
+
+    Родительская категория раскрывается до дочерних категорий с выгрузками.
+    """
+    position = {category_id: k for k, category_id in enumerate(frame.category_ids)}
+    scores = {row["category_id"]: row for row in niche_scores(frame)}
+
+    resolved, missing, seen = [], [], set()
+    for category_id in selected:
+        key = index.resolve(category_id) or category_id
+        leaves = [cid for cid in (index.descendants(key) or [key]) if cid in position]
+        if not leaves:
+            missing.append(category_id)
+        for cid in leaves:
+            if cid not in seen:
+                seen.add(cid)
+                resolved.append((cid, category_id))
+
+    ks = np.array([position[cid] for cid, _ in resolved], dtype=np.int64)
+    top = _top_products(frame, ks, TOP_PRODUCTS)
+
+    niches = []
+    for category_id, selected_as in resolved:
+        row = scores[category_id]
+        niches.append({
+            **row,
+            "category_name": row["category_name"] or index.name(category_id),
+            "selected_as": selected_as,
+            "breadcrumbs": index.breadcrumbs(category_id),
+            "top_products": top.get(category_id, []),
+        })
+
+    totals = {name: sum(n[name] or 0 for n in niches) for name in TOTAL_FIELDS}
+    revenue = totals["total_revenue_amount"]
+    totals["avg_score"] = round(sum(n["score"] for n in niches) / len(niches), 2) if niches else None
+    totals["revenue_weighted_score"] = (
+        round(sum(n["score"] * (n["total_revenue_amount"] or 0) for n in niches) / revenue, 2) if revenue else None
+    )
+    return {"selected": selected, "missing": missing, "totals": totals, "niches": niches}
+
+
+def dashboard(frame, state, selected: list) -> dict:
+    """build_dashboard с кэшем по (выбор, версия данных): кэш живёт на кадре товаров и
+    учитывает поколение дерева категорий"""
+    key = (tuple(selected), state.generation)
+    with _lock:
+        cache = frame.cache.setdefault("dashboard", OrderedDict())
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+            return cached
+    result = build_dashboard(frame, state.index, selected)
+    with _lock:
+        cache[key] = result
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+    return result
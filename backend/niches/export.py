@@ -0,0 +1,144 @@
+# backend/niches/export.py
+
+import io
+import csv
+import logging
+from typing import Iterable, Iterator
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet/Arrow — необязательная зависимость
+    pa = None
+
+logger = logging.getLogger("mixai.niches.export")
+
+BATCH_SIZE = 2000
+
+# Колонки выгрузки в порядке вывода; числовые берутся из массивов, строки — из колонок категории
+NUMBER_COLUMNS = (
+    "sale_price", "sale_qty", "sale_amount", "merchant_count", "review_qty", "product_rate", "amount_abc",
+)
+EXPORT_COLUMNS = (
+    "category_id", "category_name", "product_code", "product_name", "brand_name",
+    *NUMBER_COLUMNS, "created_dt", "last_sale_date", "product_url",
+)
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def available_formats() -> list:
+    return list(FORMATS) if pa is not None else ["csv"]
+
+
+def _batches(parts: Iterable, batch_size: int) -> Iterator[dict]:
+    """Пачки строк выгрузки: dict колонка -> список значений длиной <= batch_size"""
+    for cols in parts:
+        category_name = cols.category_name or ""
+        brands = cols.brands
+        for start in range(0, cols.n, batch_size):
+            stop = min(start + batch_size, cols.n)
+            idx = range(start, stop)
+            brand_code = np.asarray(cols["brand_code"][start:stop]).tolist()
+            batch = {
+                "category_id": [cols.category_id] * len(idx),
+                "category_name": [category_name] * len(idx),
+                "brand_name": [brands[c] if c >= 0 else "" for c in brand_code],
+            }
+            for name in ("product_code", "product_name", "created_dt", "last_sale_date", "product_url"):
+                column = cols[name]
+                batch[name] = [column[i] for i in idx]
+            for name in NUMBER_COLUMNS:
+                batch[name] = np.asarray(cols[name][start:stop]).tolist()
+            yield batch
+
+
+def iter_csv(parts: Iterable, batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """CSV пачками: в памяти держится только текущая пачка строк"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM — чтобы Excel открыл кириллицу без выбора кодировки
+    buf.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batches(parts, batch_size):
+        writer.writerows(zip(*(batch[name] for name in EXPORT_COLUMNS)))
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+class _ChunkSink:
+    """Файлоподобный приёмник для pyarrow: накопленные байты забираются после каждой пачки"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+
+def _schema():
+    fields = []
+    for name in EXPORT_COLUMNS:
+        if name == "product_rate":
+            fields.append(pa.field(name, pa.float64()))
+        elif name in NUMBER_COLUMNS:
+            fields.append(pa.field(name, pa.int64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def iter_arrow(parts: Iterable, fmt: str, batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """Parquet (row group на пачку) или Arrow IPC stream; требует pyarrow"""
+    if pa is None:
+        raise RuntimeError("pyarrow не установлен")
+    schema = _schema()
+    sink = _ChunkSink()
+    file = pa.PythonFile(sink, mode="w")
+    writer = pq.ParquetWriter(file, schema) if fmt == "parquet" else pa.ipc.new_stream(file, schema)
+    try:
+        for batch in _batches(parts, batch_size):
+            writer.write_batch(pa.record_batch([batch[name] for name in EXPORT_COLUMNS], schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+def iter_export(parts: Iterable, fmt: str = "csv", batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    if fmt == "csv":
+        return iter_csv(parts, batch_size)
+    return iter_arrow(parts, fmt, batch_size)
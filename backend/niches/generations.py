@@ -0,0 +1,147 @@
+# backend/niches/generations.py
+#
+# Поколения скомпилированных данных для нескольких воркеров uvicorn:
+#
+#   compiled/gen-<YYYYmmddTHHMMSSffffff>/{<category_id>.ncol, manifest.json}
+#   compiled/CURRENT   — имя текущего поколения, заменяется атомарно (os.replace)
+#
+# Загрузчик собирает новое поколение целиком и только потом переключает CURRENT.
+# Воркеры открывают .ncol через mmap только на чтение: страницы файлов лежат
+# в page cache ОС один раз и разделяются всеми процессами без копирования.
+
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Optional
+
+from backend.niches.colfile import SUFFIX, source_version
+
+logger = logging.getLogger("mixai.niches.generations")
+
+CURRENT = "CURRENT"
+PREFIX = "gen-"
+MANIFEST = "manifest.json"
+KEEP_GENERATIONS = 2
+
+
+def _stat_key(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def current_generation(compiled_dir: Path) -> Optional[Path]:
+    try:
+        name = (Path(compiled_dir) / CURRENT).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if not name.startswith(PREFIX) or "/" in name:
+        return None
+    path = Path(compiled_dir) / name
+    return path if path.is_dir() else None
+
+
+def list_generations(compiled_dir: Path) -> list:
+    compiled_dir = Path(compiled_dir)
+    if not compiled_dir.exists():
+        return []
+    return sorted(p for p in compiled_dir.iterdir() if p.is_dir() and p.name.startswith(PREFIX))
+
+
+def publish(compiled_dir: Path, generation: Path):
+    """Атомарно делает generation текущим поколением"""
+    pointer = Path(compiled_dir) / CURRENT
+    tmp = pointer.with_name(f".{CURRENT}.{os.getpid()}.tmp")
+    tmp.write_text(generation.name, encoding="utf-8")
+    os.replace(tmp, pointer)
+    logger.info("generation published: %s", generation.name)
+
+
+def prune(compiled_dir: Path, keep: int = KEEP_GENERATIONS):
+    """Удаляет старые поколения. Воркеры, ещё держащие mmap удалённых файлов, продолжают
+    читать их до переоткрытия — на POSIX данные живут, пока открыт хотя бы один mmap."""
+    current = current_generation(compiled_dir)
+    old = [p for p in list_generations(compiled_dir) if p != current]
+    for path in old[:max(len(old) - (keep - 1), 0)]:
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info("generation removed: %s", path.name)
+
+
+def build_generation(products_dir: Path, compiled_dir: Path, keep: int = KEEP_GENERATIONS) -> Path:
+    """Собирает новое поколение из всех выгрузок products_dir и публикует его.
+
+    Категории, чей исходный JSON не менялся, не перекомпилируются — файл
+    из текущего поколения переносится жёсткой ссылкой.
+    """
+    from backend.niches.ingest import compile_category
+
+    products_dir, compiled_dir = Path(products_dir), Path(compiled_dir)
+    compiled_dir.mkdir(parents=True, exist_ok=True)
+    previous = current_generation(compiled_dir)
+
+    name = PREFIX + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    tmp = compiled_dir / f".{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+
+    manifest = {"generation": name, "created_at": datetime.now(timezone.utc).isoformat(), "categories": {}}
+    reused = 0
+    for json_path in sorted(products_dir.glob("*.json")):
+        st = json_path.stat()
+        source = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+        target = tmp / f"{json_path.stem}{SUFFIX}"
+        old = previous / target.name if previous is not None else None
+        if old is not None and old.exists() and source_version(old) == source:
+            os.link(old, target)
+            reused += 1
+        else:
+            compile_category(json_path, tmp)
+        manifest["categories"][json_path.stem] = {"source": source, "bytes": target.stat().st_size}
+
+    with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    generation = compiled_dir / name
+    os.rename(tmp, generation)
+    publish(compiled_dir, generation)
+    prune(compiled_dir, keep)
+    logger.info("generation %s: %d categories (%d reused)", name, len(manifest["categories"]), reused)
+    return generation
+
+
+class GenerationPointer:
+    """Каталог текущего поколения для воркера.
+
+    CURRENT перечитывается не чаще CHECK_INTERVAL и только если файл
+    изменился; без CURRENT используется сам compiled_dir (плоская раскладка).
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, compiled_dir: Path):
+        self.compiled_dir = Path(compiled_dir)
+        self._key = None
+        self._directory = self.compiled_dir
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def directory(self) -> Path:
+        now = time.monotonic()
+        if now - self._checked < self.CHECK_INTERVAL:
+            return self._directory
+        with self._lock:
+            key = _stat_key(self.compiled_dir / CURRENT)
+            if key != self._key:
+                generation = current_generation(self.compiled_dir) if key is not None else None
+                directory = generation or self.compiled_dir
+                if directory != self._directory:
+                    logger.info("switched to generation: %s", directory.name)
+                self._directory, self._key = directory, key
+            self._checked = now
+        return self._directory
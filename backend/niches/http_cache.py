@@ -0,0 +1,84 @@
+# backend/niches/http_cache.py
+
+import gzip
+import json
+import hashlib
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import Response
+
+# Клиент всегда ревалидирует ответ по ETag, но тело повторно не качает
+CACHE_CONTROL = "no-cache"
+
+
+def strong_etag(seed) -> str:
+    return '"' + hashlib.sha256(str(seed).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Проверяет If-None-Match (список тегов, '*', W/-префиксы и -gzip варианты)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    base = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.endswith("-gzip"):
+            tag = tag[:-len("-gzip")]
+        if tag == base:
+            return True
+    return False
+
+
+def accepts_gzip(request: Request) -> bool:
+    accept = request.headers.get("accept-encoding", "")
+    for part in accept.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") != "q=0"
+    return False
+
+
+def not_modified(etag: str, vary: Optional[str] = None) -> Response:
+    # 304 повторяет заголовки, которые отправил бы 200, включая Vary
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if vary:
+        headers["Vary"] = vary
+    return Response(status_code=304, headers=headers)
+
+
+class PreparedBody:
+    """Заранее сериализованный (и сжатый) JSON-ответ со строгим ETag по содержимому"""
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.gzip_etag = self.etag[:-1] + '-gzip"'
+
+    @classmethod
+    def from_json(cls, content) -> "PreparedBody":
+        # те же параметры, что у fastapi.responses.JSONResponse
+        body = json.dumps(
+            content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+        ).encode("utf-8")
+        return cls(body)
+
+    def response(self, request: Request) -> Response:
+        use_gzip = accepts_gzip(request)
+        if etag_matches(request, self.etag):
+            return not_modified(self.gzip_etag if use_gzip else self.etag, vary="Accept-Encoding")
+
+        common = {"Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if use_gzip:
+            return Response(
+                content=self.gzipped, media_type=self.media_type,
+                headers={**common, "ETag": self.gzip_etag, "Content-Encoding": "gzip"},
+            )
+        return Response(content=self.body, media_type=self.media_type, headers={**common, "ETag": self.etag})
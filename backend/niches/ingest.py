@@ -0,0 +1,123 @@
+# backend/niches/ingest.py
+
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import Iterator
+
+from backend.niches.colfile import ColumnarWriter, SUFFIX
+
+logger = logging.getLogger("mixai.niches.ingest")
+
+CHUNK_SIZE = 1 << 20
+LINES_KEY = '"lines"'
+
+_decoder = json.JSONDecoder()
+
+
+def iter_product_lines(path, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """Потоково отдаёт карточки из products.lines, не загружая файл целиком.
+
+    Читает файл кусками, находит массив "lines" и по одному декодирует
+    объекты через JSONDecoder.raw_decode; в памяти держится только
+    текущий кусок и одна недочитанная карточка.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        eof = False
+
+        def _fill() -> bool:
+            nonlocal buf, eof
+            if eof:
+                return False
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf += chunk
+            return True
+
+        # Ищем начало массива lines
+        while True:
+            idx = buf.find(LINES_KEY)
+            if idx >= 0:
+                bracket = buf.find("[", idx + len(LINES_KEY))
+                if bracket >= 0:
+                    buf = buf[bracket + 1:]
+                    break
+            elif len(buf) > len(LINES_KEY):
+                buf = buf[-len(LINES_KEY):]
+            if not _fill():
+                return
+
+        pos = 0
+        while True:
+            # пропускаем разделители между объектами
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) or not _fill():
+                    break
+            if pos >= len(buf) or buf[pos] == "]":
+                return
+
+            try:
+                obj, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # объект разрезан границей куска — дочитываем и пробуем снова
+                buf = buf[pos:]
+                pos = 0
+                if not _fill():
+                    raise
+                continue
+
+            if isinstance(obj, dict):
+                yield obj
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+
+def compile_category(json_path: Path, out_dir: Path) -> Path:
+    """Сырая выгрузка категории -> out_dir/<category_id>.ncol"""
+    json_path = Path(json_path)
+    category_id = json_path.stem
+    st = json_path.stat()
+
+    writer = ColumnarWriter(category_id)
+    for p in iter_product_lines(json_path):
+        writer.add(p)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return writer.write(out_dir / f"{category_id}{SUFFIX}", source={"mtime_ns": st.st_mtime_ns, "size": st.st_size})
+
+
+def main(argv=None):
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description="Конвертация выгрузок товаров в колоночный формат .ncol")
+    parser.add_argument("paths", nargs="*", help="файлы категорий (по умолчанию — все из --products-dir)")
+    parser.add_argument("--products-dir", default=str(base_dir / "data" / "products"))
+    parser.add_argument("--out", default=str(base_dir / "data" / "compiled"))
+    parser.add_argument("--generation", action="store_true",
+                        help="собрать новое поколение из всех категорий и атомарно переключить CURRENT")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.generation:
+        from backend.niches.generations import build_generation
+        print(f"generation published: {build_generation(Path(args.products_dir), Path(args.out))}")
+        return
+    paths = [Path(p) for p in args.paths] or sorted(Path(args.products_dir).glob("*.json"))
+    out_dir = Path(args.out)
+    for path in paths:
+        started = time.perf_counter()
+        target = compile_category(path, out_dir)
+        logger.info("%s -> %s (%d -> %d bytes, %.2fs)", path.name, target.name,
+                    path.stat().st_size, target.stat().st_size, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# backend/niches/leaderboards.py
+
+import time
+import heapq
+import logging
+import threading
+from itertools import chain
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("mixai.niches.leaderboards")
+
+TOP_N = 100
+SYNC_INTERVAL = 5.0
+
+# Рейтинги товаров: имя -> функция значения по колонкам категории
+METRICS = {
+    "sale_amount": lambda cols: cols["sale_amount"].astype(np.float64),
+    "sale_qty": lambda cols: cols["sale_qty"].astype(np.float64),
+    "popularity": lambda cols: cols["product_rate"].astype(np.float64) * cols["review_qty"],
+}
+# Ценовые диапазоны (₸, [от, до)); внутри диапазона товары ранжируются по выручке
+PRICE_BANDS = ((0, 5_000), (5_000, 20_000), (20_000, 50_000), (50_000, 150_000), (150_000, None))
+BAND_METRIC = "sale_amount"
+
+
+def _top(values: np.ndarray, n: int) -> np.ndarray:
+    """Индексы n наибольших значений по убыванию (argpartition, без полной сортировки)"""
+    if values.size > n:
+        idx = np.argpartition(-values, n - 1)[:n]
+    else:
+        idx = np.arange(values.size)
+    return idx[np.lexsort((idx, -values[idx]))]
+
+
+class _CategoryBoards:
+    """Топ-N одной категории по каждому рейтингу: списки (значение, category_id, строка, колонки)"""
+
+    def __init__(self, cols, n: int = TOP_N):
+        self.cols = cols
+        self.version = cols.version
+        self.boards: Dict[tuple, list] = {}
+        for name, fn in METRICS.items():
+            values = np.nan_to_num(fn(cols), nan=-np.inf)
+            self.boards[(name, None)] = self._entries(values, n)
+            if name == BAND_METRIC:
+                price = cols["sale_price"]
+                for band, (lo, hi) in enumerate(PRICE_BANDS):
+                    mask = price >= lo if hi is None else (price >= lo) & (price < hi)
+                    self.boards[(name, band)] = self._entries(np.where(mask, values, -np.inf), n)
+
+    def _entries(self, values: np.ndarray, n: int) -> list:
+        idx = _top(values, n)
+        idx = idx[np.isfinite(values[idx])]
+        cols = self.cols
+        return [(float(values[i]), cols.category_id, int(i), cols) for i in idx]
+
+
+class Leaderboards:
+    """Глобальные и по родительским категориям топ-N товаров.
+
+    Для каждой категории топ-N считается один раз и пересчитывается только
+    при смене версии её файла. Глобальные и родительские рейтинги собираются
+    слиянием топов категорий ограниченной кучей (heapq.nlargest) и кэшируются;
+    при перезагрузке категории сбрасываются только рейтинги её предков.
+    """
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.categories: Dict[str, _CategoryBoards] = {}
+        self._merged: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+
+    def sync(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_sync < SYNC_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._last_sync < SYNC_INTERVAL:
+                return
+            ids = set(self.store.category_ids())
+            changed = []
+            for category_id in ids:
+                cols = self.store.get(category_id)
+                if cols is None:
+                    continue
+                current = self.categories.get(category_id)
+                if current is None or current.version != cols.version:
+                    self.categories[category_id] = _CategoryBoards(cols)
+                    changed.append(category_id)
+            for category_id in set(self.categories) - ids:
+                del self.categories[category_id]
+                changed.append(category_id)
+            if changed:
+                self._invalidate(changed)
+                logger.info("leaderboards updated: %d categories", len(changed))
+            self._last_sync = time.monotonic()
+
+    def reindex(self, index):
+        """Новое дерево категорий: родительские рейтинги собираются заново"""
+        with self._lock:
+            self.index = index
+            self._merged.clear()
+
+    def _invalidate(self, changed: list):
+        scopes = {None}
+        for category_id in changed:
+            key = self.index.resolve(category_id)
+            scopes.update(self.index.path.get(key, ()) if key else ())
+        for key in [k for k in self._merged if k[0] in scopes]:
+            del self._merged[key]
+
+    def _scope_categories(self, parent: Optional[str]) -> Optional[list]:
+        if parent is None:
+            return list(self.categories)
+        key = self.index.resolve(parent)
+        if key is None:
+            return None
+        return [cid for cid in self.index.descendants(key) if cid in self.categories]
+
+    def board(self, metric: str, parent: Optional[str] = None, band: Optional[int] = None) -> Optional[list]:
+        """Слитый топ-N: [(значение, category_id, строка, колонки), ...] или None, если родитель не найден"""
+        scope = self.index.resolve(parent) if parent is not None else None
+        if parent is not None and scope is None:
+            return None
+        key = (scope, metric, band)
+        merged = self._merged.get(key)
+        if merged is not None:
+            return merged
+        with self._lock:
+            categories = self._scope_categories(scope)
+            boards = [self.categories[cid].boards[(metric, band)] for cid in categories]
+            merged = heapq.nlargest(TOP_N, chain.from_iterable(boards), key=lambda e: e[0])
+            self._merged[key] = merged
+        return merged
+
+    @staticmethod
+    def items(entries: list, limit: int) -> List[dict]:
+        out = []
+        for value, category_id, row, cols in entries[:limit]:
+            images = cols.images[row]
+            out.append({
+                "category_id": category_id,
+                "category_name": cols.category_name,
+                "product_code": cols["product_code"][row],
+                "product_name": cols["product_name"][row],
+                "brand_name": cols.brand_name(row),
+                "sale_price": int(cols["sale_price"][row]),
+                "sale_amount": int(cols["sale_amount"][row]),
+                "sale_qty": int(cols["sale_qty"][row]),
+                "product_rate": round(float(cols["product_rate"][row]), 2),
+                "review_qty": int(cols["review_qty"][row]),
+                "product_url": cols["product_url"][row],
+                "image": images[0].get("small") if images and isinstance(images[0], dict) else None,
+                "value": round(value, 4),
+            })
+        return out
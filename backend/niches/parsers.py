@@ -0,0 +1,133 @@
+# backend/niches/parsers.py
+
+import re
+import html
+import json
+import logging
+
+import numpy as np
+
+
+def safe_parse_preview_list(raw):
+    """
+    Универсальный парсер preview_image_list, который терпимо обрабатывает:
+    - корректный JSON list: '[{...},{...}]'
+    - JSON object string: '{"small": "...", ...}'
+    - несколько объектов без внешнего []: '{"..."}, {"..."}, {"..."}' (в т.ч. с лишней закрывающей ']')
+    - пустые / None значения -> []
+    """
+    if not raw:
+        return []
+    if isinstance(raw, list):
+        return raw
+    if isinstance(raw, dict):
+        return [raw]
+    if not isinstance(raw, str):
+        return []
+
+    s = raw.strip()
+
+    # 1) Попробовать напрямую распарсить как JSON (самый частый хороший случай)
+    try:
+        parsed = json.loads(s)
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict):
+            return [parsed]
+    except Exception:
+        pass
+
+    # 2) Быстрая очистка: иногда строка имеет лишние начальные/конечные скобки/запятые
+    # убираем одиночные ведущие/хвостовые символы, которые ломают JSON-парсер
+    # (например: leading/trailing comma, лишняя ']' или '[')
+    s_clean = s
+    # удалить одинарные обрамляющие кавычки если они есть
+    if s_clean.startswith('"') and s_clean.endswith('"'):
+        s_clean = s_clean[1:-1].strip()
+
+    # удалить одиночный лишний закрывающий или открывающий bracket в конце/начале
+    s_clean = s_clean.lstrip(' \n\t[').rstrip(' \n\t]')
+
+    # 3) Найти все объекты вида { ... } и собрать их в массив
+    try:
+        objs = []
+        # регулярка найдёт все {...} вместе с вложенными кавычками — достаточно для простых JSON объектов
+        for m in re.finditer(r'\{[^{}]*\}', s_clean):
+            part = m.group(0)
+            try:
+                parsed_part = json.loads(part)
+                objs.append(parsed_part)
+            except Exception:
+                # если не получилось распарсить маленький кусок — пробуем почистить пробелы и повторить
+                try:
+                    parsed_part = json.loads(part.strip().rstrip(','))
+                    objs.append(parsed_part)
+                except Exception:
+                    # не смогли распознать этот объект — пропускаем, но логируем для отладки
+                    logging.debug("safe_parse_preview_list: can't parse object chunk: %r", part)
+                    continue
+
+        if objs:
+            return objs
+    except Exception as ex:
+        logging.debug("safe_parse_preview_list: regex extraction failed: %s", ex)
+
+    # 4) В крайнем случае — попытка найти первый '[' ... ']' и распарсить внутренность
+    try:
+        a = s.index('[')
+        b = s.rindex(']')
+        inner = s[a:b+1]
+        parsed = json.loads(inner)
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict):
+            return [parsed]
+    except Exception:
+        pass
+
+    # 5) Если всё провалилось — вернём пустой список
+    logging.debug("safe_parse_preview_list: cannot parse preview_image_list (fallback empty) raw=%r", s[:200])
+    return []
+
+
+def to_int(value) -> int:
+    """Мягкое приведение числовых полей карточки (None / '' / '12' / 12.0) к int"""
+    if value is None or value == "":
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
+
+
+def to_text(name: str, value) -> str:
+    """Строковое поле карточки; product_name в выгрузке приходит с HTML-сущностями и декодируется один раз здесь"""
+    value = value or ""
+    return html.unescape(value) if name == "product_name" else value
+
+
+def to_float(value) -> float:
+    if value is None or value == "":
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def to_days(values) -> np.ndarray:
+    """Строки дат ('2025-11-09', '2025-11-18 06:17:55.48') -> datetime64[D]; пустые/битые -> NaT"""
+    days = [v[:10] if v else "NaT" for v in values]
+    try:
+        return np.array(days, dtype="datetime64[D]")
+    except ValueError:
+        out = np.empty(len(days), dtype="datetime64[D]")
+        for i, d in enumerate(days):
+            try:
+                out[i] = np.datetime64(d, "D")
+            except ValueError:
+                out[i] = np.datetime64("NaT")
+        return out
@@ -0,0 +1,105 @@
+# backend/niches/price_bands.py
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger("mixai.niches.price_bands")
+
+DEFAULT_BINS = 20
+MAX_BINS = 200
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+# Верхняя граница гистограммы — этот квантиль цены: редкие дорогие карточки не растягивают шкалу
+CLIP_QUANTILE = 0.99
+CACHE_SIZE = 256
+
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _weighted_quantiles(sorted_values: np.ndarray, sorted_weights: np.ndarray, qs) -> list:
+    """Квантили цены, взвешенные выручкой (по накопленной доле веса)"""
+    total = sorted_weights.sum()
+    if total <= 0:
+        return [None] * len(qs)
+    cum = np.cumsum(sorted_weights) / total
+    idx = np.searchsorted(cum, qs, side="left").clip(max=sorted_values.size - 1)
+    return [int(v) for v in sorted_values[idx]]
+
+
+def _bands(price, qty, revenue, edges: np.ndarray) -> list:
+    """Товары, продажи и выручка по диапазонам [edges[i], edges[i+1]) (последний — включительно)"""
+    count, _ = np.histogram(price, bins=edges)
+    qty_sum, _ = np.histogram(price, bins=edges, weights=qty)
+    revenue_sum, _ = np.histogram(price, bins=edges, weights=revenue)
+    total_revenue = revenue.sum()
+    out = []
+    for i in range(count.size):
+        out.append({
+            "min": int(edges[i]),
+            "max": int(edges[i + 1]),
+            "products": int(count[i]),
+            "sales_qty": int(qty_sum[i]),
+            "revenue_amount": int(revenue_sum[i]),
+            "revenue_share": round(float(revenue_sum[i] / total_revenue), 4) if total_revenue > 0 else 0.0,
+            "sales_per_product": round(float(qty_sum[i] / count[i]), 2) if count[i] else 0.0,
+            "revenue_per_product": int(revenue_sum[i] / count[i]) if count[i] else 0,
+        })
+    return out
+
+
+def compute_price_bands(cols, bins: int = DEFAULT_BINS) -> dict:
+    """Распределение цен категории: гистограмма, взвешенная выручкой, квантили и квантильные диапазоны"""
+    price = cols["sale_price"].astype(np.float64)
+    valid = price > 0
+    price = price[valid]
+    qty = cols["sale_qty"].astype(np.float64)[valid]
+    revenue = cols["sale_amount"].astype(np.float64)[valid]
+
+    result = {"category_id": cols.category_id, "products": int(price.size), "bins": bins}
+    if not price.size:
+        return {**result, "quantiles": {}, "revenue_weighted_quantiles": {}, "histogram": [], "quantile_bands": []}
+
+    order = np.argsort(price, kind="stable")
+    sorted_price = price[order]
+    quantiles = np.quantile(sorted_price, QUANTILES)
+    weighted = _weighted_quantiles(sorted_price, revenue[order], QUANTILES)
+
+    lo, hi = float(sorted_price[0]), float(np.quantile(sorted_price, CLIP_QUANTILE))
+    if hi <= lo:
+        hi = float(sorted_price[-1]) if sorted_price[-1] > lo else lo + 1
+    edges = np.histogram_bin_edges(sorted_price, bins=bins, range=(lo, hi))
+    # цены выше CLIP_QUANTILE попадают в последний столбец
+    clipped = np.minimum(price, hi)
+
+    p10, p50, p90 = np.quantile(sorted_price, (0.1, 0.5, 0.9))
+    band_edges = np.unique(np.array([sorted_price[0], p10, p50, p90, sorted_price[-1]]))
+
+    return {
+        **result,
+        "min_price": int(sorted_price[0]),
+        "max_price": int(sorted_price[-1]),
+        "quantiles": {f"p{int(q * 100)}": int(v) for q, v in zip(QUANTILES, quantiles)},
+        "revenue_weighted_quantiles": {f"p{int(q * 100)}": v for q, v in zip(QUANTILES, weighted)},
+        "histogram": _bands(clipped, qty, revenue, edges),
+        "histogram_clipped": int((price > hi).sum()),
+        "quantile_bands": _bands(price, qty, revenue, band_edges) if band_edges.size > 1 else [],
+    }
+
+
+def price_bands(cols, bins: int = DEFAULT_BINS) -> dict:
+    """compute_price_bands с кэшем по (категория, версия данных, bins)"""
+    key = (cols.category_id, cols.version, bins)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+    result = compute_price_bands(cols, bins)
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
@@ -0,0 +1,475 @@
+# backend/niches/product_store.py
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from backend.niches.parsers import safe_parse_preview_list, to_int, to_float, to_days, to_text
+
+logger = logging.getLogger("mixai.niches.store")
+
+# Разрешаем только «коды» категорий, чтобы category_id из URL не мог выйти за пределы каталога
+CATEGORY_ID_RE = re.compile(r"^[\w-]{1,64}$")
+
+# Колонки карточки товара в формате выгрузки Kaspi
+INT_COLUMNS = (
+    "sale_price", "sale_qty", "sale_amount", "merchant_count", "review_qty",
+    "gen_brand_id", "show_order_num", "restrict_type", "amount_abc",
+)
+FLOAT_COLUMNS = ("product_rate", "amount_prc")
+STR_COLUMNS = (
+    "product_code", "product_name", "product_url", "category_ext_id", "category_name",
+    "created_dt", "last_load_dt", "last_sale_date",
+)
+
+# Производные колонки-даты (datetime64[D]) для аналитики
+DATE_COLUMNS = {"last_sale_day": "last_sale_date", "last_load_day": "last_load_dt"}
+
+# Поля, по которым API отдаёт отсортированные страницы
+SORT_KEYS = ("sale_amount", "sale_qty", "sale_price", "product_rate", "created_dt")
+MATCHED_CACHE_SIZE = 32
+# Как часто (сек) frame() сам сверяет файлы категорий с диском; наблюдатель данных сверяет их принудительно
+STAT_INTERVAL = float(os.getenv("NICHES_STAT_INTERVAL", "2"))
+
+
+class ProductColumns:
+    """Колоночное представление одной категории.
+
+    Числовые поля лежат в numpy-массивах, строковые — в списках,
+    brand_name закодирован индексом в self.brands (-1 — бренд не указан),
+    preview_image_list разобран один раз при загрузке.
+    """
+
+    def __init__(self, category_id: str, version: tuple, columns: Dict, brands: list, images: list):
+        self.category_id = category_id
+        self.version = version
+        self.columns = columns
+        self.brands = brands
+        self.images = images
+        self.n = len(images)
+        self.summary = self._compute_summary()
+        self._orders: Dict[str, np.ndarray] = {}
+        self._matched: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def category_name(self) -> Optional[str]:
+        names = self.columns["category_name"]
+        return names[0] if self.n and names[0] else None
+
+    def brand_name(self, i: int) -> Optional[str]:
+        code = int(self.columns["brand_code"][i])
+        return self.brands[code] if code >= 0 else None
+
+    def _compute_summary(self) -> dict:
+        c = self.columns
+        brand_codes = c["brand_code"]
+        return {
+            "total_sales_qty": int(c["sale_qty"].sum()),
+            "total_revenue_amount": int(c["sale_amount"].sum()),
+            "total_products": self.n,
+            # Оценка: сумма merchant_count по карточкам, а не уникальные продавцы
+            "total_sellers_est": int(c["merchant_count"].sum()),
+            "unique_brands": int(np.unique(brand_codes[brand_codes >= 0]).size),
+        }
+
+    def order_index(self, key: str, descending: bool = True) -> np.ndarray:
+        """Предотсортированный массив индексов по полю key (строится один раз на версию файла)"""
+        order = self._orders.get(key)
+        if order is None:
+            values = self.columns[key]
+            if not isinstance(values, np.ndarray):
+                values = np.asarray(list(values), dtype=str)
+            # stable + разворот даёт убывание, при равенстве сохраняется исходный порядок выгрузки
+            order = np.argsort(values[::-1], kind="stable")[::-1]
+            order = (self.n - 1 - order).astype(np.int32)
+            self._orders[key] = order
+        return order if descending else order[::-1]
+
+    def filter_mask(self, price_min=None, price_max=None, brand=None, abc=None, min_reviews=None) -> Optional[np.ndarray]:
+        """Булева маска по фильтрам страницы категории; None — фильтров нет"""
+        c = self.columns
+        mask = None
+
+        def _and(m):
+            nonlocal mask
+            mask = m if mask is None else (mask & m)
+
+        if price_min is not None:
+            _and(c["sale_price"] >= price_min)
+        if price_max is not None:
+            _and(c["sale_price"] <= price_max)
+        if brand:
+            wanted = {b.strip().lower() for b in brand if b and b.strip()}
+            codes = [i for i, name in enumerate(self.brands) if name.lower() in wanted]
+            _and(np.isin(c["brand_code"], codes))
+        if abc:
+            _and(np.isin(c["amount_abc"], list(abc)))
+        if min_reviews is not None:
+            _and(c["review_qty"] >= min_reviews)
+        return mask
+
+    def matched_ranks(self, key: str, descending: bool, filters: dict) -> Optional[np.ndarray]:
+        """Позиции (ранги) в предотсортированном порядке, прошедшие фильтры.
+
+        Результат кэшируется по (сортировка, фильтры), поэтому все страницы,
+        кроме первой, отдаются за O(размер страницы).
+        """
+        cache_key = (key, descending, tuple(sorted((k, str(v)) for k, v in filters.items())))
+        with self._lock:
+            ranks = self._matched.get(cache_key)
+            if ranks is not None:
+                self._matched.move_to_end(cache_key)
+                return ranks
+
+        mask = self.filter_mask(**filters)
+        if mask is None:
+            return None
+        ranks = np.flatnonzero(mask[self.order_index(key, descending)])
+
+        with self._lock:
+            self._matched[cache_key] = ranks
+            while len(self._matched) > MATCHED_CACHE_SIZE:
+                self._matched.popitem(last=False)
+        return ranks
+
+    def page(self, key: str, descending: bool = True, filters: dict = None,
+             offset: int = 0, after_rank: Optional[int] = None, limit: int = 24) -> dict:
+        """Страница индексов товаров.
+
+        after_rank — keyset-курсор: ранг последнего отданного товара в
+        предотсортированном порядке; если задан, offset игнорируется.
+        """
+        order = self.order_index(key, descending)
+        ranks = self.matched_ranks(key, descending, filters or {})
+        if ranks is None:
+            total = self.n
+            start = after_rank + 1 if after_rank is not None else offset
+            page_ranks = np.arange(start, min(start + limit, total))
+            has_more = start + limit < total
+        else:
+            total = int(ranks.size)
+            start = int(np.searchsorted(ranks, after_rank, side="right")) if after_rank is not None else offset
+            page_ranks = ranks[start:start + limit]
+            has_more = start + limit < total
+
+        return {
+            "indices": order[page_ranks] if page_ranks.size else page_ranks,
+            "total": total,
+            "last_rank": int(page_ranks[-1]) if page_ranks.size else None,
+            "has_more": bool(has_more),
+        }
+
+    def record(self, i: int) -> dict:
+        """Собирает карточку в привычном для шаблонов виде (dict как в исходном JSON)"""
+        c = self.columns
+        p = {name: c[name][i] for name in STR_COLUMNS}
+        for name in INT_COLUMNS:
+            p[name] = int(c[name][i])
+        for name in FLOAT_COLUMNS:
+            p[name] = float(c[name][i])
+        p["brand_name"] = self.brand_name(i)
+        p["_images"] = self.images[i]
+        return p
+
+    def records(self, indices=None) -> Iterator[dict]:
+        if indices is None:
+            indices = range(self.n)
+        for i in indices:
+            yield self.record(int(i))
+
+
+def build_columns(category_id: str, lines: list, version: tuple = (0, 0)) -> ProductColumns:
+    """Раскладывает список карточек из выгрузки по колонкам"""
+    n = len(lines)
+    columns = {}
+    for name in INT_COLUMNS:
+        columns[name] = np.fromiter((to_int(p.get(name)) for p in lines), dtype=np.int64, count=n)
+    for name in FLOAT_COLUMNS:
+        columns[name] = np.fromiter((to_float(p.get(name)) for p in lines), dtype=np.float64, count=n)
+    for name in STR_COLUMNS:
+        columns[name] = [to_text(name, p.get(name)) for p in lines]
+    for name, source in DATE_COLUMNS.items():
+        columns[name] = to_days(columns[source])
+
+    brands, brand_ids = [], {}
+    brand_code = np.empty(n, dtype=np.int32)
+    for i, p in enumerate(lines):
+        name = (p.get("brand_name") or "").strip()
+        if not name:
+            brand_code[i] = -1
+            continue
+        code = brand_ids.get(name)
+        if code is None:
+            code = brand_ids[name] = len(brands)
+            brands.append(name)
+        brand_code[i] = code
+    columns["brand_code"] = brand_code
+
+    images = [safe_parse_preview_list(p.get("preview_image_list")) for p in lines]
+    return ProductColumns(category_id, version, columns, brands, images)
+
+
+class ProductFrame:
+    """Все загруженные категории, склеенные в общие колонки для векторной аналитики.
+
+    Товары одной категории лежат подряд: offsets[k]:offsets[k+1] — категория
+    category_ids[k]. Бренды перекодированы в общий словарь brands.
+    cache — место для производных результатов, живущих столько же, сколько кадр.
+    """
+
+    NUMERIC = INT_COLUMNS + FLOAT_COLUMNS + tuple(DATE_COLUMNS)
+
+    def __init__(self, parts: list):
+        self.key = tuple((cols.category_id, cols.version) for cols in parts)
+        self.parts = {cols.category_id: cols for cols in parts}
+        self.category_ids = [cols.category_id for cols in parts]
+        self.category_names = [cols.category_name for cols in parts]
+        sizes = np.array([cols.n for cols in parts], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        self.n = int(self.offsets[-1])
+        self.n_categories = len(parts)
+        self.cat = np.repeat(np.arange(len(parts), dtype=np.int32), sizes)
+
+        self.columns = {}
+        for name in self.NUMERIC:
+            chunks = [cols[name] for cols in parts]
+            self.columns[name] = np.concatenate(chunks) if chunks else np.empty(0)
+
+        # Общий словарь брендов: локальные коды каждой категории -> глобальные
+        brand_ids: Dict[str, int] = {}
+        self.brands: list = []
+        chunks = []
+        for cols in parts:
+            remap = np.empty(len(cols.brands) + 1, dtype=np.int32)
+            remap[-1] = -1
+            for local, name in enumerate(cols.brands):
+                code = brand_ids.get(name)
+                if code is None:
+                    code = brand_ids[name] = len(self.brands)
+                    self.brands.append(name)
+                remap[local] = code
+            chunks.append(remap[cols["brand_code"]])
+        self.columns["brand_code"] = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int32)
+        self.cache: dict = {}
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def locate(self, row: int) -> tuple:
+        """Глобальная строка кадра -> (ProductColumns, локальный индекс)"""
+        k = int(self.cat[row])
+        return self.parts[self.category_ids[k]], int(row - self.offsets[k])
+
+
+def _stat_version(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def read_product_lines(path: Path) -> Optional[list]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        logger.exception("Не удалось прочитать файл товаров %s", path)
+        return None
+    try:
+        return data.get("products", {}).get("lines", []) or []
+    except Exception:
+        return []
+
+
+class ProductStore:
+    """Кэш категорий в колоночном виде.
+
+    Каждая категория загружается один раз и перечитывается только
+    когда у файла меняется mtime/размер. Если в compiled_dir лежит
+    собранный из того же JSON файл .ncol (см. backend/niches/ingest.py),
+    категория открывается через mmap вместо json.load. Если там есть
+    поколения с указателем CURRENT, файлы берутся из текущего поколения.
+
+    Свежесть всех файлов сразу проверяет только scan(): не чаще
+    STAT_INTERVAL (или принудительно из наблюдателя данных) и с ростом
+    revision при любых изменениях. frame() отдаёт готовый кадр, пока
+    revision не изменилась, не трогая файловую систему.
+    """
+
+    def __init__(self, products_dir, compiled_dir=None):
+        self.products_dir = Path(products_dir)
+        self.compiled_dir = Path(compiled_dir) if compiled_dir else None
+        self._generation = None
+        if self.compiled_dir is not None:
+            from backend.niches.generations import GenerationPointer
+            self._generation = GenerationPointer(self.compiled_dir)
+        self._cache: Dict[str, ProductColumns] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._frame: Optional[ProductFrame] = None
+        self._frame_revision = -1
+        self._versions: Dict[str, tuple] = {}
+        self._scanned_at = float("-inf")
+        self._scan_lock = threading.Lock()
+        self.revision = 0
+        # путь .ncol -> (его версия, версия JSON, из которого он собран) — чтобы не читать заголовок на каждый запрос
+        self._compiled_sources: Dict[Path, tuple] = {}
+
+    def path_for(self, category_id: str) -> Optional[Path]:
+        if not CATEGORY_ID_RE.match(str(category_id)):
+            return None
+        return self.products_dir / f"{category_id}.json"
+
+    def compiled_dir_current(self) -> Optional[Path]:
+        """Каталог текущего поколения .ncol (см. backend/niches/generations.py)"""
+        return self._generation.directory() if self._generation is not None else None
+
+    def compiled_path_for(self, category_id: str) -> Optional[Path]:
+        directory = self.compiled_dir_current()
+        if directory is None or not CATEGORY_ID_RE.match(str(category_id)):
+            return None
+        from backend.niches.colfile import SUFFIX
+        return directory / f"{category_id}{SUFFIX}"
+
+    def category_ids(self) -> list:
+        ids = set()
+        if self.products_dir.exists():
+            ids.update(p.stem for p in self.products_dir.glob("*.json"))
+        directory = self.compiled_dir_current()
+        if directory is not None and directory.exists():
+            from backend.niches.colfile import SUFFIX
+            ids.update(p.stem for p in directory.glob(f"*{SUFFIX}"))
+        return sorted(ids)
+
+    def _lock_for(self, category_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(category_id, threading.Lock())
+
+    def _resolve(self, category_id: str) -> Optional[tuple]:
+        """Какой файл читать: (путь, версия, compiled?) или None, если категории нет"""
+        json_path = self.path_for(category_id)
+        if json_path is None:
+            return None
+        json_version = _stat_version(json_path)
+
+        compiled_path = self.compiled_path_for(category_id)
+        compiled_version = _stat_version(compiled_path) if compiled_path is not None else None
+        if compiled_version is None and compiled_path is not None:
+            self._compiled_sources.pop(compiled_path, None)
+        if compiled_version is not None:
+            known = self._compiled_sources.get(compiled_path)
+            if known is not None and known[0] == compiled_version:
+                source = known[1]
+            else:
+                # Новая версия файла по этому пути вытесняет прежнюю запись
+                from backend.niches.colfile import source_version
+                meta = source_version(compiled_path) or {}
+                source = (meta.get("mtime_ns"), meta.get("size"))
+                self._compiled_sources[compiled_path] = (compiled_version, source)
+            # .ncol, собранный из устаревшего JSON, игнорируем
+            if json_version is None or source == json_version:
+                return compiled_path, compiled_version, True
+
+        if json_version is None:
+            return None
+        return json_path, json_version, False
+
+    def scan(self, force: bool = False) -> int:
+        """Сверяет версии файлов всех категорий с диском (не чаще STAT_INTERVAL); возвращает revision"""
+        if not force and time.monotonic() - self._scanned_at < STAT_INTERVAL:
+            return self.revision
+        with self._scan_lock:
+            if not force and time.monotonic() - self._scanned_at < STAT_INTERVAL:
+                return self.revision
+            versions = {}
+            for category_id in self.category_ids():
+                resolved = self._resolve(category_id)
+                if resolved is not None:
+                    versions[category_id] = resolved[1]
+            # Записи о .ncol прежних поколений больше не понадобятся
+            directory = self.compiled_dir_current()
+            self._compiled_sources = {path: entry for path, entry in list(self._compiled_sources.items())
+                                      if path.parent == directory}
+            if versions != self._versions:
+                self._versions = versions
+                self.revision += 1
+            self._scanned_at = time.monotonic()
+            return self.revision
+
+    def versions(self) -> Dict[str, tuple]:
+        """Версии файлов категорий на момент последнего scan()"""
+        return self._versions
+
+    def version_of(self, category_id: str) -> Optional[tuple]:
+        """Версия файла, из которого сейчас читается категория (без загрузки)"""
+        resolved = self._resolve(category_id)
+        return resolved[1] if resolved is not None else None
+
+    def get(self, category_id: str) -> Optional[ProductColumns]:
+        resolved = self._resolve(category_id)
+        if resolved is None:
+            self._cache.pop(category_id, None)
+            return None
+
+        path, version, compiled = resolved
+        cached = self._cache.get(category_id)
+        if cached is not None and cached.version == version:
+            return cached
+
+        # Один поток грузит категорию, остальные ждут и берут готовый результат
+        with self._lock_for(category_id):
+            cached = self._cache.get(category_id)
+            if cached is not None and cached.version == version:
+                return cached
+            if compiled:
+                from backend.niches.colfile import read_columns
+                try:
+                    cols = read_columns(path, category_id, version)
+                except (OSError, ValueError):
+                    logger.exception("Не удалось открыть %s", path)
+                    return None
+            else:
+                lines = read_product_lines(path)
+                if lines is None:
+                    return None
+                cols = build_columns(category_id, lines, version)
+            self._cache[category_id] = cols
+            logger.info("products loaded: category=%s, %d items (%s)", category_id, cols.n, path.name)
+            return cols
+
+    def load_all(self) -> Dict[str, ProductColumns]:
+        out = {}
+        for category_id in self.category_ids():
+            cols = self.get(category_id)
+            if cols is not None:
+                out[category_id] = cols
+        return out
+
+    def frame(self) -> ProductFrame:
+        """Склеенный кадр по всем категориям; пересобирается, только если сменилась версия какой-то категории"""
+        revision = self.scan()
+        frame = self._frame
+        if frame is not None and self._frame_revision == revision:
+            return frame
+        parts = list(self.load_all().values())
+        key = tuple((cols.category_id, cols.version) for cols in parts)
+        if frame is None or frame.key != key:
+            frame = ProductFrame(parts)
+        self._frame, self._frame_revision = frame, revision
+        return frame
@@ -0,0 +1,90 @@
+# backend/niches/rollups.py
+
+import logging
+from typing import Dict
+
+from backend.niches.parsers import to_int
+
+logger = logging.getLogger("mixai.niches.rollups")
+
+
+def iter_children(node: dict) -> list:
+    """Дети узла дерева: items бывает списком или обёрткой {"success", "data"}"""
+    items = node.get("items") or []
+    if isinstance(items, dict):
+        items = items.get("data") or []
+    return items if isinstance(items, list) else []
+
+
+def build_rollups(index, store) -> Dict[str, dict]:
+    """Считает агрегаты для каждого узла дерева категорий за один проход снизу вверх.
+
+    Узлы берутся из CategoryIndex и агрегаты лежат под его каноническими id,
+    так что категория, запрошенная по любому альтернативному id, находит свой
+    rollup через index.resolve. Выручка и продажи листа берутся из самого
+    дерева, товары/бренды/продавцы — из файла товаров категории (под любым
+    из её id). Для внутренних узлов значения суммируются по детям, бренды
+    объединяются множеством.
+    """
+    products = store.load_all()
+    rollups: Dict[str, dict] = {}
+    brand_sets: Dict[str, set] = {}
+
+    # Итеративный post-order обход: узел обрабатывается после всех своих детей
+    stack = [(category_id, False) for category_id in reversed(index.roots)]
+    while stack:
+        category_id, children_done = stack.pop()
+        child_ids = index.children[category_id]
+        if not children_done:
+            stack.append((category_id, True))
+            stack.extend((child, False) for child in reversed(child_ids))
+            continue
+
+        node = index.nodes[category_id]
+        if child_ids:
+            child_rollups = [rollups[cid] for cid in child_ids]
+            rollup = {
+                "children_count": len(child_ids),
+                "leaf_count": sum(r["leaf_count"] for r in child_rollups),
+                "total_revenue_amount": sum(r["total_revenue_amount"] for r in child_rollups),
+                "total_sales_qty": sum(r["total_sales_qty"] for r in child_rollups),
+                "total_products": sum(r["total_products"] for r in child_rollups),
+                "total_sellers_est": sum(r["total_sellers_est"] for r in child_rollups),
+                "categories_with_products": sum(r["categories_with_products"] for r in child_rollups),
+            }
+            brands = set()
+            for cid in child_ids:
+                brands |= brand_sets.pop(cid, set())
+        else:
+            cols = next((products[i] for i in index.ids(category_id) if i in products), None)
+            rollup = {
+                "children_count": 0,
+                "leaf_count": 1,
+                "total_revenue_amount": to_int(node.get("sale_amount")),
+                "total_sales_qty": to_int(node.get("sale_qty")),
+                "total_products": cols.n if cols is not None else 0,
+                "total_sellers_est": cols.summary["total_sellers_est"] if cols is not None else 0,
+                "categories_with_products": 1 if cols is not None else 0,
+            }
+            brands = set(cols.brands) if cols is not None else set()
+
+        rollup["unique_brands"] = len(brands)
+        brand_sets[category_id] = brands
+        rollups[category_id] = rollup
+
+    logger.info("category rollups built: %d nodes", len(rollups))
+    return rollups
+
+
+def attach_rollups(categories: list, rollups: Dict[str, dict], index) -> list:
+    """Копия дерева, в которой у каждого узла есть поле rollup (исходное дерево не меняется)"""
+    def _copy(node):
+        c = dict(node)
+        key = index.key_of(node)
+        c["rollup"] = rollups.get(key) if key is not None else None
+        children = iter_children(node)
+        if children:
+            c["items"] = [_copy(child) for child in children]
+        return c
+
+    return [_copy(node) for node in categories]
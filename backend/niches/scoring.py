@@ -0,0 +1,175 @@
+# backend/niches/scoring.py
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("mixai.niches.scoring")
+
+TOP_PRODUCTS = 10
+
+# Вклад метрик в итоговый скор ниши (знак: +1 — чем больше, тем лучше для входа в нишу)
+SCORE_WEIGHTS = {
+    "total_revenue_amount": (0.25, +1),
+    "revenue_per_merchant": (0.25, +1),
+    "brand_hhi": (0.2, -1),
+    "top10_share": (0.15, -1),
+    "days_since_last_sale": (0.15, -1),
+}
+
+# Числовые поля строки niche_scores, по которым API разрешает сортировку
+SORT_FIELDS = (
+    "score", "total_products", "total_revenue_amount", "total_sales_qty", "total_sellers_est",
+    "unique_brands", "revenue_per_merchant", "sales_per_product", "brand_hhi", "top_brand_share",
+    "top10_share", "median_price", "price_p25", "price_p75", "price_spread", "days_since_last_sale",
+)
+
+
+def _group_quantile(sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Квантиль (линейная интерполяция) по группам, лежащим подряд в отсортированном массиве"""
+    out = np.full(counts.size, np.nan)
+    ok = counts > 0
+    pos = starts[ok] + q * (counts[ok] - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    frac = pos - lo
+    out[ok] = sorted_values[lo] * (1 - frac) + sorted_values[hi] * frac
+    return out
+
+
+def _percentile_rank(values: np.ndarray) -> np.ndarray:
+    """Ранг категории среди остальных в [0, 1]; равные значения получают средний ранг"""
+    if values.size <= 1:
+        return np.ones(values.size)
+    sorted_values = np.sort(values)
+    lo = np.searchsorted(sorted_values, values, side="left")
+    hi = np.searchsorted(sorted_values, values, side="right") - 1
+    return (lo + hi) / 2 / (values.size - 1)
+
+
+def compute_niche_metrics(frame) -> dict:
+    """Метрики всех категорий кадра за один векторный проход (без циклов по товарам).
+
+    Возвращает dict колонок длиной frame.n_categories.
+    """
+    k = frame.n_categories
+    cat = frame.cat
+    starts = frame.offsets[:-1]
+    counts = np.diff(frame.offsets)
+
+    revenue = frame["sale_amount"].astype(np.float64)
+    qty = frame["sale_qty"].astype(np.float64)
+    price = frame["sale_price"].astype(np.float64)
+
+    cat_revenue = np.bincount(cat, weights=revenue, minlength=k)
+    cat_qty = np.bincount(cat, weights=qty, minlength=k)
+    merchants = np.bincount(cat, weights=frame["merchant_count"].astype(np.float64), minlength=k)
+
+    # Концентрация брендов: HHI по долям выручки брендов внутри категории
+    brand = frame["brand_code"]
+    branded = brand >= 0
+    n_brands = max(len(frame.brands), 1)
+    pair = cat[branded].astype(np.int64) * n_brands + brand[branded]
+    pairs, inverse = np.unique(pair, return_inverse=True)
+    pair_revenue = np.bincount(inverse, weights=revenue[branded], minlength=pairs.size)
+    pair_cat = (pairs // n_brands).astype(np.int64)
+    branded_revenue = np.bincount(pair_cat, weights=pair_revenue, minlength=k)
+    share = np.divide(pair_revenue, branded_revenue[pair_cat], out=np.zeros_like(pair_revenue),
+                      where=branded_revenue[pair_cat] > 0)
+    brand_hhi = np.bincount(pair_cat, weights=share ** 2, minlength=k)
+    top_brand_share = np.zeros(k)
+    np.maximum.at(top_brand_share, pair_cat, share)
+    unique_brands = np.bincount(pair_cat, minlength=k)
+
+    # Доля топ-10 товаров в выручке: сортируем внутри категорий по убыванию выручки
+    by_revenue = np.lexsort((-revenue, cat))
+    rank_in_cat = np.arange(frame.n) - starts[cat[by_revenue]]
+    top_mask = rank_in_cat < TOP_PRODUCTS
+    top_revenue = np.bincount(cat[by_revenue][top_mask], weights=revenue[by_revenue][top_mask], minlength=k)
+
+    # Цена: медиана и межквартильный размах внутри категории
+    by_price = np.lexsort((price, cat))
+    sorted_price = price[by_price]
+    p25 = _group_quantile(sorted_price, starts, counts, 0.25)
+    median_price = _group_quantile(sorted_price, starts, counts, 0.5)
+    p75 = _group_quantile(sorted_price, starts, counts, 0.75)
+
+    # ABC-распределение (amount_abc: 1=A, 2=B, 3=C, прочее -> 0)
+    abc = frame["amount_abc"]
+    abc = np.where((abc >= 1) & (abc <= 3), abc, 0)
+    abc_counts = np.bincount(cat.astype(np.int64) * 4 + abc, minlength=k * 4).reshape(k, 4)
+
+    # Давность последней продажи относительно даты выгрузки категории
+    nat = np.iinfo(np.int64).min
+    last_sale = frame["last_sale_day"].astype("datetime64[D]").astype(np.int64)
+    last_load = frame["last_load_day"].astype("datetime64[D]").astype(np.int64)
+    latest_sale = np.full(k, nat, dtype=np.int64)
+    latest_load = np.full(k, nat, dtype=np.int64)
+    np.maximum.at(latest_sale, cat, last_sale)
+    np.maximum.at(latest_load, cat, last_load)
+    known = (latest_sale != nat) & (latest_load != nat)
+    days_since_last_sale = np.full(k, np.nan)
+    days_since_last_sale[known] = (latest_load[known] - latest_sale[known]).clip(min=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "total_products": counts,
+            "total_revenue_amount": cat_revenue,
+            "total_sales_qty": cat_qty,
+            "total_sellers_est": merchants,
+            "unique_brands": unique_brands,
+            "revenue_per_merchant": np.where(merchants > 0, cat_revenue / merchants, 0.0),
+            "sales_per_product": np.where(counts > 0, cat_qty / counts, 0.0),
+            "brand_hhi": brand_hhi,
+            "top_brand_share": top_brand_share,
+            "top10_share": np.where(cat_revenue > 0, top_revenue / cat_revenue, 0.0),
+            "median_price": median_price,
+            "price_p25": p25,
+            "price_p75": p75,
+            "price_spread": np.where(median_price > 0, (p75 - p25) / median_price, np.nan),
+            "abc_share": abc_counts[:, 1:] / np.maximum(counts, 1)[:, None],
+            "days_since_last_sale": days_since_last_sale,
+        }
+
+
+def compute_scores(metrics: dict) -> np.ndarray:
+    """Итоговый скор 0..100: взвешенная сумма перцентильных рангов метрик"""
+    k = metrics["total_products"].size
+    score = np.zeros(k)
+    for name, (weight, sign) in SCORE_WEIGHTS.items():
+        values = np.nan_to_num(metrics[name].astype(np.float64), nan=np.inf if sign < 0 else -np.inf)
+        rank = _percentile_rank(values)
+        score += weight * (rank if sign > 0 else 1 - rank)
+    score[metrics["total_products"] == 0] = 0
+    return np.round(score * 100, 2)
+
+
+def _num(value, digits=4):
+    value = float(value)
+    if np.isnan(value):
+        return None
+    return int(value) if value.is_integer() else round(value, digits)
+
+
+def niche_scores(frame) -> list:
+    """Ранжированный список ниш (кэшируется на кадре, т.е. до смены данных)"""
+    cached = frame.cache.get("niche_scores")
+    if cached is not None:
+        return cached
+
+    metrics = compute_niche_metrics(frame)
+    scores = compute_scores(metrics)
+    rows = []
+    for k, category_id in enumerate(frame.category_ids):
+        abc = metrics["abc_share"][k]
+        rows.append({
+            "category_id": category_id,
+            "category_name": frame.category_names[k],
+            "score": _num(scores[k], 2),
+            **{name: _num(values[k]) for name, values in metrics.items() if name != "abc_share"},
+            "abc_share": {"A": _num(abc[0]), "B": _num(abc[1]), "C": _num(abc[2])},
+        })
+    rows.sort(key=lambda r: -r["score"])
+    frame.cache["niche_scores"] = rows
+    logger.info("niche scores computed: %d categories", len(rows))
+    return rows
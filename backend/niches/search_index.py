@@ -0,0 +1,261 @@
+# backend/niches/search_index.py
+
+import re
+import math
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("mixai.niches.search")
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Нечёткий поиск: сколько похожих слов словаря подставлять вместо слова с опечаткой
+FUZZY_MIN_SIMILARITY = 0.45
+FUZZY_MAX_EXPANSIONS = 3
+
+# Как часто (сек) сверять индекс с файлами категорий
+SYNC_INTERVAL = 5.0
+
+
+def normalize_text(text: str) -> str:
+    return (text or "").casefold().replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(normalize_text(text))
+
+
+def trigrams(token: str) -> set:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Segment:
+    """Инвертированный индекс одной категории: token -> (локальные id, tf)"""
+
+    def __init__(self, cols):
+        self.cols = cols
+        self.version = cols.version
+        names = cols["product_name"]
+        self.names = names
+
+        postings = defaultdict(list)
+        doc_len = np.zeros(cols.n, dtype=np.float32)
+        for i, name in enumerate(names):
+            counts = Counter(tokenize(name))
+            doc_len[i] = sum(counts.values())
+            for token, tf in counts.items():
+                postings[token].append((i, tf))
+
+        self.doc_len = doc_len
+        self.postings: Dict[str, tuple] = {}
+        for token, pairs in postings.items():
+            arr = np.asarray(pairs, dtype=np.int32)
+            self.postings[token] = (arr[:, 0], arr[:, 1].astype(np.float32))
+
+    @property
+    def n(self) -> int:
+        return self.cols.n
+
+
+class _View:
+    """Неизменяемый снимок индекса: search() читает его без блокировки"""
+
+    __slots__ = ("segments", "df", "trigram_index", "total_docs", "total_len")
+
+    def __init__(self, segments=None, df=None, trigram_index=None, total_docs=0, total_len=0.0):
+        self.segments: Dict[str, _Segment] = segments if segments is not None else {}
+        self.df: Counter = df if df is not None else Counter()
+        # trigram -> слова словаря (множества не меняются после публикации)
+        self.trigram_index: Dict[str, frozenset] = trigram_index if trigram_index is not None else {}
+        self.total_docs = total_docs
+        self.total_len = total_len
+
+
+class ProductSearchIndex:
+    """Полнотекстовый индекс по product_name всех категорий с BM25 и триграммами для опечаток.
+
+    Индекс состоит из сегментов по категориям: при изменении файла
+    пересобирается только сегмент этой категории, глобальные df/словарь
+    обновляются инкрементально. sync() собирает новый _View и публикует его
+    одной заменой ссылки, поэтому поиск никогда не видит наполовину
+    обновлённое состояние.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._view = _View()
+        # token -> число сегментов, где он встречается (только для sync, под _lock)
+        self._vocab_refs: Counter = Counter()
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+
+    @property
+    def segments(self) -> Dict[str, _Segment]:
+        return self._view.segments
+
+    @property
+    def total_docs(self) -> int:
+        return self._view.total_docs
+
+    # ---- Построение ----
+    def sync(self, force: bool = False):
+        """Сверяет сегменты с файлами категорий (не чаще SYNC_INTERVAL)"""
+        now = time.monotonic()
+        if not force and now - self._last_sync < SYNC_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._last_sync < SYNC_INTERVAL:
+                return
+            current = self._view
+            ids = set(self.store.category_ids())
+            changes = []
+            for category_id in ids:
+                cols = self.store.get(category_id)
+                if cols is None:
+                    continue
+                segment = current.segments.get(category_id)
+                if segment is None or segment.version != cols.version:
+                    changes.append((category_id, _Segment(cols)))
+            for category_id in set(current.segments) - ids:
+                changes.append((category_id, None))
+            if changes:
+                view = _View(dict(current.segments), Counter(current.df), dict(current.trigram_index),
+                             current.total_docs, current.total_len)
+                for category_id, segment in changes:
+                    self._replace(view, category_id, segment)
+                self._view = view
+            self._last_sync = time.monotonic()
+
+    def _replace(self, view: _View, category_id: str, segment: Optional[_Segment]):
+        old = view.segments.get(category_id)
+        if old is not None:
+            self._account(view, old, -1)
+        if segment is not None:
+            self._account(view, segment, +1)
+            view.segments[category_id] = segment
+        else:
+            view.segments.pop(category_id, None)
+        logger.info("search segment %s: %s", category_id, "updated" if segment else "removed")
+
+    def _account(self, view: _View, segment: _Segment, sign: int):
+        view.total_docs += sign * segment.n
+        view.total_len += sign * float(segment.doc_len.sum())
+        trigram_index = view.trigram_index
+        for token, (ids, _) in segment.postings.items():
+            view.df[token] += sign * int(ids.size)
+            self._vocab_refs[token] += sign
+            if sign > 0 and self._vocab_refs[token] == 1:
+                for tri in trigrams(token):
+                    trigram_index[tri] = trigram_index.get(tri, frozenset()) | {token}
+            elif sign < 0 and self._vocab_refs[token] <= 0:
+                del self._vocab_refs[token]
+                del view.df[token]
+                for tri in trigrams(token):
+                    bucket = trigram_index.get(tri)
+                    if bucket is not None:
+                        bucket = bucket - {token}
+                        if bucket:
+                            trigram_index[tri] = bucket
+                        else:
+                            del trigram_index[tri]
+
+    # ---- Поиск ----
+    def expand(self, token: str, view: Optional[_View] = None) -> List[tuple]:
+        """Слово запроса -> [(слово словаря, вес)]; при отсутствии точного совпадения — похожие по триграммам"""
+        view = view or self._view
+        if view.df.get(token):
+            return [(token, 1.0)]
+        grams = trigrams(token)
+        overlap = Counter()
+        for tri in grams:
+            for candidate in view.trigram_index.get(tri, ()):
+                overlap[candidate] += 1
+        scored = []
+        for candidate, common in overlap.items():
+            sim = common / (len(grams) + len(trigrams(candidate)) - common)
+            if sim >= FUZZY_MIN_SIMILARITY:
+                scored.append((candidate, sim))
+        scored.sort(key=lambda x: -x[1])
+        return scored[:FUZZY_MAX_EXPANSIONS]
+
+    def search(self, query: str, limit: int = 20, categories: Optional[List[str]] = None,
+               brands: Optional[List[str]] = None) -> dict:
+        view = self._view
+        terms = []
+        for token in dict.fromkeys(tokenize(query)):
+            terms.extend(self.expand(token, view))
+        if not terms or not view.total_docs:
+            return {"total": 0, "items": []}
+
+        avgdl = view.total_len / view.total_docs
+        idf = {
+            t: math.log(1 + (view.total_docs - view.df[t] + 0.5) / (view.df[t] + 0.5))
+            for t, _ in terms
+        }
+        wanted_brands = {b.strip().lower() for b in brands or [] if b and b.strip()}
+
+        hits_scores, hits_refs = [], []
+        segments = view.segments
+        segment_ids = [c for c in categories if c in segments] if categories else list(segments)
+        for category_id in segment_ids:
+            seg = segments.get(category_id)
+            if seg is None:
+                continue
+            scores = None
+            for token, weight in terms:
+                posting = seg.postings.get(token)
+                if posting is None:
+                    continue
+                ids, tf = posting
+                if scores is None:
+                    scores = np.zeros(seg.n, dtype=np.float32)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * seg.doc_len[ids] / avgdl)
+                scores[ids] += weight * idf[token] * tf * (BM25_K1 + 1) / (tf + norm)
+            if scores is None:
+                continue
+            if wanted_brands:
+                codes = [i for i, name in enumerate(seg.cols.brands) if name.lower() in wanted_brands]
+                scores[~np.isin(seg.cols["brand_code"], codes)] = 0
+            local = np.flatnonzero(scores)
+            if local.size:
+                hits_scores.append(scores[local])
+                hits_refs.append((category_id, seg, local))
+
+        if not hits_scores:
+            return {"total": 0, "items": []}
+
+        all_scores = np.concatenate(hits_scores)
+        seg_of = np.concatenate([np.full(local.size, k, dtype=np.int32) for k, (_, _, local) in enumerate(hits_refs)])
+        local_of = np.concatenate([local for _, _, local in hits_refs])
+
+        k = min(limit, all_scores.size)
+        top = np.argpartition(-all_scores, k - 1)[:k]
+        top = top[np.argsort(-all_scores[top], kind="stable")]
+
+        items = []
+        for pos in top:
+            category_id, seg, _ = hits_refs[seg_of[pos]]
+            i = int(local_of[pos])
+            images = seg.cols.images[i]
+            items.append({
+                "category_id": category_id,
+                "product_code": seg.cols["product_code"][i],
+                "product_name": seg.names[i],
+                "brand_name": seg.cols.brand_name(i),
+                "sale_price": int(seg.cols["sale_price"][i]),
+                "sale_amount": int(seg.cols["sale_amount"][i]),
+                "product_url": seg.cols["product_url"][i],
+                "image": (images[0].get("small") if images and isinstance(images[0], dict) else None),
+                "score": round(float(all_scores[pos]), 4),
+            })
+        return {"total": int(all_scores.size), "items": items}
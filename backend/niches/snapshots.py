@@ -0,0 +1,249 @@
+# backend/niches/snapshots.py
+
+import os
+import json
+import shutil
+import logging
+import argparse
+import threading
+from pathlib import Path
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("mixai.niches.snapshots")
+
+# Колонки, которые сохраняются в каждом снимке (product_code — ключ, отсортирован)
+SNAPSHOT_COLUMNS = {
+    "sale_qty": np.int64,
+    "sale_amount": np.int64,
+    "sale_price": np.int64,
+    "merchant_count": np.int32,
+    "review_qty": np.int32,
+    "product_rate": np.float32,
+}
+DELTA_COLUMNS = ("sale_qty", "sale_amount", "sale_price", "merchant_count", "review_qty")
+TOP_MOVERS = 10
+
+
+class Snapshot:
+    """Один датированный снимок: колонки открыты через np.load(mmap_mode='r'), без копирования в память"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.date = date.fromisoformat(self.meta["date"])
+        self.categories: List[str] = self.meta["categories"]
+        self.product_code = np.load(path / "product_code.npy", mmap_mode="r")
+        self.category = np.load(path / "category.npy", mmap_mode="r")
+        self.columns = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in SNAPSHOT_COLUMNS}
+
+    @property
+    def n(self) -> int:
+        return int(self.product_code.shape[0])
+
+    def find(self, codes: np.ndarray) -> tuple:
+        """Позиции кодов в снимке (бинарный поиск по отсортированному ключу) и маска найденных"""
+        pos = np.searchsorted(self.product_code, codes)
+        pos_clipped = np.minimum(pos, max(self.n - 1, 0))
+        found = (pos < self.n) & (self.product_code[pos_clipped] == codes) if self.n else np.zeros(codes.shape, bool)
+        return pos_clipped, found
+
+    def category_rows(self, category_id: str) -> np.ndarray:
+        try:
+            k = self.categories.index(category_id)
+        except ValueError:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.category == k)
+
+
+class SnapshotHistory:
+    """Append-only история выгрузок: history_dir/<YYYY-MM-DD>/{meta.json, *.npy}"""
+
+    def __init__(self, history_dir):
+        self.history_dir = Path(history_dir)
+        self._open: Dict[str, Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def dates(self) -> List[str]:
+        if not self.history_dir.exists():
+            return []
+        return sorted(p.name for p in self.history_dir.iterdir() if (p / "meta.json").exists())
+
+    def get(self, day: str) -> Optional[Snapshot]:
+        snap = self._open.get(day)
+        if snap is not None:
+            return snap
+        path = self.history_dir / day
+        if day not in self.dates():
+            return None
+        with self._lock:
+            snap = self._open.get(day)
+            if snap is None:
+                snap = self._open[day] = Snapshot(path)
+        return snap
+
+    def resolve_pair(self, date_from: Optional[str], date_to: Optional[str]) -> tuple:
+        """По умолчанию сравниваем два последних снимка"""
+        days = self.dates()
+        if len(days) < 2 and not (date_from and date_to):
+            return None, None
+        date_to = date_to or days[-1]
+        if not date_from:
+            earlier = [d for d in days if d < date_to]
+            date_from = earlier[-1] if earlier else None
+        if not date_from:
+            return None, None
+        return self.get(date_from), self.get(date_to)
+
+    # ---- Запись ----
+    def ingest(self, store, day: Optional[str] = None) -> Path:
+        """Добавляет текущие файлы категорий как снимок за дату day.
+
+        По умолчанию дата берётся из last_load_dt выгрузки. Существующий
+        снимок не перезаписывается — история только дополняется.
+        """
+        parts = list(store.load_all().values())
+        if not parts:
+            raise ValueError("Нет файлов категорий для снимка")
+
+        if day is None:
+            loads = np.concatenate([cols["last_load_day"] for cols in parts])
+            loads = loads[~np.isnat(loads)]
+            day = str(loads.max()) if loads.size else date.today().isoformat()
+        day = date.fromisoformat(day).isoformat()
+
+        target = self.history_dir / day
+        if target.exists():
+            raise FileExistsError(f"Снимок за {day} уже существует: {target}")
+
+        codes = np.char.encode(np.concatenate([np.asarray(cols["product_code"], dtype=str) for cols in parts]), "utf-8")
+        category = np.repeat(np.arange(len(parts), dtype=np.int32), [cols.n for cols in parts])
+        # Один товар может встречаться в нескольких категориях — оставляем первое вхождение
+        codes, first = np.unique(codes, return_index=True)
+
+        tmp = self.history_dir / f".{day}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "product_code.npy", codes)
+        np.save(tmp / "category.npy", category[first])
+        for name, dtype in SNAPSHOT_COLUMNS.items():
+            values = np.concatenate([np.asarray(cols[name]) for cols in parts]).astype(dtype)
+            np.save(tmp / f"{name}.npy", values[first])
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "date": day,
+                "categories": [cols.category_id for cols in parts],
+                "products": int(codes.size),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }, f, ensure_ascii=False)
+        os.rename(tmp, target)
+        logger.info("snapshot %s written: %d products, %d categories", day, codes.size, len(parts))
+        return target
+
+    # ---- Запросы ----
+    def product_series(self, product_code: str) -> list:
+        key = np.array([product_code.encode()])
+        series = []
+        for day in self.dates():
+            snap = self.get(day)
+            pos, found = snap.find(key)
+            if found[0]:
+                i = int(pos[0])
+                series.append({"date": day, **{name: _py(snap.columns[name][i]) for name in SNAPSHOT_COLUMNS}})
+        return series
+
+    def product_delta(self, product_code: str, date_from: str = None, date_to: str = None) -> Optional[dict]:
+        a, b = self.resolve_pair(date_from, date_to)
+        if a is None or b is None:
+            return None
+        key = np.array([product_code.encode()])
+        pos_a, found_a = a.find(key)
+        pos_b, found_b = b.find(key)
+        if not (found_a[0] and found_b[0]):
+            return None
+        days = max((b.date - a.date).days, 1)
+        ia, ib = int(pos_a[0]), int(pos_b[0])
+        out = {"product_code": product_code, "date_from": a.meta["date"], "date_to": b.meta["date"], "days": days}
+        for name in DELTA_COLUMNS:
+            va, vb = _py(a.columns[name][ia]), _py(b.columns[name][ib])
+            out[name] = {"from": va, "to": vb, "delta": vb - va, "per_day": round((vb - va) / days, 4)}
+        return out
+
+    def category_delta(self, category_id: str, date_from: str = None, date_to: str = None) -> Optional[dict]:
+        """Изменения по категории между снимками: итоги, темпы в день и самые быстрорастущие товары"""
+        a, b = self.resolve_pair(date_from, date_to)
+        if a is None or b is None:
+            return None
+        rows_a, rows_b = a.category_rows(category_id), b.category_rows(category_id)
+        if not rows_a.size and not rows_b.size:
+            return None
+        days = max((b.date - a.date).days, 1)
+
+        codes_b = b.product_code[rows_b]
+        pos_a, found = a.find(codes_b)
+        in_a = found & np.isin(pos_a, rows_a)
+        both_b, both_a = rows_b[in_a], pos_a[in_a]
+
+        totals = {}
+        for name in ("sale_qty", "sale_amount", "merchant_count"):
+            ta, tb = int(a.columns[name][rows_a].sum()), int(b.columns[name][rows_b].sum())
+            totals[name] = {"from": ta, "to": tb, "delta": tb - ta, "per_day": round((tb - ta) / days, 4)}
+
+        price_a = a.columns["sale_price"][both_a].astype(np.float64)
+        price_b = b.columns["sale_price"][both_b].astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            price_change = np.where(price_a > 0, price_b / price_a - 1, np.nan)
+        price_change = price_change[~np.isnan(price_change)]
+
+        qty_delta = b.columns["sale_qty"][both_b].astype(np.int64) - a.columns["sale_qty"][both_a]
+        movers = np.argsort(-qty_delta, kind="stable")[:TOP_MOVERS]
+        return {
+            "category_id": category_id,
+            "date_from": a.meta["date"],
+            "date_to": b.meta["date"],
+            "days": days,
+            "products": {"from": int(rows_a.size), "to": int(rows_b.size),
+                         "added": int(rows_b.size - in_a.sum()), "removed": int(rows_a.size - in_a.sum())},
+            **totals,
+            "median_price_change": _py(np.median(price_change)) if price_change.size else None,
+            "top_movers": [{
+                "product_code": codes_b[in_a][i].decode(),
+                "sale_qty_delta": int(qty_delta[i]),
+                "sale_qty_per_day": round(float(qty_delta[i]) / days, 4),
+            } for i in movers],
+        }
+
+
+def _py(value):
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float):
+        return None if value != value else round(value, 6)
+    return value
+
+
+def main(argv=None):
+    from backend.niches.product_store import ProductStore
+
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description="История снимков выгрузок товаров")
+    parser.add_argument("command", choices=("ingest", "list"))
+    parser.add_argument("--products-dir", default=str(base_dir / "data" / "products"))
+    parser.add_argument("--history-dir", default=str(base_dir / "data" / "history"))
+    parser.add_argument("--date", help="дата снимка YYYY-MM-DD (по умолчанию — из last_load_dt)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    history = SnapshotHistory(args.history_dir)
+    if args.command == "ingest":
+        path = history.ingest(ProductStore(args.products_dir), day=args.date)
+        print(f"snapshot written: {path}")
+    else:
+        for day in history.dates():
+            print(day, history.get(day).meta.get("products"))
+
+
+if __name__ == "__main__":
+    main()
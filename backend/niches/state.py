@@ -0,0 +1,131 @@
+# backend/niches/state.py
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from backend.niches.category_index import CategoryIndex
+from backend.niches.rollups import build_rollups, attach_rollups
+from backend.niches.http_cache import PreparedBody
+
+logger = logging.getLogger("mixai.niches.state")
+
+POLL_INTERVAL = float(os.getenv("NICHES_RELOAD_INTERVAL", "2"))
+
+
+class NichesState:
+    """Неизменяемый снимок данных дерева категорий одного поколения.
+
+    Обработчик берёт NICHES.current один раз в начале запроса и работает
+    с ним до конца: подмена поколения не меняет уже взятый снимок.
+    """
+
+    def __init__(self, generation: int, categories: list, index: CategoryIndex, rollups: dict,
+                 source: tuple, products_key: tuple):
+        self.generation = generation
+        self.categories = categories
+        self.index = index
+        self.rollups = rollups
+        self.categories_with_rollups = attach_rollups(categories, rollups, index)
+        # /api/categories меняется только вместе с данными — сериализуем и сжимаем один раз на поколение
+        self.categories_body = PreparedBody.from_json({"success": True, "data": categories})
+        self.categories_with_rollups_body = PreparedBody.from_json({"success": True, "data": self.categories_with_rollups})
+        self.source = source
+        self.products_key = products_key
+        self.loaded_at = time.time()
+
+    def rollup(self, category_id) -> Optional[dict]:
+        """Агрегаты категории по любому её id (через CategoryIndex)"""
+        key = self.index.resolve(category_id)
+        return self.rollups.get(key) if key is not None else None
+
+
+def _stat(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class NichesData:
+    """Текущее поколение данных и его пересборка.
+
+    Новое поколение строится целиком в фоне, затем ссылка current
+    подменяется одной операцией присваивания; номер поколения растёт.
+    """
+
+    def __init__(self, categories_path: Path, loader: Callable[[], list], store):
+        self.categories_path = Path(categories_path)
+        self.loader = loader
+        self.store = store
+        self.on_swap: List[Callable[[NichesState], None]] = []
+        self._lock = threading.Lock()
+        self.current: NichesState = self._build(1, None)
+
+    def products_key(self) -> tuple:
+        """Версии всех файлов товаров (как их видит store, включая поколения .ncol).
+
+        Единственная принудительная сверка с диском: заодно обновляет store.revision,
+        по которой store.frame() решает, пересобирать ли кадр.
+        """
+        self.store.scan(force=True)
+        return tuple(sorted(self.store.versions().items()))
+
+    def _build(self, generation: int, previous: Optional[NichesState]) -> NichesState:
+        source = _stat(self.categories_path)
+        if previous is not None and previous.source == source:
+            categories, index = previous.categories, previous.index
+        else:
+            categories = self.loader()
+            index = CategoryIndex(categories)
+        products_key = self.products_key()
+        rollups = build_rollups(index, self.store)
+        state = NichesState(generation, categories, index, rollups, source, products_key)
+        logger.info("niches data generation %d: %d categories, %d product files",
+                    generation, len(categories), len(products_key))
+        return state
+
+    def changed(self) -> bool:
+        state = self.current
+        return _stat(self.categories_path) != state.source or self.products_key() != state.products_key
+
+    def reload(self, force: bool = False) -> bool:
+        """Пересобирает и подменяет поколение, если данные на диске изменились"""
+        with self._lock:
+            if not force and not self.changed():
+                return False
+            previous = self.current
+            state = self._build(previous.generation + 1, previous)
+            self.current = state
+        for callback in self.on_swap:
+            try:
+                callback(state)
+            except Exception:
+                logger.exception("on_swap callback failed")
+        return True
+
+
+class DataWatcher(threading.Thread):
+    """Фоновый опрос backend/data: при изменениях пересобирает данные вне event loop"""
+
+    def __init__(self, data: NichesData, interval: float = POLL_INTERVAL):
+        super().__init__(name="niches-data-watcher", daemon=True)
+        self.data = data
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        logger.info("data watcher started (every %.1fs)", self.interval)
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.data.reload()
+            except Exception:
+                logger.exception("niches data reload failed")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self.join(timeout)
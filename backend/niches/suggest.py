@@ -0,0 +1,142 @@
+# backend/niches/suggest.py
+
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from typing import List
+
+import numpy as np
+
+from backend.niches.search_index import normalize_text, TOKEN_RE
+
+logger = logging.getLogger("mixai.niches.suggest")
+
+PRODUCTS_PER_CATEGORY = 50
+MAX_LIMIT = 20
+# Для коротких префиксов диапазон совпадений большой — их топ считается заранее
+SHORT_PREFIX = 2
+# Ключи разбиты на блоки, внутри блока позиции заранее отсортированы по sale_amount
+BLOCK = 256
+
+
+def _keys(name: str) -> List[str]:
+    """Ключи для префиксного поиска: название целиком и с начала каждого следующего слова"""
+    tokens = TOKEN_RE.findall(normalize_text(name))
+    return [" ".join(tokens[i:]) for i in range(len(tokens))]
+
+
+class SuggestIndex:
+    """Автодополнение по названиям категорий всех уровней и топ-товаров категорий.
+
+    Отсортированный массив ключей + bisect даёт диапазон совпадений; топ по
+    sale_amount внутри диапазона собирается слиянием (heap) заранее
+    отсортированных блоков, так что широкий префикс не обрезается.
+    """
+
+    def __init__(self, state, frame):
+        self.key = (state.generation, frame.key)
+        entries = []
+        for category_id, node in state.index.nodes.items():
+            name = node.get("category_name") or ""
+            if name:
+                rollup = state.rollup(category_id) or {}
+                entries.append({
+                    "type": "category",
+                    "id": category_id,
+                    "name": name,
+                    "sale_amount": int(node.get("sale_amount") or rollup.get("total_revenue_amount") or 0),
+                    "has_children": bool(state.index.children.get(category_id)),
+                    "breadcrumbs": [c["category_name"] for c in state.index.breadcrumbs(category_id)[:-1]],
+                })
+
+        # Топ товаров каждой категории по выручке — за один lexsort по кадру
+        if frame.n:
+            revenue = frame["sale_amount"].astype(np.float64)
+            order = np.lexsort((-revenue, frame.cat))
+            rank = np.arange(frame.n) - frame.offsets[frame.cat[order]]
+            for row in order[rank < PRODUCTS_PER_CATEGORY].tolist():
+                cols, i = frame.locate(row)
+                entries.append({
+                    "type": "product",
+                    "id": cols["product_code"][i],
+                    "name": cols["product_name"][i],
+                    "sale_amount": int(cols["sale_amount"][i]),
+                    "category_id": cols.category_id,
+                    "product_url": cols["product_url"][i],
+                })
+
+        pairs = sorted((key, e) for e, entry in enumerate(entries) for key in _keys(entry["name"]))
+        self.entries = entries
+        self.keys = [key for key, _ in pairs]
+        self.ids = np.array([e for _, e in pairs], dtype=np.int64)
+        self.amount = np.array([entry["sale_amount"] for entry in entries], dtype=np.float64)
+        self._pos_amount = self.amount[self.ids]
+        positions = np.arange(len(self.keys))
+        self._block_order = np.lexsort((-self._pos_amount, positions // BLOCK))
+
+        self._short = {}
+        prefixes = {key[:n] for key in self.keys for n in range(1, SHORT_PREFIX + 1)}
+        for prefix in prefixes:
+            self._short[prefix] = self._rank(prefix, MAX_LIMIT)
+        logger.info("suggest index built: %d entries, %d keys", len(entries), len(self.keys))
+
+    def _runs(self, lo: int, hi: int) -> list:
+        """Диапазон ключей [lo, hi) -> списки позиций, каждый отсортирован по убыванию sale_amount"""
+        first, last = -(-lo // BLOCK), hi // BLOCK
+        if first >= last:
+            edges = [np.arange(lo, hi)]
+            blocks = []
+        else:
+            edges = [np.arange(lo, first * BLOCK), np.arange(last * BLOCK, hi)]
+            blocks = [self._block_order[b * BLOCK:(b + 1) * BLOCK] for b in range(first, last)]
+        edges = [pos[np.argsort(-self._pos_amount[pos], kind="stable")] for pos in edges if pos.size]
+        return edges + blocks
+
+    def _rank(self, prefix: str, limit: int, kind: str = None) -> list:
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        if hi <= lo:
+            return []
+        runs = self._runs(lo, hi)
+        heap = [(-self._pos_amount[run[0]], r, 0) for r, run in enumerate(runs)]
+        heapq.heapify(heap)
+        best, seen = [], set()
+        while heap and len(best) < limit:
+            _, r, k = heapq.heappop(heap)
+            run = runs[r]
+            e = int(self.ids[run[k]])
+            if e not in seen:
+                seen.add(e)
+                if kind is None or self.entries[e]["type"] == kind:
+                    best.append(e)
+            if k + 1 < len(run):
+                heapq.heappush(heap, (-self._pos_amount[run[k + 1]], r, k + 1))
+        return best
+
+    def suggest(self, q: str, limit: int = 10, kind: str = None) -> List[dict]:
+        prefix = " ".join(TOKEN_RE.findall(normalize_text(q)))
+        if not prefix:
+            return []
+        if kind is None and len(prefix) <= SHORT_PREFIX and prefix in self._short:
+            ids = self._short[prefix][:limit]
+        else:
+            ids = self._rank(prefix, limit, kind)
+        return [self.entries[e] for e in ids]
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def suggest_index(state, frame) -> SuggestIndex:
+    """Индекс текущего поколения; пересобирается при смене дерева или товаров"""
+    global _index
+    index = _index
+    key = (state.generation, frame.key)
+    if index is not None and index.key == key:
+        return index
+    with _lock:
+        if _index is None or _index.key != key:
+            _index = SuggestIndex(state, frame)
+        return _index
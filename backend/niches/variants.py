@@ -0,0 +1,204 @@
+# backend/niches/variants.py
+
+import re
+import zlib
+import logging
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from backend.niches.search_index import normalize_text, TOKEN_RE
+
+logger = logging.getLogger("mixai.niches.variants")
+
+# MinHash: NUM_PERM хэшей делятся на BANDS полос по ROWS строк.
+# Порог срабатывания LSH ~ (1 / BANDS) ** (1 / ROWS) ≈ 0.77
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# Кандидаты из LSH проверяются точным Жаккаром по шинглам
+MIN_JACCARD = 0.9
+SEED = 20240917
+
+# Всё после «+» — комплектация («+ подписка 12 месяцев», «+ подарок»)
+BUNDLE_RE = re.compile(r"\s\+.*$")
+UNIT_RE = re.compile(r"\b\d+(?:[.,]\d+)?\s*(?:гб|gb|тб|tb|мм|mm|см|cm|мл|ml|кг|kg|г|g|шт)\b")
+COLOR_STEMS = (
+    "черн", "белый", "белая", "белое", "белые", "бело", "серый", "серая", "серое", "серые", "серо",
+    "серебр", "золот", "розов", "синий", "синяя", "синее", "сине", "голуб", "красн", "зелен", "фиолет",
+    "бежев", "сиренев", "желт", "оранж", "коричнев", "графит", "бирюз", "бордов", "мятн", "лилов", "хаки",
+)
+COLOR_WORDS = {
+    "black", "white", "silver", "gray", "grey", "blue", "pink", "gold", "green", "red", "purple", "beige",
+    "midnight", "starlight", "graphite",
+}
+SIZE_TOKENS = {"xs", "s", "m", "l", "xl", "xxl", "размер"}
+DROP_TOKENS = COLOR_WORDS | SIZE_TOKENS
+
+_rng = np.random.default_rng(SEED)
+_PERM_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_name(name: str) -> str:
+    """Название модели без цвета, размера, объёма и комплектации"""
+    text = BUNDLE_RE.sub("", normalize_text(name))
+    text = UNIT_RE.sub(" ", text)
+    tokens = [t for t in TOKEN_RE.findall(text) if t not in DROP_TOKENS and not t.startswith(COLOR_STEMS)]
+    return " ".join(tokens)
+
+
+def shingles(normalized: str) -> set:
+    """Слова и пары соседних слов (хэши crc32)"""
+    tokens = normalized.split()
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return {zlib.crc32(g.encode("utf-8")) for g in grams}
+
+
+def minhash_signatures(shingle_sets: List[set]) -> np.ndarray:
+    """Подписи MinHash (n, NUM_PERM) за NUM_PERM векторных проходов по всем шинглам сразу"""
+    n = len(shingle_sets)
+    sizes = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=n)
+    flat = np.fromiter((h for s in shingle_sets for h in s), dtype=np.uint64, count=int(sizes.sum()))
+    signatures = np.full((n, NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    nonempty = sizes > 0
+    if not flat.size:
+        return signatures
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[nonempty]
+    with np.errstate(over="ignore"):
+        for k in range(NUM_PERM):
+            # multiply-shift хэширование: старшие 32 бита (a * x + b) mod 2^64
+            hashed = ((_PERM_A[k] * flat + _PERM_B[k]) >> np.uint64(32)).astype(np.uint32)
+            signatures[nonempty, k] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def lsh_candidates(signatures: np.ndarray) -> np.ndarray:
+    """Пары (i, j), совпавшие хотя бы в одной полосе; внутри корзины каждый связывается с первым"""
+    pairs = []
+    for band in range(BANDS):
+        rows = np.ascontiguousarray(signatures[:, band * ROWS:(band + 1) * ROWS])
+        keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * ROWS))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        heads = first[inverse.ravel()]
+        members = np.flatnonzero(heads != np.arange(heads.size))
+        if members.size:
+            pairs.append(np.stack([heads[members], members], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class VariantGroups:
+    """Группы вариантов одной категории.
+
+    group_id[i] — номер группы товара i (группы нумеруются по первому товару),
+    names[g] — нормализованное название модели группы.
+    """
+
+    def __init__(self, cols):
+        self.category_id = cols.category_id
+        self.version = cols.version
+
+        # Одинаковые после нормализации названия склеиваются сразу, MinHash — только по уникальным
+        normalized = [normalize_name(name) for name in cols["product_name"]]
+        unique_names, name_code = {}, np.empty(len(normalized), dtype=np.int64)
+        for i, name in enumerate(normalized):
+            name_code[i] = unique_names.setdefault(name, len(unique_names))
+        names = list(unique_names)
+
+        sets = [shingles(name) for name in names]
+        uf = _UnionFind(len(names))
+        for a, b in lsh_candidates(minhash_signatures(sets)).tolist():
+            sa, sb = sets[a], sets[b]
+            union = len(sa | sb)
+            if union and len(sa & sb) / union >= MIN_JACCARD:
+                uf.union(a, b)
+
+        roots = np.fromiter((uf.find(k) for k in range(len(names))), dtype=np.int64, count=len(names))
+        _, first, group = np.unique(roots[name_code], return_index=True, return_inverse=True)
+        # нумерация групп в порядке первого товара
+        order = np.argsort(first, kind="stable")
+        remap = np.empty_like(order)
+        remap[order] = np.arange(order.size)
+        self.group_id = remap[group.ravel()].astype(np.int32)
+        self.n_groups = int(order.size)
+        self.names = [names[int(roots[name_code[i]])] for i in np.sort(first)]
+        self._summaries = None
+
+    def summaries(self, cols) -> List[dict]:
+        """Сводка по группам: число вариантов, суммарные продажи/выручка, диапазон цен; по убыванию выручки"""
+        if self._summaries is not None:
+            return self._summaries
+        k = self.n_groups
+        if not k:
+            return []
+        gid = self.group_id
+        price = cols["sale_price"].astype(np.float64)
+        revenue = np.bincount(gid, weights=cols["sale_amount"].astype(np.float64), minlength=k)
+        qty = np.bincount(gid, weights=cols["sale_qty"].astype(np.float64), minlength=k)
+        count = np.bincount(gid, minlength=k)
+        min_price = np.full(k, np.inf)
+        max_price = np.full(k, -np.inf)
+        np.minimum.at(min_price, gid, price)
+        np.maximum.at(max_price, gid, price)
+        # представитель группы — вариант с наибольшей выручкой
+        by_revenue = np.lexsort((-cols["sale_amount"].astype(np.float64), gid))
+        leaders = by_revenue[np.concatenate(([0], np.cumsum(count)[:-1]))]
+
+        codes = cols["product_code"]
+        out = []
+        for g in np.argsort(-revenue, kind="stable").tolist():
+            leader = int(leaders[g])
+            out.append({
+                "group_id": g,
+                "model": self.names[g],
+                "product_code": codes[leader],
+                "product_name": cols["product_name"][leader],
+                "variants": int(count[g]),
+                "total_revenue_amount": int(revenue[g]),
+                "total_sales_qty": int(qty[g]),
+                "min_price": int(min_price[g]),
+                "max_price": int(max_price[g]),
+            })
+        self._summaries = out
+        return out
+
+
+class VariantIndex:
+    """Кэш групп вариантов по категориям; пересчёт при смене версии файла категории"""
+
+    def __init__(self, store):
+        self.store = store
+        self._groups: Dict[str, VariantGroups] = {}
+        self._lock = threading.Lock()
+
+    def get(self, cols) -> VariantGroups:
+        groups = self._groups.get(cols.category_id)
+        if groups is not None and groups.version == cols.version:
+            return groups
+        with self._lock:
+            groups = self._groups.get(cols.category_id)
+            if groups is None or groups.version != cols.version:
+                groups = self._groups[cols.category_id] = VariantGroups(cols)
+                logger.info("variant groups: category=%s, %d products -> %d groups",
+                            cols.category_id, cols.n, groups.n_groups)
+        return groups
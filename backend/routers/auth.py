@@ -1,20 +1,36 @@
 # backend/routers/auth.py
 
 import os
+import hmac
+import asyncio
+import logging
 from datetime import datetime, timezone
-from passlib.context import CryptContext
-from fastapi import Request, Form, Depends
+from fastapi import Request, Form, Depends, HTTPException, status
 from fastapi.responses import HTMLResponse
 from starlette.responses import RedirectResponse
 
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import create_engine, select, Column, Integer, String, DateTime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from backend.services.password_hasher import PASSWORD_HASHER
+from backend.services.mail_outbox import MAIL_OUTBOX
+
+logger = logging.getLogger(__name__)
+
+# Служебные метрики: с заголовком X-Metrics-Token или, если токен не задан, только с localhost
+METRICS_TOKEN = os.getenv("AUTH_METRICS_TOKEN")
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+# Сколько метрики ждут ответа PostgreSQL (пул при недоступной БД уходит в повторы)
+METRICS_DB_TIMEOUT = 2.0
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./users.db")
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1) if DATABASE_URL.startswith("sqlite://") else DATABASE_URL
 
 # ---- DB setup ----
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+engine = create_async_engine(ASYNC_DATABASE_URL)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class User(Base):
@@ -25,35 +41,65 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
-Base.metadata.create_all(bind=engine)
+# Схема создаётся один раз при импорте синхронным движком, запросы идут через async
+_schema_engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+Base.metadata.create_all(bind=_schema_engine)
+_schema_engine.dispose()
 
 
 # ---- Security ----
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# argon2 считается в пуле процессов (backend/services/password_hasher.py)
+async def get_password_hash(password: str) -> str:
+    return await PASSWORD_HASHER.hash(password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+async def verify_password(plain: str, hashed: str) -> bool:
+    return await PASSWORD_HASHER.verify(plain, hashed)
 
 
 # ---- Helpers ----
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def get_user_by_username(db, username: str):
-    return db.query(User).filter(User.username == username).first()
+class UserRepository:
+    """Async-доступ к таблице users"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _first(self, *where):
+        result = await self.db.execute(select(User).where(*where).limit(1))
+        return result.scalars().first()
 
-def get_user_by_email(db, email: str):
-    return db.query(User).filter(User.email == email).first()
+    async def get_by_username(self, username: str):
+        return await self._first(User.username == username)
 
-def get_user_by_id(db, user_id: int):
-    return db.query(User).filter(User.id == user_id).first()
+    async def get_by_email(self, email: str):
+        return await self._first(User.email == email)
+
+    async def get_by_id(self, user_id: int):
+        return await self.db.get(User, user_id)
+
+    async def create(self, username: str, email: str, hashed_password: str) -> User:
+        user = User(username=username, email=email, hashed_password=hashed_password)
+        self.db.add(user)
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            await self.db.rollback()
+            raise
+        return user
+
+def require_internal(request: Request):
+    if METRICS_TOKEN:
+        if hmac.compare_digest(request.headers.get("x-metrics-token", ""), METRICS_TOKEN):
+            return
+    elif request.client is not None and request.client.host in LOCAL_HOSTS:
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+async def get_users(db = Depends(get_db)) -> UserRepository:
+    return UserRepository(db)
 
 
 # ---- Routes ----
@@ -69,30 +115,27 @@ def auth_routers(router, templates):
         return templates.TemplateResponse("register.html", {"request": request, "error": None, "values": {}})
 
     @router.post("/register", response_class=HTMLResponse)
-    def register_post(
+    async def register_post(
         request: Request,
         username: str = Form(...),
         email: str = Form(...),
         password: str = Form(...),
         password_confirm: str = Form(...),
-        db = Depends(get_db),
+        users: UserRepository = Depends(get_users),
     ):
         values = {"username": username, "email": email}
         if password != password_confirm:
             return templates.TemplateResponse("register.html", {"request": request, "error": "Пароли не совпадают", "values": values})
-        if get_user_by_username(db, username):
+        if await users.get_by_username(username):
             return templates.TemplateResponse("register.html", {"request": request, "error": "Имя пользователя уже занято", "values": values})
-        if get_user_by_email(db, email):
+        if await users.get_by_email(email):
             return templates.TemplateResponse("register.html", {"request": request, "error": "Email уже зарегистрирован", "values": values})
 
-        user = User(
-            username=username,
-            email=email,
-            hashed_password=get_password_hash(password)
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+        try:
+            user = await users.create(username, email, await get_password_hash(password))
+        except IntegrityError:
+            # Параллельная регистрация с тем же именем/email успела раньше
+            return templates.TemplateResponse("register.html", {"request": request, "error": "Имя пользователя или email уже заняты", "values": values})
 
         request.session["user_id"] = user.id
         return RedirectResponse(url="/profile", status_code=302)
@@ -102,30 +145,43 @@ def auth_routers(router, templates):
         return templates.TemplateResponse("login.html", {"request": request, "error": None, "values": {}})
 
     @router.post("/login", response_class=HTMLResponse)
-    def login_post(
+    async def login_post(
         request: Request,
         username: str = Form(...),
         password: str = Form(...),
-        db = Depends(get_db),
+        users: UserRepository = Depends(get_users),
     ):
         values = {"username": username}
-        user = get_user_by_username(db, username)
-        if not user or not verify_password(password, user.hashed_password):
+        user = await users.get_by_username(username)
+        if not user or not await verify_password(password, user.hashed_password):
             return templates.TemplateResponse("login.html", {"request": request, "error": "Неверный логин или пароль", "values": values})
         request.session["user_id"] = user.id
         return RedirectResponse(url="/profile", status_code=302)
 
     @router.get("/profile", response_class=HTMLResponse)
-    def profile(request: Request, db = Depends(get_db)):
+    async def profile(request: Request, users: UserRepository = Depends(get_users)):
         user_id = request.session.get("user_id")
         if not user_id:
             return RedirectResponse(url="/login")
-        user = get_user_by_id(db, user_id)
+        user = await users.get_by_id(user_id)
         if not user:
             request.session.clear()
             return RedirectResponse(url="/login")
         return templates.TemplateResponse("profile.html", {"request": request, "user": user})
 
+    @router.get("/api/auth/metrics", dependencies=[Depends(require_internal)])
+    async def auth_metrics():
+        # Очередь писем лежит в PostgreSQL: без него метрики всё равно отдаём
+        try:
+            queue_depth = await asyncio.wait_for(MAIL_OUTBOX.queue_depth(), METRICS_DB_TIMEOUT)
+        except Exception as e:
+            logger.warning("mail outbox queue depth unavailable: %s", type(e).__name__)
+            queue_depth = None
+        return {"success": True, "data": {
+            "password_hasher": PASSWORD_HASHER.stats(),
+            "mail_outbox": {**MAIL_OUTBOX.stats(), "queue_depth": queue_depth},
+        }}
+
     @router.get("/logout")
     def logout(request: Request):
         request.session.clear()
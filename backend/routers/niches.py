@@ -2,12 +2,34 @@
 import os
 import json
 from pathlib import Path
-from fastapi import Request
-from fastapi.responses import HTMLResponse
+from typing import List, Optional
+from fastapi import Request, Query, HTTPException
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+from backend.niches.product_store import ProductStore, SORT_KEYS
+from backend.niches.state import NichesData
+from backend.niches.variants import VariantIndex
+from backend.niches.brands import brand_index, SORT_FIELDS as BRAND_SORT_FIELDS
+from backend.niches.export import iter_export, available_formats, FORMATS as EXPORT_FORMATS
+from backend.niches.price_bands import price_bands, DEFAULT_BINS, MAX_BINS
+from backend.niches.leaderboards import Leaderboards, METRICS, PRICE_BANDS, BAND_METRIC, TOP_N
+from backend.niches.search_index import ProductSearchIndex
+from backend.niches.scoring import niche_scores, SORT_FIELDS as SCORE_SORT_FIELDS
+from backend.niches.dashboard import dashboard
+from backend.niches.suggest import suggest_index, MAX_LIMIT as SUGGEST_MAX_LIMIT
+from backend.niches.snapshots import SnapshotHistory
+from backend.niches.http_cache import strong_etag, etag_matches, not_modified, CACHE_CONTROL
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_PATH = BASE_DIR / "data" / "categories.json"
 PRODUCTS_DIR = BASE_DIR / "data" / "products"
+HISTORY_DIR = BASE_DIR / "data" / "history"
+COMPILED_DIR = BASE_DIR / "data" / "compiled"
+
+PRODUCT_STORE = ProductStore(PRODUCTS_DIR, COMPILED_DIR)
+SEARCH_INDEX = ProductSearchIndex(PRODUCT_STORE)
+HISTORY = SnapshotHistory(HISTORY_DIR)
+VARIANTS = VariantIndex(PRODUCT_STORE)
 
 def load_categories():
     if DATA_PATH.exists():
@@ -31,221 +53,97 @@ def normalize_categories(raw):
         out.append(c)
     return out
 
-CATEGORIES = normalize_categories(load_categories())
-print(f"[startup] categories loaded: {len(CATEGORIES)} items, path={DATA_PATH}")
+# Дерево категорий и производные индексы — одно поколение, подменяемое целиком при обновлении данных
+NICHES = NichesData(DATA_PATH, lambda: normalize_categories(load_categories()), PRODUCT_STORE)
+print(f"[startup] categories loaded: {len(NICHES.current.categories)} items, path={DATA_PATH}")
 
-def find_category_name_from_categories(category_id):
-    """Пытаемся найти название категории в CATEGORIES по нескольким возможным ключам."""
-    for c in CATEGORIES:
-        for key in ("category_ext_id", "category_id", "ext_id", "id", "code"):
-            if key in c and str(c[key]) == str(category_id):
-                return c.get("category_name") or c.get("name") or c.get("title") or c.get("label")
-    return None
-
-# def safe_parse_preview_list(raw):
-#     if not raw:
-#         return []
-#     if isinstance(raw, list):
-#         return raw
-#     if isinstance(raw, dict):
-#         return [raw]
-#     if not isinstance(raw, str):
-#         return []
-
-#     s = raw.strip()
-
-#     # Пробуем корректный JSON
-#     try:
-#         parsed = json.loads(s)
-#         if isinstance(parsed, dict):
-#             return [parsed]
-#         if isinstance(parsed, list):
-#             return parsed
-#     except Exception:
-#         pass
-
-#     # Если строка — несколько объектов без внешних [ ... ], например: {"a":1}, {"b":2}, ...
-#     if s.startswith("{") and "}," in s and "{" in s:
-#         try:
-#             wrapped = "[" + s.replace("}, {", "},{") + "]"
-#             return json.loads(wrapped)
-#         except Exception:
-#             pass
-
-#     # Если один объект {...}
-#     if s.startswith("{") and s.endswith("}"):
-#         try:
-#             return [json.loads(s)]
-#         except Exception:
-#             return []
-
-#     # Попробуем найти первый '[' ... ']' внутри
-#     try:
-#         a = s.index('[')
-#         b = s.rindex(']')
-#         inner = s[a:b+1]
-#         return json.loads(inner)
-#     except Exception:
-#         pass
-
-#     return []
-
-import re
-import logging
-
-
-def safe_parse_preview_list(raw):
-    """
-    Универсальный парсер preview_image_list, который терпимо обрабатывает:
-    - корректный JSON list: '[{...},{...}]'
-    - JSON object string: '{"small": "...", ...}'
-    - несколько объектов без внешнего []: '{"..."}, {"..."}, {"..."}' (в т.ч. с лишней закрывающей ']')
-    - пустые / None значения -> []
-    """
-    if not raw:
-        return []
-    if isinstance(raw, list):
-        return raw
-    if isinstance(raw, dict):
-        return [raw]
-    if not isinstance(raw, str):
-        return []
-
-    s = raw.strip()
-
-    # 1) Попробовать напрямую распарсить как JSON (самый частый хороший случай)
-    try:
-        parsed = json.loads(s)
-        if isinstance(parsed, list):
-            return parsed
-        if isinstance(parsed, dict):
-            return [parsed]
-    except Exception:
-        pass
-
-    # 2) Быстрая очистка: иногда строка имеет лишние начальные/конечные скобки/запятые
-    # убираем одиночные ведущие/хвостовые символы, которые ломают JSON-парсер
-    # (например: leading/trailing comma, лишняя ']' или '[')
-    s_clean = s
-    # удалить одинарные обрамляющие кавычки если они есть
-    if s_clean.startswith('"') and s_clean.endswith('"'):
-        s_clean = s_clean[1:-1].strip()
-
-    # удалить одиночный лишний закрывающий или открывающий bracket в конце/начале
-    s_clean = s_clean.lstrip(' \n\t[').rstrip(' \n\t]')
-
-    # 3) Найти все объекты вида { ... } и собрать их в массив
-    try:
-        objs = []
-        # регулярка найдёт все {...} вместе с вложенными кавычками — достаточно для простых JSON объектов
-        for m in re.finditer(r'\{[^{}]*\}', s_clean):
-            part = m.group(0)
-            try:
-                parsed_part = json.loads(part)
-                objs.append(parsed_part)
-            except Exception:
-                # если не получилось распарсить маленький кусок — пробуем почистить пробелы и повторить
-                try:
-                    parsed_part = json.loads(part.strip().rstrip(','))
-                    objs.append(parsed_part)
-                except Exception:
-                    # не смогли распознать этот объект — пропускаем, но логируем для отладки
-                    logging.debug("safe_parse_preview_list: can't parse object chunk: %r", part)
-                    continue
-
-        if objs:
-            return objs
-    except Exception as ex:
-        logging.debug("safe_parse_preview_list: regex extraction failed: %s", ex)
-
-    # 4) В крайнем случае — попытка найти первый '[' ... ']' и распарсить внутренность
-    try:
-        a = s.index('[')
-        b = s.rindex(']')
-        inner = s[a:b+1]
-        parsed = json.loads(inner)
-        if isinstance(parsed, list):
-            return parsed
-        if isinstance(parsed, dict):
-            return [parsed]
-    except Exception:
-        pass
-
-    # 5) Если всё провалилось — вернём пустой список
-    logging.debug("safe_parse_preview_list: cannot parse preview_image_list (fallback empty) raw=%r", s[:200])
-    return []
+LEADERBOARDS = Leaderboards(PRODUCT_STORE, NICHES.current.index)
 
+def warm_indexes(state):
+    """После подмены поколения (в потоке наблюдателя) догоняем индексы, чтобы запросы не ждали пересборки"""
+    if LEADERBOARDS.index is not state.index:
+        LEADERBOARDS.reindex(state.index)
+    LEADERBOARDS.sync(force=True)
+    SEARCH_INDEX.sync(force=True)
+    niche_scores(PRODUCT_STORE.frame())
+    suggest_index(state, PRODUCT_STORE.frame())
 
-def load_products_from_json(category_id: str):
-    path = PRODUCTS_DIR / f"{category_id}.json"
-    if not path.exists():
-        return None
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception:
-        return None
+NICHES.on_swap.append(warm_indexes)
 
-    products = []
-    try:
-        lines = data.get("products", {}).get("lines", []) or []
-    except Exception:
-        lines = []
-    for p in lines:
-        p = dict(p)
-        p['_images'] = safe_parse_preview_list(p.get("preview_image_list"))
-        products.append(p)
-
-    return products
-
-def compute_summary(products):
-    total_sales_qty = sum(int(p.get("sale_qty") or 0) for p in products)
-    total_revenue_amount = sum(int(p.get("sale_amount") or 0) for p in products)
-    total_products = len(products)
-
-    # Продавцы: у нас есть только merchant_count на каждую карточку.
-    # Самое простое — суммировать merchant_count (оценка, не уникальные продавцы).
-    total_sellers_est = sum(int(p.get("merchant_count") or 0) for p in products)
-    unique_brands = len({ (p.get("brand_name") or "").strip() for p in products if p.get("brand_name") })
-    return {
-        "total_sales_qty": total_sales_qty,
-        "total_revenue_amount": total_revenue_amount,
-        "total_products": total_products,
-        "total_sellers_est": total_sellers_est,
-        "unique_brands": unique_brands
-    }
+def find_category_name_from_categories(category_id):
+    """Название категории любого уровня вложенности (по индексу, без обхода дерева)."""
+    return NICHES.current.index.name(category_id)
 
 def load_products(category_id: str):
-    products = load_products_from_json(category_id)
-    if products is None:
+    cols = PRODUCT_STORE.get(category_id)
+    if cols is None:
         return None
 
-    # category_name: сначала пробуем взять из первой карточки, потом из CATEGORIES, иначе показываем id
-    category_name = None
-    if products:
-        first = products[0]
-        category_name = first.get("category_name")
+    # category_name: сначала пробуем взять из первой карточки, потом из дерева категорий, иначе показываем id
+    category_name = cols.category_name
     if not category_name:
         category_name = find_category_name_from_categories(category_id) or category_id
 
-    summary = compute_summary(products)
     return {
-        "products": products,
-        "summary": summary,
+        "columns": cols,
+        "summary": cols.summary,
         "category_name": category_name
     }
 
+def product_payload(cols, i: int, groups=None) -> dict:
+    """Карточка для JSON API: _images отдаём как images, group_id — группа вариантов модели"""
+    p = cols.record(i)
+    p["images"] = p.pop("_images")
+    if groups is not None:
+        p["group_id"] = int(groups.group_id[i])
+    return p
+
+def version_tag(cols) -> str:
+    return format(hash(cols.version) & 0xFFFFFFFF, "x")
+
+def parse_cursor(cursor: Optional[str], cols) -> Optional[int]:
+    """Курсор вида '<версия файла>.<ранг>'; после перезагрузки категории старый курсор недействителен"""
+    if not cursor:
+        return None
+    tag, _, rank = cursor.partition(".")
+    if tag != version_tag(cols) or not rank.isdigit():
+        raise HTTPException(status_code=409, detail="Данные категории обновились, начните листание заново")
+    return int(rank)
+
+def selected_category_ids(request: Request) -> list:
+    """id категорий из session["selected_niches"] (строки или объекты с category_id)"""
+    out = []
+    for item in request.session.get("selected_niches") or []:
+        category_id = item.get("category_id") if isinstance(item, dict) else item
+        if category_id not in (None, ""):
+            out.append(str(category_id))
+    return out
+
 # ---- Routes ----
 def niches_routers(router, templates):
     @router.get("/api/categories")
-    def api_categories():
-        return {"success": True, "data": CATEGORIES}
+    def api_categories(request: Request, with_rollups: bool = False):
+        state = NICHES.current
+        body = state.categories_with_rollups_body if with_rollups else state.categories_body
+        return body.response(request)
+
+    @router.get("/api/categories/{category_id}/subtree")
+    def api_category_subtree(
+        category_id: str,
+        depth: Optional[int] = Query(None, ge=0, le=16),
+        with_rollups: bool = False,
+    ):
+        state = NICHES.current
+        node = state.index.subtree(category_id, depth=depth, rollups=state.rollups if with_rollups else None)
+        if node is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+        return {"success": True, "breadcrumbs": state.index.breadcrumbs(category_id), "data": node}
 
     @router.get("/niches", response_class=HTMLResponse)
     def niches_page(request: Request):
         return templates.TemplateResponse("niches.html", {
             "request": request,
-            "categories": CATEGORIES
+            "categories": NICHES.current.categories
         })
 
     @router.post("/api/niches/select")
@@ -255,15 +153,234 @@ def niches_routers(router, templates):
         request.session["selected_niches"] = selected
         return {"success": True, "selected": selected}
 
+    @router.get("/api/suggest")
+    def api_suggest(
+        q: str = Query(..., min_length=1, max_length=100),
+        limit: int = Query(10, ge=1, le=SUGGEST_MAX_LIMIT),
+        type: Optional[str] = Query(None, pattern="^(category|product)$"),
+    ):
+        index = suggest_index(NICHES.current, PRODUCT_STORE.frame())
+        return {"success": True, "data": index.suggest(q, limit=limit, kind=type)}
+
+    @router.get("/api/category/{category_id}/products")
+    def api_category_products(
+        category_id: str,
+        sort: str = Query("sale_amount"),
+        order: str = Query("desc", pattern="^(asc|desc)$"),
+        limit: int = Query(24, ge=1, le=100),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = None,
+        price_min: Optional[int] = Query(None, ge=0),
+        price_max: Optional[int] = Query(None, ge=0),
+        brand: Optional[List[str]] = Query(None),
+        abc: Optional[List[int]] = Query(None),
+        min_reviews: Optional[int] = Query(None, ge=0),
+    ):
+        if sort not in SORT_KEYS:
+            raise HTTPException(status_code=422, detail=f"sort должен быть одним из: {', '.join(SORT_KEYS)}")
+        cols = PRODUCT_STORE.get(category_id)
+        if cols is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+
+        filters = {
+            k: v for k, v in {
+                "price_min": price_min, "price_max": price_max, "brand": brand,
+                "abc": abc, "min_reviews": min_reviews,
+            }.items() if v is not None
+        }
+        page = cols.page(
+            sort, descending=(order == "desc"), filters=filters,
+            offset=offset, after_rank=parse_cursor(cursor, cols), limit=limit,
+        )
+        groups = VARIANTS.get(cols)
+        next_cursor = None
+        if page["has_more"] and page["last_rank"] is not None:
+            next_cursor = f"{version_tag(cols)}.{page['last_rank']}"
+        return {
+            "success": True,
+            "total": page["total"],
+            "next_cursor": next_cursor,
+            "items": [product_payload(cols, int(i), groups) for i in page["indices"]],
+        }
+
+    @router.get("/api/category/{category_id}/groups")
+    def api_category_groups(
+        category_id: str,
+        limit: int = Query(50, ge=1, le=500),
+        offset: int = Query(0, ge=0),
+    ):
+        cols = PRODUCT_STORE.get(category_id)
+        if cols is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+        groups = VARIANTS.get(cols)
+        rows = groups.summaries(cols)
+        return {
+            "success": True,
+            "total_products": cols.n,
+            "total_groups": groups.n_groups,
+            "data": rows[offset:offset + limit],
+        }
+
+    @router.get("/api/niches/dashboard")
+    def api_niches_dashboard(request: Request, category: Optional[List[str]] = Query(None)):
+        selected = list(dict.fromkeys(category or selected_category_ids(request)))
+        if not selected:
+            return {"success": True, "selected": [], "missing": [], "totals": {}, "niches": []}
+        data = dashboard(PRODUCT_STORE.frame(), NICHES.current, selected)
+        return {"success": True, **data}
+
+    @router.get("/api/category/{category_id}/price-bands")
+    def api_category_price_bands(category_id: str, bins: int = Query(DEFAULT_BINS, ge=1, le=MAX_BINS)):
+        cols = PRODUCT_STORE.get(category_id)
+        if cols is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+        return {"success": True, "data": price_bands(cols, bins)}
+
+    @router.get("/api/niches/scores")
+    def api_niche_scores(
+        sort: str = Query("score"),
+        order: str = Query("desc", pattern="^(asc|desc)$"),
+        limit: int = Query(50, ge=1, le=1000),
+        offset: int = Query(0, ge=0),
+    ):
+        if sort not in SCORE_SORT_FIELDS:
+            raise HTTPException(status_code=422, detail=f"sort должен быть одним из: {', '.join(SCORE_SORT_FIELDS)}")
+        rows = niche_scores(PRODUCT_STORE.frame())
+        if sort != "score" or order != "desc":
+            missing = float("-inf") if order == "desc" else float("inf")
+            rows = sorted(
+                rows, reverse=(order == "desc"),
+                key=lambda r: r[sort] if isinstance(r[sort], (int, float)) else missing,
+            )
+        page = [
+            {**r, "category_name": r["category_name"] or find_category_name_from_categories(r["category_id"])}
+            for r in rows[offset:offset + limit]
+        ]
+        return {"success": True, "total": len(rows), "data": page}
+
+    @router.get("/api/leaderboards")
+    def api_leaderboards(
+        metric: str = Query("sale_amount"),
+        parent: Optional[str] = None,
+        band: Optional[int] = Query(None, ge=0, lt=len(PRICE_BANDS)),
+        limit: int = Query(20, ge=1, le=TOP_N),
+    ):
+        if metric not in METRICS:
+            raise HTTPException(status_code=422, detail=f"metric должен быть одним из: {', '.join(METRICS)}")
+        if band is not None and metric != BAND_METRIC:
+            raise HTTPException(status_code=422, detail=f"Ценовые диапазоны ранжируются только по {BAND_METRIC}")
+        LEADERBOARDS.sync()
+        entries = LEADERBOARDS.board(metric, parent=parent, band=band)
+        if entries is None:
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+        return {
+            "success": True,
+            "metric": metric,
+            "parent": parent,
+            "band": {"index": band, "min": PRICE_BANDS[band][0], "max": PRICE_BANDS[band][1]} if band is not None else None,
+            "items": Leaderboards.items(entries, limit),
+        }
+
+    @router.get("/api/brands")
+    def api_brands(
+        sort: str = Query("total_revenue_amount"),
+        order: str = Query("desc", pattern="^(asc|desc)$"),
+        q: Optional[str] = Query(None, max_length=100),
+        limit: int = Query(50, ge=1, le=500),
+        offset: int = Query(0, ge=0),
+    ):
+        if sort not in BRAND_SORT_FIELDS:
+            raise HTTPException(status_code=422, detail=f"sort должен быть одним из: {', '.join(BRAND_SORT_FIELDS)}")
+        index = brand_index(PRODUCT_STORE.frame())
+        total, rows = index.list(sort, descending=(order == "desc"), q=q, offset=offset, limit=limit)
+        return {"success": True, "total": total, "data": rows}
+
+    @router.get("/api/brands/{brand_id}")
+    def api_brand(brand_id: str):
+        index = brand_index(PRODUCT_STORE.frame())
+        code = index.resolve(brand_id)
+        if code is None:
+            raise HTTPException(status_code=404, detail="Бренд не найден")
+        return {"success": True, "data": index.detail(code)}
+
+    @router.get("/api/export")
+    def api_export(
+        request: Request,
+        category: Optional[List[str]] = Query(None),
+        selected: bool = False,
+        format: str = Query("csv"),
+    ):
+        if format not in available_formats():
+            raise HTTPException(status_code=422, detail=f"format должен быть одним из: {', '.join(available_formats())}")
+        category_ids = list(dict.fromkeys((category or []) + (selected_category_ids(request) if selected else [])))
+        if not category_ids:
+            raise HTTPException(status_code=422, detail="Укажите category или selected=true с выбранными нишами")
+        missing = [cid for cid in category_ids if PRODUCT_STORE.get(cid) is None]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Категории не найдены: {', '.join(missing)}")
+
+        # Категории отдаются по одной, внутри — пачками строк: память не растёт с размером выгрузки
+        parts = (cols for cols in map(PRODUCT_STORE.get, category_ids) if cols is not None)
+        media_type, extension = EXPORT_FORMATS[format]
+        filename = f"niches-{category_ids[0] if len(category_ids) == 1 else 'selected'}.{extension}"
+        return StreamingResponse(
+            iter_export(parts, format),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    @router.get("/api/history/snapshots")
+    def api_history_snapshots():
+        return {"success": True, "data": HISTORY.dates()}
+
+    @router.get("/api/history/product/{product_code}")
+    def api_history_product(product_code: str, date_from: Optional[str] = None, date_to: Optional[str] = None):
+        delta = HISTORY.product_delta(product_code, date_from, date_to)
+        return {"success": True, "delta": delta, "series": HISTORY.product_series(product_code)}
+
+    @router.get("/api/history/category/{category_id}")
+    def api_history_category(category_id: str, date_from: Optional[str] = None, date_to: Optional[str] = None):
+        delta = HISTORY.category_delta(category_id, date_from, date_to)
+        if delta is None:
+            raise HTTPException(status_code=404, detail="Нет двух снимков для сравнения по этой категории")
+        return {"success": True, "data": delta}
+
+    @router.get("/api/products/search")
+    def api_products_search(
+        q: str = Query(..., min_length=1, max_length=200),
+        category: Optional[List[str]] = Query(None),
+        brand: Optional[List[str]] = Query(None),
+        limit: int = Query(20, ge=1, le=100),
+    ):
+        SEARCH_INDEX.sync()
+        result = SEARCH_INDEX.search(q, limit=limit, categories=category, brands=brand)
+        return {"success": True, **result}
+
     @router.get("/category/{category_id}", response_class=HTMLResponse, name="category_page")
     def category_page(request: Request, category_id: str):
+        state = NICHES.current
         data = load_products(category_id)
         if data is None:
-            data = {"products": [], "summary": {}, "category_name": category_id}
-        return templates.TemplateResponse("category.html", {
+            data = {"columns": None, "summary": {}, "category_name": category_id}
+        cols = data["columns"]
+
+        # Страница зависит от версии файла товаров, дерева категорий и самого шаблона
+        etag = None
+        if cols is not None:
+            template_path = templates.env.get_template("category.html").filename
+            etag = strong_etag((cols.version, state.categories_body.etag, os.stat(template_path).st_mtime_ns))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+        response = templates.TemplateResponse("category.html", {
             "request": request,
             "category_id": category_id,
-            "products": data["products"],
+            "breadcrumbs": state.index.breadcrumbs(category_id),
+            "brands": sorted(cols.brands, key=str.lower) if cols is not None else [],
             "summary": data["summary"],
             "category_name": data["category_name"]
         })
+        if etag:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
@@ -0,0 +1,312 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import smtplib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from database.db_connection import db_conn
+from backend.services.mailer import (
+    build_message, SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+)
+
+logger = logging.getLogger(__name__)
+
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Сервера рвут простаивающие соединения — закрываем сами раньше
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+
+OUTBOX_BATCH_SIZE = int(os.getenv("MAIL_OUTBOX_BATCH", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("MAIL_OUTBOX_POLL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+# Аренда пачки должна пережить отправку всех писем по SMTP_TIMEOUT каждое;
+# пока пачка отправляется, аренда ещё и продлевается каждые lease/3 секунд
+OUTBOX_LEASE_MIN_SECONDS = 60.0
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+
+
+async def enqueue_email(recipient: str, subject: str, text: str, html: str = None, kind: str = "generic") -> int:
+    """Кладёт письмо в auth.mail_outbox и сразу возвращается; отправит фоновый MailOutboxSender"""
+    rows = await db_conn.execute_query("""
+        INSERT INTO auth.mail_outbox (recipient, subject, body_text, body_html, kind)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING id;
+    """, params=(recipient, subject, text, html, kind))
+    MAIL_OUTBOX.wake()
+    return rows[0]["id"]
+
+
+def backoff_delay(attempts: int) -> float:
+    """Экспоненциальная задержка с джиттером: 5s, 10s, 20s ... не больше часа"""
+    delay = min(BACKOFF_BASE * 2 ** max(0, attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def error_label(error: Exception) -> str:
+    """Класс ошибки и SMTP-код без текста: в тексте SMTP-ответов бывают адреса получателей"""
+    code = getattr(error, "smtp_code", None)
+    return f"{type(error).__name__} {code}" if isinstance(code, int) else type(error).__name__
+
+
+def is_permanent(error: Exception) -> bool:
+    """5xx от сервера и отказ по адресатам повторять бессмысленно"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+class SmtpConnection:
+    """Постоянное SMTP-соединение; используется только из потока отправителя"""
+
+    def __init__(self, host: str = SMTP_SERVER, port: int = SMTP_PORT, username: str = SMTP_USERNAME,
+                 password: str = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS, idle_timeout: float = SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._used_at = 0.0
+        self.connects = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        smtp.ehlo()
+        if self.starttls:
+            smtp.starttls()
+            smtp.ehlo()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self.connects += 1
+        return smtp
+
+    def _ensure(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._used_at > self.idle_timeout:
+            self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+            self._used_at = time.monotonic()
+        return self._smtp
+
+    def send(self, msg):
+        # Одно переподключение, если сервер успел закрыть соединение
+        for attempt in (1, 2):
+            try:
+                self._ensure().send_message(msg)
+                self._used_at = time.monotonic()
+                return
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # Сервер ответил — соединение живое, хоть письмо и отклонено
+                self._used_at = time.monotonic()
+                raise
+            except smtplib.SMTPServerDisconnected:
+                self._drop()
+                if attempt == 2:
+                    raise
+
+    def _drop(self):
+        self._smtp = None
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._used_at > self.idle_timeout:
+            self.close()
+
+
+class MailOutboxSender:
+    """Фоновая отправка писем из auth.mail_outbox.
+
+    Пачка строк забирается одним запросом (FOR UPDATE SKIP LOCKED + аренда
+    locked_until — несколько воркеров не отправят письмо дважды, а упавший
+    воркер не потеряет его). Отправка идёт в одном выделенном потоке по
+    постоянному SMTP-соединению, event loop не блокируется. Временные
+    ошибки — повтор с экспоненциальной задержкой, постоянные (5xx) и
+    исчерпанные попытки — статус failed.
+
+    Аренда (lease_seconds) выводится из batch_size * SMTP_TIMEOUT и
+    продлевается, пока пачка в работе, — медленный SMTP с переподключениями
+    не отдаст строки другому воркеру посреди отправки.
+    """
+
+    def __init__(self, connection: SmtpConnection = None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.connection = connection or SmtpConnection()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = max(OUTBOX_LEASE_MIN_SECONDS, batch_size * SMTP_TIMEOUT)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mail-outbox")
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="mail-outbox")
+            logger.info("mail outbox sender started (batch %d, poll %.1fs)", self.batch_size, self.poll_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.connection.close)
+
+    def wake(self):
+        """Новое письмо в очереди — не ждать следующего опроса"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = error_label(e)
+                logger.exception("mail outbox batch failed")
+                processed = 0
+            if processed >= self.batch_size:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self.connection.close_if_idle)
+
+    async def claim_batch(self) -> list:
+        return await db_conn.execute_query("""
+            UPDATE auth.mail_outbox o
+            SET status = 'sending', attempts = o.attempts + 1,
+                locked_until = NOW() + make_interval(secs => $2)
+            WHERE o.id IN (
+                SELECT id FROM auth.mail_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= NOW())
+                   OR (status = 'sending' AND locked_until < NOW())
+                ORDER BY next_attempt_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.recipient, o.subject, o.body_text, o.body_html, o.attempts;
+        """, params=(self.batch_size, self.lease_seconds)) or []
+
+    async def _renew_lease(self, ids: list):
+        """Продлевает аренду пачки, пока поток отправителя с ней работает"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await db_conn.execute_query("""
+                    UPDATE auth.mail_outbox
+                    SET locked_until = NOW() + make_interval(secs => $2)
+                    WHERE id = ANY($1::bigint[]) AND status = 'sending';
+                """, params=(ids, self.lease_seconds), fetch=False)
+            except Exception as e:
+                logger.warning("mail outbox lease renewal failed: %s", e)
+
+    def _send_batch(self, jobs: list) -> list:
+        """В потоке отправителя: [(id, None | исключение)] по каждому письму пачки"""
+        results = []
+        for job in jobs:
+            try:
+                msg = build_message(job["recipient"], job["subject"], job["body_text"] or "", job["body_html"])
+                self.connection.send(msg)
+                results.append((job, None))
+            except Exception as e:
+                # Ответ сервера на конкретное письмо соединение не портит; остальное — переподключаемся
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    self.connection.close()
+                results.append((job, e))
+        return results
+
+    async def process_batch(self) -> int:
+        jobs = await self.claim_batch()
+        if not jobs:
+            return 0
+        started = time.perf_counter()
+        renew = asyncio.create_task(self._renew_lease([job["id"] for job in jobs]))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self._executor, self._send_batch, jobs)
+        finally:
+            renew.cancel()
+
+        sent_ids = [job["id"] for job, error in results if error is None]
+        if sent_ids:
+            # Тело письма (в нём ссылка с токеном сброса) после отправки не храним
+            await db_conn.execute_query("""
+                UPDATE auth.mail_outbox
+                SET status = 'sent', sent_at = NOW(), locked_until = NULL, last_error = NULL,
+                    body_text = NULL, body_html = NULL
+                WHERE id = ANY($1::bigint[]);
+            """, params=(sent_ids,), fetch=False)
+            self.sent += len(sent_ids)
+
+        for job, error in results:
+            if error is None:
+                continue
+            self.last_error = error_label(error)
+            detail = f"{type(error).__name__}: {error}"
+            if is_permanent(error) or job["attempts"] >= self.max_attempts:
+                status, delay = "failed", 0.0
+                self.failed += 1
+                logger.error("mail %s to %s failed permanently: %s", job["id"], job["recipient"], detail)
+            else:
+                status, delay = "pending", backoff_delay(job["attempts"])
+                self.retried += 1
+                logger.warning("mail %s to %s failed (attempt %d), retry in %.0fs: %s",
+                               job["id"], job["recipient"], job["attempts"], delay, detail)
+            await db_conn.execute_query("""
+                UPDATE auth.mail_outbox
+                SET status = $2, locked_until = NULL, last_error = $3,
+                    next_attempt_at = NOW() + make_interval(secs => $4)
+                WHERE id = $1;
+            """, params=(job["id"], status, detail[:1000], delay), fetch=False)
+
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+        return len(jobs)
+
+    async def queue_depth(self) -> dict:
+        rows = await db_conn.execute_query("""
+            SELECT status, COUNT(*) AS n FROM auth.mail_outbox
+            WHERE status IN ('pending', 'sending', 'failed')
+            GROUP BY status;
+        """)
+        return {r["status"]: r["n"] for r in rows or []}
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "smtp_connects": self.connection.connects,
+            "last_batch_ms": self.last_batch_ms,
+            "last_error": self.last_error,
+        }
+
+
+MAIL_OUTBOX = MailOutboxSender()
@@ -15,6 +15,18 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", SMTP_USERNAME)
 
 
+def build_message(recipient_email: str, subject: str, text: str, html: str = None) -> MIMEMultipart:
+    """Письмо с текстовой и (если есть) HTML-версией"""
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = recipient_email
+    msg.attach(MIMEText(text, "plain"))
+    if html:
+        msg.attach(MIMEText(html, "html"))
+    return msg
+
+
 def send_recovery_email(recipient_email: str, recovery_link: str, subject, text, html):
     """Отправляет письмо для восстановления пароля с HTML и текстовой версией"""
     # subject = "Восстановление пароля"
@@ -34,15 +46,7 @@ def send_recovery_email(recipient_email: str, recovery_link: str, subject, text,
     #     </html>
     # """
 
-    # Собираем мультипарт
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = recipient_email
-
-    # Добавляем версии письма
-    msg.attach(MIMEText(text, "plain"))
-    msg.attach(MIMEText(html, "html"))
+    msg = build_message(recipient_email, subject, text, html)
 
     try:
         with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
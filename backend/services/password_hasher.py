@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+# Сколько задач может ждать пул сверх занятых воркеров; дальше запросы ждут в очереди event loop
+HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "0")) or HASH_WORKERS * 4
+
+_context: Optional[CryptContext] = None
+
+
+def _crypt_context() -> CryptContext:
+    # Создаётся в процессе-воркере при первой задаче
+    global _context
+    if _context is None:
+        _context = CryptContext(schemes=["argon2"], deprecated="auto")
+    return _context
+
+
+def _hash(password: str) -> str:
+    return _crypt_context().hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return _crypt_context().verify(password, hashed)
+
+
+def _warmup() -> bool:
+    _crypt_context()
+    return True
+
+
+class PasswordHasher:
+    """argon2 в отдельном пуле процессов: хеширование не держит GIL и потоки event loop.
+
+    Число одновременно отправленных в пул задач ограничено max_pending,
+    остальные ждут на семафоре; глубина очереди и времена видны в stats().
+    Семафор живёт столько же, сколько объект; сломанный пул (упал воркер)
+    пересоздаётся, и задача повторяется один раз.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(max_pending)
+        self.restarts = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _ensure(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: воркеры не наследуют потоки и соединения родителя
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info("password hasher pool started: %d workers, max pending %d", self.workers, self.max_pending)
+        return self._executor
+
+    def _replace_broken(self, executor: ProcessPoolExecutor):
+        # Несколько задач могут увидеть один и тот же сломанный пул — пересоздаём его один раз
+        if self._executor is executor:
+            logger.warning("password hasher pool is broken, restarting")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.restarts += 1
+
+    async def start(self):
+        """Поднимает воркеры заранее, чтобы первый вход не ждал запуска процессов"""
+        executor = self._ensure()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, _warmup) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        self.wait_seconds += started - queued_at
+        self.in_flight += 1
+        try:
+            for attempt in (1, 2):
+                executor = self._ensure()
+                try:
+                    result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+                    break
+                except BrokenProcessPool:
+                    self._replace_broken(executor)
+                    if attempt == 2:
+                        raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self.run_seconds += time.perf_counter() - started
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_verify, password, hashed)
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pool_restarts": self.restarts,
+            "avg_wait_ms": round(self.wait_seconds / done * 1000, 2) if done else None,
+            "avg_run_ms": round(self.run_seconds / done * 1000, 2) if done else None,
+        }
+
+
+PASSWORD_HASHER = PasswordHasher()
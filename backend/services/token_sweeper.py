@@ -0,0 +1,339 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Optional
+
+from database.db_connection import db_conn
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = float(os.getenv("TOKEN_SWEEP_INTERVAL", "3600"))
+SWEEP_CHUNK = int(os.getenv("TOKEN_SWEEP_CHUNK", "5000"))
+# Пауза между порциями — чтобы чистка не забивала IO и WAL
+SWEEP_PAUSE = float(os.getenv("TOKEN_SWEEP_PAUSE", "0.05"))
+SWEEP_MAX_CHUNKS = int(os.getenv("TOKEN_SWEEP_MAX_CHUNKS", "200"))
+# Отозванный refresh удаляем не сразу: его access-токен ещё живёт и читает
+# auth.user_accounts по session_jti, поэтому ждём дольше жизни access-токена
+REVOKED_GRACE_HOURS = float(os.getenv("TOKEN_SWEEP_REVOKED_GRACE_HOURS", "24"))
+OUTBOX_KEEP_DAYS = float(os.getenv("TOKEN_SWEEP_OUTBOX_KEEP_DAYS", "7"))
+# Сколько месячных партиций refresh_tokens держать созданными наперёд: с запасом на срок жизни refresh
+PARTITIONS_AHEAD = int(os.getenv("TOKEN_PARTITIONS_AHEAD", "0")) or int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS") or 30) // 28 + 2
+
+TRACKED_TABLES = (
+    "auth.refresh_tokens", "auth.user_accounts", "auth.password_reset_tokens",
+    "auth.account_delete_tokens", "auth.mail_outbox",
+)
+
+# Порция строк по ctid: для обычных (не секционированных) таблиц без удобного ключа
+CTID_SWEEPS = {
+    "auth.password_reset_tokens": "expires_at < NOW()",
+    "auth.account_delete_tokens": "expires_at < NOW()",
+    "auth.mail_outbox": f"status IN ('sent', 'failed') AND updated_at < NOW() - INTERVAL '{OUTBOX_KEEP_DAYS} days'",
+}
+
+
+async def table_sizes(tables=TRACKED_TABLES) -> dict:
+    """Размер таблиц и индексов (для секционированной — сумма по партициям) и число живых/мёртвых строк"""
+    out = {}
+    for table in tables:
+        try:
+            rows = await db_conn.execute_query("""
+                SELECT
+                    COALESCE(SUM(pg_relation_size(t.relid)), 0)::bigint AS table_bytes,
+                    COALESCE(SUM(pg_indexes_size(t.relid)), 0)::bigint AS index_bytes,
+                    COALESCE(SUM(pg_total_relation_size(t.relid)), 0)::bigint AS total_bytes,
+                    COALESCE(SUM(s.n_live_tup), 0)::bigint AS live_rows,
+                    COALESCE(SUM(s.n_dead_tup), 0)::bigint AS dead_rows,
+                    COUNT(*) FILTER (WHERE t.isleaf) AS partitions
+                FROM pg_partition_tree($1::regclass) t
+                LEFT JOIN pg_stat_user_tables s ON s.relid = t.relid;
+            """, params=(table,))
+        except Exception as e:
+            logger.warning("size metrics for %s unavailable: %s", table, e)
+            continue
+        out[table] = dict(rows[0]) if rows else {}
+    return out
+
+
+async def is_partitioned(table: str) -> bool:
+    rows = await db_conn.execute_query("""
+        SELECT c.relkind = 'p' AS partitioned FROM pg_class c WHERE c.oid = to_regclass($1);
+    """, params=(table,))
+    return bool(rows and rows[0]["partitioned"])
+
+
+async def _delete_chunks(query: str, params: tuple, label: str) -> int:
+    """Повторяет порционный DELETE, пока он что-то удаляет (но не больше SWEEP_MAX_CHUNKS раз)"""
+    total = 0
+    for _ in range(SWEEP_MAX_CHUNKS):
+        rows = await db_conn.execute_query(query, params=params)
+        deleted = rows[0]["n"] if rows else 0
+        total += deleted
+        if deleted < SWEEP_CHUNK:
+            break
+        await asyncio.sleep(SWEEP_PAUSE)
+    else:
+        logger.info("%s: chunk limit reached, the rest will go next run", label)
+    return total
+
+
+async def sweep_refresh_tokens() -> int:
+    """Истёкшие и давно отозванные refresh-токены вместе с их связями auth.user_accounts.
+
+    Порция выбирается по jti (FOR UPDATE SKIP LOCKED не мешает идущим рефрешам),
+    ссылки и токены удаляются одним запросом.
+    """
+    return await _delete_chunks("""
+        WITH doomed AS (
+            SELECT jti FROM auth.refresh_tokens
+            WHERE expires_at < NOW()
+               OR (revoked AND updated_at < NOW() - make_interval(secs => $2))
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ), links AS (
+            DELETE FROM auth.user_accounts ua
+            USING doomed d
+            WHERE ua.session_jti = d.jti
+        ), gone AS (
+            DELETE FROM auth.refresh_tokens t
+            USING doomed d
+            WHERE t.jti = d.jti
+            RETURNING 1
+        )
+        SELECT COUNT(*) AS n FROM gone;
+    """, (SWEEP_CHUNK, REVOKED_GRACE_HOURS * 3600), "auth.refresh_tokens")
+
+
+async def sweep_table(table: str, condition: str) -> int:
+    return await _delete_chunks(f"""
+        WITH gone AS (
+            DELETE FROM {table}
+            WHERE ctid = ANY(ARRAY(
+                SELECT ctid FROM {table}
+                WHERE {condition}
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            ))
+            RETURNING 1
+        )
+        SELECT COUNT(*) AS n FROM gone;
+    """, (SWEEP_CHUNK,), table)
+
+
+# ---------- секционирование auth.refresh_tokens по expires_at ----------
+
+def _month_start(dt: datetime, shift: int = 0) -> datetime:
+    index = dt.year * 12 + dt.month - 1 + shift
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _partition_name(start: datetime) -> str:
+    return f"auth.refresh_tokens_{start:%Y_%m}"
+
+
+def _partition_ddl(parent: str, ahead: int, until: Optional[datetime] = None) -> list:
+    """CREATE для месячных партиций от текущего месяца на ahead месяцев вперёд (и не раньше месяца until)"""
+    now = datetime.now(timezone.utc)
+    first = _month_start(now)
+    months = ahead + 1
+    if until is not None:
+        months = max(months, (until.year - first.year) * 12 + until.month - first.month + 1)
+    out = []
+    for shift in range(months):
+        start, end = _month_start(first, shift), _month_start(first, shift + 1)
+        out.append(f"""
+            CREATE TABLE IF NOT EXISTS {_partition_name(start)} PARTITION OF {parent}
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+        """)
+    return out
+
+
+async def ensure_partitions(ahead: int = PARTITIONS_AHEAD):
+    for ddl in _partition_ddl("auth.refresh_tokens", ahead):
+        await db_conn.execute_query(ddl, fetch=False)
+
+
+async def drop_expired_partitions() -> list:
+    """Партиции, у которых верхняя граница expires_at в прошлом, целиком истекли — DROP за O(1)"""
+    rows = await db_conn.execute_query("""
+        SELECT c.oid::regclass::text AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'auth.refresh_tokens'::regclass;
+    """)
+    now = datetime.now(timezone.utc)
+    dropped = []
+    for row in rows or []:
+        bound = row["bound"] or ""
+        if "TO ('" not in bound:
+            continue  # DEFAULT-партиция чистится обычным sweep
+        upper = datetime.fromisoformat(bound.split("TO ('", 1)[1].split("'", 1)[0])
+        if upper.tzinfo is None:
+            upper = upper.replace(tzinfo=timezone.utc)
+        if upper > now:
+            continue
+        name = row["name"]
+        # Связи user_accounts этих сессий тоже больше не нужны — порциями, как и остальная чистка.
+        # Партицию удаляем, только когда связей не осталось: иначе они потеряют свои токены навсегда
+        condition = f"session_jti IN (SELECT jti FROM {name})"
+        await sweep_table("auth.user_accounts", condition)
+        left = await db_conn.execute_query(f"""
+            SELECT EXISTS (SELECT 1 FROM auth.user_accounts WHERE {condition}) AS left;
+        """)
+        if left and left[0]["left"]:
+            logger.info("%s: user_accounts links remain, drop deferred to next run", name)
+            continue
+        await db_conn.execute_query(f"ALTER TABLE auth.refresh_tokens DETACH PARTITION {name};", fetch=False)
+        await db_conn.execute_query(f"DROP TABLE {name};", fetch=False)
+        dropped.append(name)
+    return dropped
+
+
+async def partition_refresh_tokens():
+    """Разовая миграция: auth.refresh_tokens -> таблица, секционированная по месяцам expires_at.
+
+    Первичный ключ становится (jti, expires_at) — ключ секционирования обязан в него входить;
+    поиск по jti с условием expires_at > NOW() отсекает истёкшие партиции при выполнении.
+    Старая таблица остаётся как auth.refresh_tokens_legacy до ручного удаления; её индексы
+    переименовываются в *_legacy, чтобы имена из setup_tables_auth достались новой таблице
+    (иначе CREATE INDEX IF NOT EXISTS молча пропускает её).
+    """
+    if await is_partitioned("auth.refresh_tokens"):
+        logger.info("auth.refresh_tokens is already partitioned")
+        return
+    latest = await db_conn.execute_query("""
+        SELECT MAX(expires_at) AS latest FROM auth.refresh_tokens;
+    """)
+    until = latest[0]["latest"] if latest and latest[0]["latest"] else None
+    partitions = "".join(_partition_ddl("auth.refresh_tokens_new", PARTITIONS_AHEAD, until))
+
+    # Без параметров — один simple query: все операторы в одной транзакции,
+    # рефреши ждут на блокировке и видят уже новую таблицу с данными
+    await db_conn.execute_query(f"""
+        BEGIN;
+        LOCK TABLE auth.refresh_tokens IN ACCESS EXCLUSIVE MODE;
+        CREATE TABLE auth.refresh_tokens_new (
+            jti UUID NOT NULL DEFAULT gen_random_uuid(),
+            user_id UUID NOT NULL,
+            role VARCHAR(20) NOT NULL CHECK (role IN ('user','business')),
+            issued_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            expires_at TIMESTAMPTZ NOT NULL,
+            revoked BOOLEAN NOT NULL DEFAULT FALSE,
+            device_name TEXT,
+            ip TEXT,
+            user_agent TEXT,
+
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+
+            PRIMARY KEY (jti, expires_at)
+        ) PARTITION BY RANGE (expires_at);
+        CREATE TABLE auth.refresh_tokens_default PARTITION OF auth.refresh_tokens_new DEFAULT;
+        {partitions}
+        INSERT INTO auth.refresh_tokens_new SELECT
+            jti, user_id, role, issued_at, expires_at, revoked, device_name, ip, user_agent, created_at, updated_at
+        FROM auth.refresh_tokens WHERE expires_at >= NOW();
+        ALTER INDEX IF EXISTS auth.idx_refresh_tokens_user_id RENAME TO idx_refresh_tokens_user_id_legacy;
+        ALTER INDEX IF EXISTS auth.idx_active_refresh_tokens RENAME TO idx_active_refresh_tokens_legacy;
+        ALTER INDEX IF EXISTS auth.idx_refresh_tokens_user_role RENAME TO idx_refresh_tokens_user_role_legacy;
+        CREATE INDEX idx_refresh_tokens_user_id ON auth.refresh_tokens_new (user_id);
+        CREATE INDEX idx_active_refresh_tokens ON auth.refresh_tokens_new (user_id) WHERE revoked = FALSE;
+        CREATE INDEX idx_refresh_tokens_user_role ON auth.refresh_tokens_new (user_id, role) WHERE revoked = FALSE;
+        CREATE TRIGGER trg_refresh_tokens_updated_at
+            BEFORE UPDATE ON auth.refresh_tokens_new
+            FOR EACH ROW
+            EXECUTE FUNCTION auth.set_timestamp();
+        ALTER TABLE auth.refresh_tokens RENAME TO refresh_tokens_legacy;
+        ALTER TABLE auth.refresh_tokens_new RENAME TO refresh_tokens;
+        COMMIT;
+    """, fetch=False)
+    logger.info("auth.refresh_tokens partitioned by expires_at; old data kept in auth.refresh_tokens_legacy")
+
+
+# ---------- запуск ----------
+
+async def sweep_once() -> dict:
+    """Один проход: партиции, порционная чистка, размеры до и после"""
+    started = time.perf_counter()
+    before = await table_sizes()
+    report = {"deleted": {}, "dropped_partitions": [], "before": before}
+
+    if await is_partitioned("auth.refresh_tokens"):
+        try:
+            await ensure_partitions()
+        except Exception as e:
+            # Например, в DEFAULT-партицию уже попали строки из диапазона новой партиции
+            logger.warning("refresh_tokens partitions not created: %s", e)
+        report["dropped_partitions"] = await drop_expired_partitions()
+    report["deleted"]["auth.refresh_tokens"] = await sweep_refresh_tokens()
+    for table, condition in CTID_SWEEPS.items():
+        try:
+            report["deleted"][table] = await sweep_table(table, condition)
+        except Exception as e:
+            logger.warning("sweep of %s failed: %s", table, e)
+
+    report["after"] = await table_sizes()
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("token sweep: deleted %s, dropped %s, %.1fs", report["deleted"], report["dropped_partitions"], report["seconds"])
+    return report
+
+
+class TokenSweeper:
+    """Периодический sweep_once в фоне; последний отчёт — в last_report"""
+
+    def __init__(self, interval: float = SWEEP_INTERVAL):
+        self.interval = interval
+        self.last_report: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="token-sweeper")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_report = await sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("token sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+TOKEN_SWEEPER = TokenSweeper()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Чистка истёкших/отозванных токенов в схеме auth")
+    parser.add_argument("--partition", action="store_true",
+                        help="перевести auth.refresh_tokens на месячные партиции по expires_at")
+    parser.add_argument("--sizes", action="store_true", help="только показать размеры таблиц")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        if args.sizes:
+            return await table_sizes()
+        if args.partition:
+            await partition_refresh_tokens()
+        return await sweep_once()
+
+    import json
+    print(json.dumps(asyncio.run(_main()), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# benchmarks/bench_niches.py
+"""
+Бенчмарк пути данных ниш: чтение выгрузки, разбор preview_image_list,
+сводка, колоночный формат и рендер страницы категории.
+
+    python -m benchmarks.synth 1000 10000 100000
+    python -m benchmarks.bench_niches --sizes 1000 10000 --save local
+    python -m benchmarks.bench_niches --sizes 1000 10000 --compare local
+
+Для каждой стадии: время (min / median по повторам), аллокации Python
+(tracemalloc: пик и остаток) и прирост пикового RSS процесса.
+
+Время и RSS зависят от машины, поэтому baseline для --compare записывается
+локально (--save local) на той же машине. Если окружение baseline
+(python, numpy, число CPU, архитектура) не совпадает с текущим, сравниваются
+только аллокации Python; время и RSS пропускаются. baselines/reference.json —
+образец формата с машины на 1 CPU, а не эталон для чужих хостов.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import statistics
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.synth import generate
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+TEMPLATES_DIR = ROOT / "frontend" / "templates"
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+MIN_TIME = 0.5
+MIN_REPEAT = 3
+MAX_REPEAT = 50
+# Порог регрессии относительно baseline (доля); RSS шумит сильнее — для него свой порог
+THRESHOLD = 0.20
+RSS_THRESHOLD = 0.35
+# Изменения меньше этих величин не считаются регрессией (шум таймера и аллокатора)
+MIN_TIME_DELTA = 0.0005
+MIN_BYTES_DELTA = 256 * 1024
+# Поля окружения, при расхождении которых время и RSS с baseline не сравниваются
+HOST_KEYS = ("python", "numpy", "cpu_count", "machine")
+
+
+# ---------- измерения ----------
+
+def _proc_status(field: str) -> Optional[int]:
+    """VmRSS / VmHWM из /proc/self/status в байтах (только Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """Сбрасывает VmHWM до текущего RSS; без этого пик RSS — на весь процесс"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _max_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(run: Callable, setup: Callable = None, min_time: float = MIN_TIME) -> dict:
+    """Прогоняет run(setup()) несколько раз: время без трассировки, затем по прогону на RSS и tracemalloc"""
+    setup = setup or (lambda: None)
+
+    times = []
+    started = time.perf_counter()
+    while len(times) < MAX_REPEAT and (len(times) < MIN_REPEAT or time.perf_counter() - started < min_time):
+        arg = setup()
+        gc.collect()
+        t0 = time.perf_counter()
+        result = run(arg)
+        times.append(time.perf_counter() - t0)
+        del result, arg
+
+    arg = setup()
+    gc.collect()
+    rss_before = _proc_status("VmRSS")
+    isolated = rss_before is not None and _reset_peak_rss()
+    base = rss_before if isolated else _max_rss()
+    result = run(arg)
+    peak = _proc_status("VmHWM") if isolated else _max_rss()
+    del result, arg
+
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = run(arg)
+    after, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result, arg
+
+    return {
+        "repeat": len(times),
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "alloc_peak_bytes": alloc_peak - before,
+        "alloc_retained_bytes": after - before,
+        "rss_peak_delta_bytes": max(0, (peak or 0) - (base or 0)),
+        "rss_isolated": isolated,
+    }
+
+
+# ---------- стадии ----------
+
+def stages(path: Path, work_dir: Path) -> Dict[str, tuple]:
+    """Стадии пути данных: имя -> (setup, run). setup готовит вход и в замер не попадает"""
+    from backend.niches.parsers import safe_parse_preview_list
+    from backend.niches.product_store import read_product_lines, build_columns
+    from backend.niches.ingest import compile_category
+    from backend.niches.colfile import read_columns, SUFFIX
+    from benchmarks.legacy import load_products_from_json, compute_summary
+    from jinja2 import Environment, FileSystemLoader
+
+    category_id = path.stem
+    lines = read_product_lines(path)
+    raw_previews = [p.get("preview_image_list") for p in lines]
+    products = load_products_from_json(path)
+    compiled_dir = work_dir / "compiled"
+    ncol = compile_category(path, compiled_dir)
+    cols = read_columns(ncol, category_id, (0, 0))
+    template = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)), autoescape=True).get_template("category.html")
+    context = {
+        "request": None,
+        "category_id": category_id,
+        "breadcrumbs": [],
+        "brands": sorted(cols.brands, key=str.lower),
+        "summary": cols.summary,
+        "category_name": cols.category_name,
+    }
+
+    return {
+        "json.load": (None, lambda _: read_product_lines(path)),
+        "safe_parse_preview_list": (None, lambda _: [safe_parse_preview_list(raw) for raw in raw_previews]),
+        "load_products_from_json": (None, lambda _: load_products_from_json(path)),
+        "compute_summary": (None, lambda _: compute_summary(products)),
+        "build_columns": (None, lambda _: build_columns(category_id, lines)),
+        "compile_ncol": (None, lambda _: compile_category(path, work_dir / "compile-bench")),
+        "read_columns": (None, lambda _: read_columns(ncol, category_id, (0, 0))),
+        "columns_summary": (None, lambda _: cols._compute_summary()),
+        "first_page_cold": (lambda: read_columns(ncol, category_id, (0, 0)), lambda c: c.page("sale_amount")),
+        "render_category_html": (None, lambda _: template.render(context)),
+    }
+
+
+def run_benchmarks(sizes: List[int], data_dir: Path, only: Optional[List[str]] = None,
+                   min_time: float = MIN_TIME) -> dict:
+    results = {}
+    for n in sizes:
+        path = data_dir / f"synth{n}.json"
+        if not path.exists():
+            print(f"generating {path} ...", file=sys.stderr)
+            generate(path, n)
+        with tempfile.TemporaryDirectory(prefix="niches-bench-") as tmp:
+            for name, (setup, run) in stages(path, Path(tmp)).items():
+                if only and name not in only:
+                    continue
+                row = measure(run, setup, min_time)
+                results[f"{name}[{n}]"] = row
+                print(_format_row(f"{name}[{n}]", row), file=sys.stderr)
+    return results
+
+
+# ---------- отчёт и baseline ----------
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+
+
+def _format_row(name: str, row: dict) -> str:
+    rss = _format_bytes(row["rss_peak_delta_bytes"]) + ("" if row["rss_isolated"] else "*")
+    return (f"{name:<36} min {row['min_s'] * 1000:10.3f}ms  median {row['median_s'] * 1000:10.3f}ms  "
+            f"alloc peak {_format_bytes(row['alloc_peak_bytes']):>9}  retained {_format_bytes(row['alloc_retained_bytes']):>9}  "
+            f"rss +{rss:>9}  (x{row['repeat']})")
+
+
+def _environment() -> dict:
+    import numpy
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def host_mismatch(baseline_env: dict, env: dict) -> List[str]:
+    """Поля HOST_KEYS, которые различаются (отсутствующие в старом baseline не учитываются)"""
+    return [key for key in HOST_KEYS if key in baseline_env and baseline_env[key] != env.get(key)]
+
+
+def save_baseline(name: str, results: dict) -> Path:
+    BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+    path = BASELINES_DIR / f"{name}.json"
+    payload = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": _environment(), "results": results}
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    return path
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD, same_host: bool = True) -> List[str]:
+    """Регрессии относительно baseline: время (min), пик аллокаций и пик RSS.
+
+    На другой машине (same_host=False) сравниваются только аллокации.
+    """
+    checks = [("alloc_peak_bytes", threshold, MIN_BYTES_DELTA, _format_bytes)]
+    if same_host:
+        checks += [
+            ("min_s", threshold, MIN_TIME_DELTA, lambda v: f"{v * 1000:.3f}ms"),
+            ("rss_peak_delta_bytes", max(threshold, RSS_THRESHOLD), MIN_BYTES_DELTA, _format_bytes),
+        ]
+    regressions = []
+    for name, row in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for field, limit, min_delta, fmt in checks:
+            before, after = old.get(field), row.get(field)
+            if not before or after is None:
+                continue
+            if after - before > min_delta and after > before * (1 + limit):
+                regressions.append(f"{name} {field}: {fmt(before)} -> {fmt(after)} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк пути данных ниш")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--data-dir", default=str(Path(__file__).resolve().parent / ".data"),
+                        help="куда класть/откуда брать синтетические выгрузки")
+    parser.add_argument("--stage", action="append", help="запустить только эти стадии")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="минимальное время замера стадии, с")
+    parser.add_argument("--save", metavar="NAME", help=f"сохранить результат как baseline ({BASELINES_DIR}/NAME.json)")
+    parser.add_argument("--compare", metavar="NAME", help="сравнить с baseline; код выхода 1 при регрессии")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--json", metavar="PATH", help="записать результаты в JSON")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, Path(args.data_dir), args.stage, args.min_time)
+    if not all(row["rss_isolated"] for row in results.values()):
+        print("* пик RSS не сбрасывается на этой платформе — значения накопительные", file=sys.stderr)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.save:
+        print(f"baseline saved: {save_baseline(args.save, results)}")
+    if args.compare:
+        baseline_path = BASELINES_DIR / f"{args.compare}.json"
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        mismatch = host_mismatch(baseline.get("environment") or {}, _environment())
+        if mismatch:
+            print(f"baseline {baseline_path.name} recorded on another host ({', '.join(mismatch)} differ): "
+                  f"comparing allocations only; re-record with --save {args.compare} on this machine", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.threshold, same_host=not mismatch)
+        if regressions:
+            print(f"regressions vs {baseline_path.name}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions vs {baseline_path.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/legacy.py
+"""
+Прежний путь данных страницы категории (список dict на товар) — база для
+сравнения с колоночным хранилищем в bench_niches.py. В приложении не используется.
+"""
+
+import json
+from pathlib import Path
+
+from backend.niches.parsers import safe_parse_preview_list
+
+
+def load_products_from_json(path: Path):
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+
+    products = []
+    try:
+        lines = data.get("products", {}).get("lines", []) or []
+    except Exception:
+        lines = []
+    for p in lines:
+        p = dict(p)
+        p['_images'] = safe_parse_preview_list(p.get("preview_image_list"))
+        products.append(p)
+
+    return products
+
+
+def compute_summary(products):
+    total_sales_qty = sum(int(p.get("sale_qty") or 0) for p in products)
+    total_revenue_amount = sum(int(p.get("sale_amount") or 0) for p in products)
+    total_products = len(products)
+
+    # Продавцы: у нас есть только merchant_count на каждую карточку.
+    # Самое простое — суммировать merchant_count (оценка, не уникальные продавцы).
+    total_sellers_est = sum(int(p.get("merchant_count") or 0) for p in products)
+    unique_brands = len({ (p.get("brand_name") or "").strip() for p in products if p.get("brand_name") })
+    return {
+        "total_sales_qty": total_sales_qty,
+        "total_revenue_amount": total_revenue_amount,
+        "total_products": total_products,
+        "total_sellers_est": total_sellers_est,
+        "unique_brands": unique_brands
+    }
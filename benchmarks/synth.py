@@ -0,0 +1,135 @@
+# benchmarks/synth.py
+
+import json
+import random
+import argparse
+from pathlib import Path
+
+# Доли форматов preview_image_list — как встречаются в выгрузках Kaspi;
+# остальное — битые строки, которые должен переваривать safe_parse_preview_list
+PREVIEW_KINDS = (
+    ("object", 0.70),        # '{"small": ..., "medium": ..., "large": ...}'
+    ("list", 0.10),          # '[{...}, {...}]'
+    ("objects", 0.06),       # '{...}, {...}' без внешних скобок
+    ("trailing", 0.04),      # '{...}, {...}]' — лишняя закрывающая скобка
+    ("quoted", 0.03),        # строка JSON в лишних кавычках
+    ("truncated", 0.03),     # обрезанная строка
+    ("empty", 0.02),
+    ("null", 0.01),
+    ("garbage", 0.01),
+)
+
+BRANDS = [
+    "Apple", "Samsung", "Xiaomi", "Huawei", "HONOR", "Realme", "POCO", "OPPO", "vivo", "Tecno",
+    "Infinix", "WHOOP", "Amazfit", "Garmin", "JBL", "Sony", "Philips", "Redmond", "Polaris", "Tefal",
+    "Bosch", "LG", "Haier", "Dyson", "Karcher", "Deerma", "Baseus", "Ugreen", "Anker", "Hoco",
+]
+KINDS = ["Смартфон", "Смарт-часы", "Фитнес-браслет", "Наушники", "Чехол", "Power bank", "Пылесос",
+         "Фен", "Утюг", "Чайник", "Колонка", "Зарядное устройство", "Кабель", "Планшет", "Роутер"]
+MODELS = ["Pro", "Max", "Lite", "Ultra", "SE", "Plus", "Mini", "Note", "Air", "Neo", "GT", "S", "X"]
+COLORS = ["черный", "белый", "серый", "синий", "зеленый", "розовый", "золотистый", "серебристый"]
+MEMORY = ["64 ГБ", "128 ГБ", "256 ГБ", "512 ГБ", "1 ТБ"]
+
+CDN = "https://resources.cdn-kaspi.kz/img/m/p"
+
+
+def _image(rng: random.Random) -> dict:
+    path = f"{CDN}/p{rng.randrange(16 ** 2):02x}/p{rng.randrange(16 ** 2):02x}/{rng.randrange(10 ** 8)}.png"
+    return {"small": f"{path}?format=preview-small", "medium": f"{path}?format=preview-medium",
+            "large": f"{path}?format=preview-large"}
+
+
+def _pick(rng: random.Random, weighted) -> str:
+    x = rng.random()
+    for value, weight in weighted:
+        x -= weight
+        if x < 0:
+            return value
+    return weighted[-1][0]
+
+
+def preview_image_list(rng: random.Random, kind: str = None):
+    kind = kind or _pick(rng, PREVIEW_KINDS)
+    images = [_image(rng) for _ in range(rng.randint(1, 4))]
+    objects = ", ".join(json.dumps(img) for img in images)
+    if kind == "object":
+        return json.dumps(images[0])
+    if kind == "list":
+        return json.dumps(images)
+    if kind == "objects":
+        return objects
+    if kind == "trailing":
+        return objects + "]"
+    if kind == "quoted":
+        return '"' + json.dumps(images) + '"'
+    if kind == "truncated":
+        s = json.dumps(images)
+        return s[:rng.randint(10, len(s) - 2)]
+    if kind == "empty":
+        return ""
+    if kind == "null":
+        return None
+    return "<img src=" + images[0]["small"] + ">"
+
+
+def product(rng: random.Random, category_id: str, category_name: str, n: int) -> dict:
+    brand = BRANDS[min(int(rng.paretovariate(1.2)) - 1, len(BRANDS) - 1)] if rng.random() > 0.03 else ""
+    name = f"{rng.choice(KINDS)} {brand} {rng.choice(MODELS)} {rng.randint(1, 20)}"
+    if rng.random() < 0.6:
+        name += f" {rng.choice(MEMORY)}"
+    name += f" {rng.choice(COLORS)}"
+    if rng.random() < 0.05:
+        name += " &#43; подписка 12 месяцев"
+    code = str(rng.randrange(10 ** 8, 10 ** 9))
+    price = int(rng.lognormvariate(10.5, 1.1)) // 10 * 10
+    qty = int(rng.paretovariate(1.1)) - 1
+    return {
+        "product_code": code,
+        "product_name": name.strip(),
+        "gen_brand_id": (BRANDS.index(brand) + 1000) if brand else None,
+        "category_ext_id": category_id,
+        "product_url": f"https://kaspi.kz/shop/p/{code}",
+        "sale_price": price,
+        "created_dt": f"2025-{rng.randint(1, 11):02d}-{rng.randint(1, 28):02d} 03:46:03.699000",
+        "preview_image_list": preview_image_list(rng),
+        "product_rate": round(rng.uniform(3.5, 5.0), 1) if rng.random() > 0.2 else None,
+        "review_qty": int(rng.paretovariate(1.0)) - 1,
+        "last_load_dt": "2025-11-25 03:24:26.361917",
+        "merchant_count": rng.randint(1, 60),
+        "sale_qty": qty,
+        "sale_amount": qty * price,
+        "last_sale_date": f"2025-11-{rng.randint(1, 25):02d}" if qty else None,
+        "brand_name": brand or None,
+        "show_order_num": rng.randint(1, n),
+        "category_name": category_name,
+        "restrict_type": 0,
+        "amount_prc": rng.random(),
+        "amount_abc": rng.choice((1, 1, 2, 2, 2, 3, 3, 3, 3)),
+    }
+
+
+def generate(path: Path, n: int, category_id: str = None, seed: int = 0) -> Path:
+    """Файл категории на n товаров в формате выгрузки: {"products": {"lines": [...]}}"""
+    path = Path(path)
+    category_id = category_id or path.stem
+    rng = random.Random(f"{seed}:{category_id}:{n}")
+    lines = [product(rng, category_id, f"Синтетика {n}", n) for _ in range(n)]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"products": {"lines": lines}}, f, ensure_ascii=False, indent=4)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетические выгрузки категорий для бенчмарков")
+    parser.add_argument("sizes", nargs="+", type=int, help="число товаров, например 1000 10000 100000")
+    parser.add_argument("--out", default="benchmarks/.data")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    for n in args.sizes:
+        path = generate(Path(args.out) / f"synth{n}.json", n, seed=args.seed)
+        print(f"{path}: {n} products, {path.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
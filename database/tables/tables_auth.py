@@ -48,6 +48,10 @@ async def setup_tables_auth(db_conn):
     await db_conn.execute_query("""
         DROP TRIGGER IF EXISTS trg_refresh_tokens_updated_at ON auth.refresh_tokens;
     """)
+    # Триггер, созданный ранними версиями partition_refresh_tokens под другим именем
+    await db_conn.execute_query("""
+        DROP TRIGGER IF EXISTS trg_refresh_tokens_p_updated_at ON auth.refresh_tokens;
+    """)
     await db_conn.execute_query("""
         CREATE TRIGGER trg_refresh_tokens_updated_at
         BEFORE UPDATE ON auth.refresh_tokens
@@ -133,6 +137,42 @@ async def setup_tables_auth(db_conn):
         EXECUTE FUNCTION auth.set_timestamp();
     """)
 
+    # Очередь писем (восстановление пароля и т.п.): запрос только пишет строку,
+    # отправляет фоновый MailOutboxSender
+    await db_conn.execute_query("""
+        CREATE TABLE IF NOT EXISTS auth.mail_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL DEFAULT 'generic',
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body_text TEXT,
+            body_html TEXT,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','sending','sent','failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            locked_until TIMESTAMPTZ,
+            last_error TEXT,
+            sent_at TIMESTAMPTZ,
+
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+    await db_conn.execute_query("""
+        CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON auth.mail_outbox (next_attempt_at)
+        WHERE status IN ('pending', 'sending');
+    """)
+    # Триггер для mail_outbox
+    await db_conn.execute_query("""
+        DROP TRIGGER IF EXISTS trg_mail_outbox_updated_at ON auth.mail_outbox;
+    """)
+    await db_conn.execute_query("""
+        CREATE TRIGGER trg_mail_outbox_updated_at
+        BEFORE UPDATE ON auth.mail_outbox
+        FOR EACH ROW
+        EXECUTE FUNCTION auth.set_timestamp();
+    """)
+
     # Gmail
     await db_conn.execute_query("""
         CREATE TABLE IF NOT EXISTS auth.oauth_accounts (
@@ -0,0 +1,151 @@
+// Lazy-loading товаров категории страницами из /api/category/{id}/products
+document.addEventListener("DOMContentLoaded", () => {
+  const grid = document.getElementById("products-grid");
+  const sentinel = document.getElementById("products-sentinel");
+  const totalEl = document.getElementById("products-total");
+  if (!grid || !sentinel) return;
+
+  const categoryId = grid.dataset.categoryId;
+  const PAGE_SIZE = 24;
+  const controls = {
+    sort: document.getElementById("sort"),
+    order: document.getElementById("order"),
+    priceMin: document.getElementById("price-min"),
+    priceMax: document.getElementById("price-max"),
+    brand: document.getElementById("brand"),
+    abc: document.getElementById("abc"),
+    minReviews: document.getElementById("min-reviews"),
+  };
+
+  let cursor = null;
+  let done = false;
+  let loading = false;
+  let generation = 0; // защищает от ответов на устаревшие фильтры
+
+  const fmt = (n) => Number(n || 0).toLocaleString("en-US");
+
+  function buildQuery() {
+    const q = new URLSearchParams({
+      sort: controls.sort.value,
+      order: controls.order.value,
+      limit: PAGE_SIZE,
+    });
+    if (controls.priceMin.value) q.set("price_min", controls.priceMin.value);
+    if (controls.priceMax.value) q.set("price_max", controls.priceMax.value);
+    if (controls.brand.value) q.set("brand", controls.brand.value);
+    if (controls.abc.value) q.set("abc", controls.abc.value);
+    if (controls.minReviews.value) q.set("min_reviews", controls.minReviews.value);
+    if (cursor) q.set("cursor", cursor);
+    return q;
+  }
+
+  function renderCard(p) {
+    const card = document.createElement("article");
+    card.className = "card";
+
+    const img = (p.images || [])[0];
+    const src = img && (img.small || img.medium || img.large);
+    if (src) {
+      const el = document.createElement("img");
+      el.src = src;
+      el.alt = p.product_name || "";
+      el.loading = "lazy";
+      card.appendChild(el);
+    } else {
+      const ph = document.createElement("div");
+      ph.className = "no-image";
+      ph.textContent = "Нет изображения";
+      card.appendChild(ph);
+    }
+
+    const body = document.createElement("div");
+    body.className = "card-body";
+
+    const title = document.createElement("div");
+    title.className = "title";
+    title.textContent = p.product_name || "";
+
+    const price = document.createElement("div");
+    price.className = "price";
+    price.textContent = `${fmt(p.sale_price)} ₸`;
+
+    const sku = document.createElement("div");
+    sku.className = "sku";
+    sku.textContent = `Артикул: ${p.product_code}`;
+
+    const linkWrap = document.createElement("div");
+    linkWrap.style.marginTop = "auto";
+    const link = document.createElement("a");
+    link.className = "btn-link";
+    link.href = p.product_url;
+    link.target = "_blank";
+    link.rel = "noopener";
+    link.textContent = "Открыть на Kaspi";
+    linkWrap.appendChild(link);
+
+    body.append(title, price, sku, linkWrap);
+    card.appendChild(body);
+    return card;
+  }
+
+  async function loadPage() {
+    if (loading || done) return;
+    loading = true;
+    const gen = generation;
+    let restart = false;
+    sentinel.textContent = "Загрузка…";
+    try {
+      const resp = await fetch(`/api/category/${encodeURIComponent(categoryId)}/products?${buildQuery()}`);
+      if (resp.status === 409) {
+        // категория обновилась на сервере — начинаем листание заново, когда этот запрос завершится
+        restart = true;
+        return;
+      }
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const data = await resp.json();
+      if (gen !== generation) return;
+
+      const frag = document.createDocumentFragment();
+      data.items.forEach(p => frag.appendChild(renderCard(p)));
+      grid.appendChild(frag);
+      if (totalEl) totalEl.textContent = data.total;
+
+      cursor = data.next_cursor;
+      done = !cursor;
+      sentinel.textContent = done ? (grid.children.length ? "" : "Ничего не найдено") : "";
+    } catch (err) {
+      console.error("products page load failed", err);
+      if (gen === generation) sentinel.textContent = "Не удалось загрузить товары";
+    } finally {
+      // флаг принадлежит текущему поколению: устаревший запрос не сбрасывает его под новым
+      if (gen === generation) {
+        if (restart) {
+          // loading остаётся true до reset(), чтобы observer не дозапросил страницу по старому курсору
+          setTimeout(() => { if (gen === generation) reset(); }, 0);
+        } else {
+          loading = false;
+        }
+      }
+    }
+  }
+
+  function reset() {
+    generation += 1;
+    cursor = null;
+    done = false;
+    loading = false;
+    grid.innerHTML = "";
+    loadPage();
+  }
+
+  Object.values(controls).forEach(el => {
+    if (el) el.addEventListener("change", reset);
+  });
+
+  const observer = new IntersectionObserver((entries) => {
+    if (entries.some(e => e.isIntersecting)) loadPage();
+  }, { rootMargin: "600px" });
+  observer.observe(sentinel);
+
+  loadPage();
+});
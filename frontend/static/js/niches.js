@@ -1,33 +1,117 @@
-
-// Mobile-first accordion behaviour for categories/subcategories
+// Mobile-first accordion behaviour for categories/subcategories.
+// Подкатегории подгружаются при раскрытии (/api/categories/{id}/subtree),
+// поиск подсказывает категории и товары с сервера (/api/suggest).
 document.addEventListener("DOMContentLoaded", () => {
   const root = document.getElementById("categories-root");
   const searchInput = document.getElementById("category-search");
+  const suggestList = document.getElementById("suggest-list");
   const periodBtn = document.getElementById("period-btn");
 
+  const fmt = (n) => Number(n || 0).toLocaleString("en-US");
+  const categoryUrl = (id) => `/category/${encodeURIComponent(id)}`;
+
+  function el(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function leafLink(item, className) {
+    const a = el("a", className, className === "goto" ? "›" : item.category_name);
+    a.href = categoryUrl(item.category_id);
+    if (className === "goto") a.setAttribute("aria-label", `Перейти в ${item.category_name}`);
+    return a;
+  }
+
+  // Разметка подкатегорий — та же, что раньше рендерил шаблон
+  function renderSublist(sublist, items) {
+    const frag = document.createDocumentFragment();
+    if (!items.length) {
+      frag.appendChild(el("div", "no-sub", "Подкатегорий нет"));
+    }
+    items.forEach(sub => {
+      const children = sub.items || [];
+      const row = el("div", "subitem");
+      row.dataset.id = sub.category_id;
+
+      const left = el("div", "sub-left");
+      const right = el("div", "sub-right");
+      right.appendChild(el("div", "sub-stats", fmt(sub.sale_qty)));
+      if (children.length) {
+        const btn = el("button", "sub-toggle", "▸");
+        btn.dataset.id = sub.category_id;
+        btn.setAttribute("aria-expanded", "false");
+        btn.title = "Показать узкие категории";
+        left.appendChild(btn);
+        left.appendChild(el("div", "sub-name", sub.category_name));
+        right.appendChild(el("span", "goto", "›"));
+      } else {
+        left.appendChild(leafLink(sub, "leaf-link"));
+        right.appendChild(leafLink(sub, "goto"));
+      }
+      row.appendChild(left);
+      row.appendChild(right);
+      frag.appendChild(row);
+
+      if (children.length) {
+        const inner = el("div", "sublist inner");
+        inner.dataset.parent = sub.category_id;
+        children.forEach(leaf => {
+          const leafRow = el("div", "subitem leaf");
+          leafRow.dataset.id = leaf.category_id;
+          leafRow.appendChild(leafLink(leaf, "leaf-link"));
+          const leafRight = el("div", "sub-right");
+          leafRight.appendChild(el("div", "sub-stats", fmt(leaf.sale_qty)));
+          leafRight.appendChild(leafLink(leaf, "goto"));
+          leafRow.appendChild(leafRight);
+          inner.appendChild(leafRow);
+        });
+        frag.appendChild(inner);
+      }
+    });
+    sublist.replaceChildren(frag);
+  }
+
+  async function ensureLoaded(sublist) {
+    if (sublist.dataset.loaded !== "false") return;
+    sublist.dataset.loaded = "loading";
+    sublist.replaceChildren(el("div", "loading", "Загрузка…"));
+    try {
+      const res = await fetch(`/api/categories/${encodeURIComponent(sublist.dataset.parent)}/subtree?depth=2`);
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const data = await res.json();
+      renderSublist(sublist, (data.data && data.data.items) || []);
+      sublist.dataset.loaded = "true";
+    } catch (err) {
+      sublist.dataset.loaded = "false";
+      sublist.replaceChildren(el("div", "no-sub", "Не удалось загрузить подкатегории"));
+    }
+  }
+
+  function setCardOpen(card, open) {
+    const sublist = card.querySelector(".sublist");
+    const toggle = card.querySelector(".toggle");
+    if (!sublist) return;
+    sublist.classList.toggle("active", open);
+    card.classList.toggle("open", open);
+    if (toggle) toggle.setAttribute("aria-expanded", open ? "true" : "false");
+    if (open) ensureLoaded(sublist);
+  }
+
   // Toggle main category sublist
   root.addEventListener("click", (e) => {
     const toggle = e.target.closest(".toggle");
     if (toggle) {
-      const id = toggle.dataset.id;
-      const card = root.querySelector(`.cat-card[data-id="${id}"]`);
-      const sublist = card && card.querySelector(`.sublist[data-parent="${id}"]`);
-      if (!sublist) return;
-
-      const isActive = sublist.classList.toggle("active");
-      card.classList.toggle("open", isActive);
-      toggle.setAttribute("aria-expanded", isActive ? "true" : "false");
-      // chevron character
-      const chev = toggle.querySelector(".chev");
-      if (chev) chev.textContent = isActive ? "▾" : "▸";
+      const card = root.querySelector(`.cat-card[data-id="${toggle.dataset.id}"]`);
+      if (card) setCardOpen(card, !card.classList.contains("open"));
       return;
     }
 
     // Toggle inner (sub) group
     const subToggle = e.target.closest(".sub-toggle");
     if (subToggle) {
-      const id = subToggle.dataset.id;
-      const inner = root.querySelector(`.sublist.inner[data-parent="${id}"]`);
+      const inner = root.querySelector(`.sublist.inner[data-parent="${subToggle.dataset.id}"]`);
       if (!inner) return;
       const isShown = inner.classList.toggle("active");
       subToggle.setAttribute("aria-expanded", isShown ? "true" : "false");
@@ -38,7 +122,6 @@ document.addEventListener("DOMContentLoaded", () => {
     // If click on subitem row (not a link/button) — toggle its sublist if present
     const subItem = e.target.closest(".subitem");
     if (subItem && !subItem.classList.contains("leaf")) {
-      // ignore clicks on anchor links
       if (e.target.closest("a")) return;
       const subToggleBtn = subItem.querySelector(".sub-toggle");
       if (subToggleBtn) subToggleBtn.click();
@@ -54,11 +137,76 @@ document.addEventListener("DOMContentLoaded", () => {
     btn.click();
   });
 
-  // Simple search: фильтрация по названию категории/подкатегории
+  // ---- Поиск: фильтр верхнего уровня + подсказки с сервера ----
+  let suggestTimer = null;
+  let suggestSeq = 0;
+
+  function filterTopLevel(query) {
+    root.querySelectorAll(".cat-card").forEach(card => {
+      const name = (card.querySelector(".cat-name")?.textContent || "").toLowerCase();
+      card.style.display = !query || name.includes(query) ? "" : "none";
+    });
+  }
+
+  function hideSuggest() {
+    if (!suggestList) return;
+    suggestList.hidden = true;
+    suggestList.replaceChildren();
+  }
+
+  function renderSuggest(items) {
+    if (!suggestList) return;
+    if (!items.length) return hideSuggest();
+    const frag = document.createDocumentFragment();
+    items.forEach(item => {
+      const li = el("li");
+      li.setAttribute("role", "option");
+      const a = el("a");
+      if (item.type === "category") {
+        a.href = categoryUrl(item.id);
+        a.appendChild(el("span", "", item.name));
+        const path = (item.breadcrumbs || []).join(" / ");
+        a.appendChild(el("span", "hint", path || "категория"));
+      } else {
+        a.href = categoryUrl(item.category_id);
+        a.appendChild(el("span", "", item.name));
+        a.appendChild(el("span", "hint", `${fmt(item.sale_amount)} ₸`));
+      }
+      li.appendChild(a);
+      frag.appendChild(li);
+    });
+    suggestList.replaceChildren(frag);
+    suggestList.hidden = false;
+  }
+
+  async function loadSuggest(query) {
+    const seq = ++suggestSeq;
+    try {
+      const res = await fetch(`/api/suggest?${new URLSearchParams({ q: query, limit: 10 })}`);
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const data = await res.json();
+      if (seq === suggestSeq) renderSuggest(data.data || []);
+    } catch (err) {
+      if (seq === suggestSeq) hideSuggest();
+    }
+  }
+
   if (searchInput) {
     searchInput.addEventListener("input", (e) => {
       const q = (e.target.value || "").trim().toLowerCase();
-      filterCategories(q);
+      filterTopLevel(q);
+      clearTimeout(suggestTimer);
+      if (!q) {
+        suggestSeq++;
+        return hideSuggest();
+      }
+      suggestTimer = setTimeout(() => loadSuggest(q), 120);
+    });
+    searchInput.addEventListener("keydown", (e) => {
+      if (e.key === "Escape") hideSuggest();
+    });
+    document.addEventListener("click", (e) => {
+      if (!e.target.closest(".search")) hideSuggest();
     });
   }
 
@@ -72,46 +220,4 @@ document.addEventListener("DOMContentLoaded", () => {
       if (txt) txt.textContent = pressed ? "Последние 30 дней" : "Последние 30 дней"; // placeholder
     });
   }
-
-  // Filtering function: показывает карточки, где есть совпадение в имени (категории / подкатегории / листы)
-  function filterCategories(query) {
-    const cards = root.querySelectorAll(".cat-card");
-    cards.forEach(card => {
-      let showCard = false;
-      // check main category name
-      const name = (card.querySelector(".cat-name")?.textContent || "").toLowerCase();
-      if (name.includes(query)) showCard = true;
-
-      // check subitems
-      const subNames = Array.from(card.querySelectorAll(".sub-name, .leaf-link")).map(n => (n.textContent || "").toLowerCase());
-      if (!showCard && subNames.some(n => n.includes(query))) showCard = true;
-
-      // toggle visibility
-      card.style.display = query ? (showCard ? "" : "none") : "";
-      // if search matches subitems only — expand main so user sees matches
-      const sublist = card.querySelector(".sublist");
-      if (sublist) {
-        if (query && showCard && !name.includes(query)) {
-          sublist.classList.add("active");
-          card.classList.add("open");
-          const toggle = card.querySelector(".toggle");
-          if (toggle) {
-            toggle.setAttribute("aria-expanded", "true");
-            const chev = toggle.querySelector(".chev");
-            if (chev) chev.textContent = "▾";
-          }
-        } else if (!query) {
-          sublist.classList.remove("active");
-          card.classList.remove("open");
-          const toggle = card.querySelector(".toggle");
-          if (toggle) {
-            toggle.setAttribute("aria-expanded", "false");
-            const chev = toggle.querySelector(".chev");
-            if (chev) chev.textContent = "▸";
-          }
-        }
-      }
-    });
-  }
-
 });
@@ -0,0 +1,125 @@
+# tests/test_collector.py
+#
+# Сборщик против локального «источника» на http.server: дерево, пагинация товаров,
+# условные запросы (ETag/304) и checkpoint.
+
+import json
+import asyncio
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.niches.collector import Collector
+
+TREE = {
+    None: [
+        {"category_id": "phones", "category_name": "Телефоны", "is_has_subcategory": True},
+        {"category_id": "../escape", "category_name": "Битый id", "is_has_subcategory": False},
+    ],
+    "phones": [
+        {"category_id": "smartphones", "category_name": "Смартфоны", "is_has_subcategory": False},
+        {"category_id": "watches", "category_name": "Смарт-часы", "is_has_subcategory": False},
+    ],
+}
+PRODUCTS = {
+    "smartphones": [{"product_code": f"s{i}", "product_name": f"Смартфон {i}"} for i in range(5)],
+    "watches": [{"product_code": "w0", "product_name": "Часы"}],
+    "../escape": [{"product_code": "x", "product_name": "x"}],
+}
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests.append((url.path, query))
+        if url.path == "/categories":
+            parent = query.get("parent_id")
+            body, etag = {"success": True, "data": TREE.get(parent, [])}, f'"tree-{parent}"'
+        elif url.path == "/products":
+            lines = PRODUCTS.get(query["category_id"], [])
+            page, limit = int(query["page"]), int(query["limit"])
+            body = {"products": {"lines": lines[(page - 1) * limit:page * limit]}}
+            etag = f'"{query["category_id"]}-{len(lines)}"' if page == 1 else None
+        else:
+            self.send_error(404)
+            return
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    _Upstream.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _collect(base_url: str, root: Path) -> dict:
+    async def _run():
+        collector = Collector(
+            base_url, rps=0, page_size=2, concurrency=4,
+            products_dir=root / "products", tree_path=root / "algatop_niche.json",
+            categories_path_out=root / "categories.json", checkpoint=root / "checkpoint.json",
+        )
+        try:
+            return await collector.collect()
+        finally:
+            await collector.aclose()
+
+    return asyncio.run(_run())
+
+
+def test_collect_writes_tree_and_products(upstream, tmp_path):
+    report = _collect(upstream, tmp_path)
+
+    assert report["failed_ids"] == []
+    assert report["changed"] == 2
+    assert sorted(p.name for p in (tmp_path / "products").iterdir()) == ["smartphones.json", "watches.json"]
+    assert not (tmp_path / "escape.json").exists()
+
+    lines = json.loads((tmp_path / "products" / "smartphones.json").read_text())["products"]["lines"]
+    assert [line["product_code"] for line in lines] == [f"s{i}" for i in range(5)]
+
+    categories = json.loads((tmp_path / "categories.json").read_text())["data"]
+    assert [c["category_id"] for c in categories[0]["items"]] == ["smartphones", "watches"]
+    tree = json.loads((tmp_path / "algatop_niche.json").read_text())
+    assert tree["data"][0]["items"]["data"][1]["category_id"] == "watches"
+
+
+def test_second_run_uses_validators(upstream, tmp_path):
+    _collect(upstream, tmp_path)
+    _Upstream.requests = []
+    report = _collect(upstream, tmp_path)
+
+    assert report["changed"] == 0
+    assert report["not_modified"] == 4  # два запроса дерева + первая страница каждой категории
+    assert [q.get("page") for path, q in _Upstream.requests if path == "/products"] == ["1", "1"]
+
+    # Кэш ответов дерева хранит только собственный уровень, без поддеревьев детей
+    checkpoint = json.loads((tmp_path / "checkpoint.json").read_text())
+    for body in checkpoint["responses"].values():
+        assert all("items" not in node for node in body["data"])
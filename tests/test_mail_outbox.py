@@ -0,0 +1,122 @@
+# tests/test_mail_outbox.py
+#
+# Отправитель outbox против локального SMTP-«сервера» на socketserver:
+# переиспользование соединения, переподключение после обрыва и постоянные (5xx) ошибки.
+
+import smtplib
+import threading
+import socketserver
+
+import pytest
+
+from backend.services.mail_outbox import MailOutboxSender, SmtpConnection, is_permanent
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        self._reply("220 stand-in ESMTP")
+        sent_here = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-stand-in")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 stand-in")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip("<> ")
+                code = server.rcpt_codes.get(address, 250)
+                self._reply(f"{code} {'ok' if code == 250 else 'rejected'}")
+            elif verb == "DATA":
+                self._reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                server.messages += 1
+                sent_here += 1
+                self._reply("250 queued")
+                if server.disconnect_after and sent_here >= server.disconnect_after:
+                    return  # сервер рвёт соединение после N писем
+            elif verb == "QUIT":
+                self._reply("221 bye")
+                return
+            else:  # MAIL, RSET, NOOP
+                self._reply("250 ok")
+
+
+class _SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.messages = 0
+        self.disconnect_after = 0
+        self.rcpt_codes = {}
+
+
+@pytest.fixture
+def smtp_server():
+    server = _SmtpServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sender(smtp_server):
+    host, port = smtp_server.server_address
+    connection = SmtpConnection(host, port, username=None, password=None, starttls=False)
+    sender = MailOutboxSender(connection=connection)
+    yield sender
+    connection.close()
+    sender._executor.shutdown(wait=False)
+
+
+def _jobs(*recipients):
+    return [{"id": i, "recipient": r, "subject": "Тест", "body_text": "text", "body_html": None}
+            for i, r in enumerate(recipients)]
+
+
+def test_batch_reuses_one_connection(smtp_server, sender):
+    results = sender._send_batch(_jobs("a@example.com", "b@example.com", "c@example.com"))
+
+    assert [error for _, error in results] == [None, None, None]
+    assert smtp_server.messages == 3
+    assert sender.connection.connects == 1
+
+
+def test_reconnects_after_server_disconnect(smtp_server, sender):
+    smtp_server.disconnect_after = 1
+    results = sender._send_batch(_jobs("a@example.com", "b@example.com"))
+
+    assert [error for _, error in results] == [None, None]
+    assert smtp_server.messages == 2
+    assert sender.connection.connects == 2
+
+
+def test_permanent_rejection_keeps_connection(smtp_server, sender):
+    smtp_server.rcpt_codes = {"gone@example.com": 550, "busy@example.com": 451}
+    results = sender._send_batch(_jobs("gone@example.com", "busy@example.com", "ok@example.com"))
+    errors = [error for _, error in results]
+
+    assert isinstance(errors[0], smtplib.SMTPRecipientsRefused) and is_permanent(errors[0])
+    assert isinstance(errors[1], smtplib.SMTPRecipientsRefused) and not is_permanent(errors[1])
+    assert errors[2] is None
+    assert smtp_server.messages == 1
+    assert sender.connection.connects == 1
+
+
+def test_is_permanent_by_smtp_code():
+    assert is_permanent(smtplib.SMTPDataError(554, b"rejected"))
+    assert not is_permanent(smtplib.SMTPDataError(421, b"try later"))
+    assert not is_permanent(smtplib.SMTPServerDisconnected("closed"))
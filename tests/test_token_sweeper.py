@@ -0,0 +1,105 @@
+# tests/test_token_sweeper.py
+#
+# Расчёт месячных партиций refresh_tokens и порционная чистка — без PostgreSQL:
+# db_conn подменяется записывающей заглушкой с заранее заданными ответами.
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.services import token_sweeper as ts
+
+
+class _FakeDb:
+    def __init__(self, answer):
+        self.answer = answer
+        self.queries = []
+
+    async def execute_query(self, query, params=None, fetch=True):
+        self.queries.append(" ".join(query.split()))
+        return self.answer(self.queries[-1])
+
+
+@pytest.fixture
+def fast_sweep(monkeypatch):
+    monkeypatch.setattr(ts, "SWEEP_CHUNK", 10)
+    monkeypatch.setattr(ts, "SWEEP_PAUSE", 0)
+    monkeypatch.setattr(ts, "SWEEP_MAX_CHUNKS", 3)
+
+
+def _use_db(monkeypatch, answer) -> _FakeDb:
+    db = _FakeDb(answer)
+    monkeypatch.setattr(ts, "db_conn", db)
+    return db
+
+
+def test_month_start_crosses_year():
+    dec = datetime(2025, 12, 17, 13, 5, tzinfo=timezone.utc)
+    assert ts._month_start(dec) == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert ts._month_start(dec, 1) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert ts._month_start(dec, -12) == datetime(2024, 12, 1, tzinfo=timezone.utc)
+
+
+def test_partition_name():
+    assert ts._partition_name(datetime(2026, 3, 1, tzinfo=timezone.utc)) == "auth.refresh_tokens_2026_03"
+
+
+def test_partition_ddl_covers_contiguous_months():
+    ddl = ts._partition_ddl("auth.refresh_tokens", ahead=2)
+    assert len(ddl) == 3
+    bounds = [stmt.split("FROM ('", 1)[1].split("')", 1)[0] for stmt in ddl]
+    uppers = [stmt.split("TO ('", 1)[1].split("')", 1)[0] for stmt in ddl]
+    assert bounds[1:] == uppers[:-1]
+    first = ts._month_start(datetime.now(timezone.utc))
+    assert bounds[0] == first.isoformat()
+    assert f"{ts._partition_name(first)} PARTITION OF auth.refresh_tokens" in ddl[0]
+
+
+def test_partition_ddl_extends_to_latest_expiry():
+    first = ts._month_start(datetime.now(timezone.utc))
+    until = ts._month_start(first, 5).replace(day=20)
+    ddl = ts._partition_ddl("auth.refresh_tokens", ahead=1, until=until)
+    assert len(ddl) == 6
+    assert ts._partition_name(ts._month_start(first, 5)) in ddl[-1]
+
+
+def test_delete_chunks_stops_on_short_chunk(monkeypatch, fast_sweep):
+    answers = iter([10, 10, 4, 10])
+    db = _use_db(monkeypatch, lambda q: [{"n": next(answers)}])
+    assert asyncio.run(ts._delete_chunks("DELETE", (), "t")) == 24
+    assert len(db.queries) == 3
+
+
+def test_delete_chunks_stops_at_chunk_limit(monkeypatch, fast_sweep):
+    db = _use_db(monkeypatch, lambda q: [{"n": 10}])
+    assert asyncio.run(ts._delete_chunks("DELETE", (), "t")) == 30
+    assert len(db.queries) == 3
+
+
+def _partitions_db(monkeypatch, links_left: bool) -> _FakeDb:
+    def answer(q):
+        if "FROM pg_inherits" in q:
+            return [
+                {"name": "auth.refresh_tokens_2020_01", "bound": "FOR VALUES FROM ('2020-01-01 00:00:00+00') TO ('2020-02-01 00:00:00+00')"},
+                {"name": "auth.refresh_tokens_2999_01", "bound": "FOR VALUES FROM ('2999-01-01 00:00:00+00') TO ('2999-02-01 00:00:00+00')"},
+                {"name": "auth.refresh_tokens_default", "bound": "DEFAULT"},
+            ]
+        if "SELECT EXISTS" in q:
+            return [{"left": links_left}]
+        if "WITH gone" in q:
+            return [{"n": 0}]
+        return None
+    return _use_db(monkeypatch, answer)
+
+
+def test_drop_expired_partition(monkeypatch, fast_sweep):
+    db = _partitions_db(monkeypatch, links_left=False)
+    assert asyncio.run(ts.drop_expired_partitions()) == ["auth.refresh_tokens_2020_01"]
+    assert any(q.startswith("DROP TABLE auth.refresh_tokens_2020_01") for q in db.queries)
+
+
+def test_drop_deferred_while_links_remain(monkeypatch, fast_sweep):
+    db = _partitions_db(monkeypatch, links_left=True)
+    assert asyncio.run(ts.drop_expired_partitions()) == []
+    assert not any("DETACH" in q or q.startswith("DROP TABLE") for q in db.queries)